@@ -3,17 +3,19 @@ import streamlit as st
 import json
 import os
 
-from src.scorer import compute_all_scores
-from src.recommender import generate_recommendations
-from src.user_profiler import build_user_profiles
+from src.cache import RecommendationCache
+from src.catalog import catalog_song_metadata, load_catalog, read_manifest
+from src.scorer import build_song_display, build_song_features
+from src.recommender import recommend_for_liked
+from src.search import SongSearchIndex
 
 # ----------------------------
 # 配置路径
 # ----------------------------
-INPUT_DIR = "input"
 OUTPUT_DIR = "output"
 ALL_SONGS_PATH = os.path.join(OUTPUT_DIR, "all_songs.json")
 METADATA_PATH = os.path.join(OUTPUT_DIR, "song_metadata.json")
+CATALOG_DIR = os.path.join(OUTPUT_DIR, "catalog")
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -26,24 +28,44 @@ st.title("🎵 Content-Based Music Recommendation System")
 # ----------------------------
 # 加载数据：metadata（用于计算） + all_songs（用于展示和搜索）
 # ----------------------------
-@st.cache_resource
-def load_data_for_ui():
-    # 检查文件是否存在
-    if not os.path.exists(ALL_SONGS_PATH):
-        st.error(f"❌ 找不到 {ALL_SONGS_PATH}，请先运行 `python run_pipeline.py`")
-        st.stop()
-    if not os.path.exists(METADATA_PATH):
-        st.error(f"❌ 找不到 {METADATA_PATH}，请先运行 `python run_pipeline.py`")
-        st.stop()
-
-    # 加载 metadata（用于推荐计算）
-    with open(METADATA_PATH, "r", encoding="utf-8") as f:
-        song_meta = json.load(f)
-
-    # 从 all_songs.json 构建 id -> (name, artist) 的映射
-    with open(ALL_SONGS_PATH, "r", encoding="utf-8") as f:
-        all_songs = json.load(f)
-
+def current_catalog_version():
+    """特征库 manifest 中的内容哈希；特征库不存在时返回 None。"""
+    try:
+        return read_manifest(CATALOG_DIR)["content_hash"]
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@st.cache_resource(max_entries=1)
+def load_data_for_ui(catalog_version):
+    # catalog_version 作为缓存键：特征库重新编译后自动重新加载
+    # 优先使用编译好的二进制特征库（run_pipeline.py / convert_catalog.py 生成）：
+    # 各列内存映射打开，多个 Streamlit 进程共享同一份页缓存，无需解析 JSON
+    if catalog_version is not None:
+        song_features = load_catalog(CATALOG_DIR)
+        song_meta = catalog_song_metadata(song_features)
+        all_songs = [
+            {"id": sid, "name": name, "artist": artist}
+            for sid, name, artist in zip(song_features["song_ids"], song_features["names"],
+                                         song_features["display_artists"])
+        ]
+    else:
+        # 检查文件是否存在
+        if not os.path.exists(ALL_SONGS_PATH):
+            st.error(f"❌ 找不到 {ALL_SONGS_PATH}，请先运行 `python run_pipeline.py`")
+            st.stop()
+        if not os.path.exists(METADATA_PATH):
+            st.error(f"❌ 找不到 {METADATA_PATH}，请先运行 `python run_pipeline.py`")
+            st.stop()
+
+        # 加载 metadata 与 all_songs，现场构建特征（推荐结果直接带上歌名 / 艺人）
+        with open(METADATA_PATH, "r", encoding="utf-8") as f:
+            song_meta = json.load(f)
+        with open(ALL_SONGS_PATH, "r", encoding="utf-8") as f:
+            all_songs = json.load(f)
+        song_features = build_song_features(song_meta, build_song_display(all_songs))
+
+    # 构建 id -> (name, artist) 的映射
     id_to_info = {}
     for song in all_songs:
         sid = str(song.get("id"))
@@ -54,51 +76,32 @@ def load_data_for_ui():
         if name and sid not in id_to_info:
             id_to_info[sid] = {"name": name, "artist": artist}
 
-    # 构建歌名索引（用于搜索）
-    name_to_songs = {}
-    for sid, info in id_to_info.items():
-        key = info["name"].lower()
-        if key not in name_to_songs:
-            name_to_songs[key] = []
-        name_to_songs[key].append({
-            "id": sid,
-            "name": info["name"],
-            "artist": info["artist"]
-        })
+    # 构建搜索索引（歌名 + 艺人的字符 n-gram 倒排表，随数据一起缓存）
+    search_index = SongSearchIndex(
+        {"id": sid, "name": info["name"], "artist": info["artist"]}
+        for sid, info in id_to_info.items()
+    )
 
-    return song_meta, id_to_info, name_to_songs
+    return song_meta, song_features, id_to_info, search_index
 
-song_meta, id_to_info, name_to_songs = load_data_for_ui()
+@st.cache_resource
+def get_recommendation_cache():
+    # 进程级共享：所有会话命中同一份缓存；键中包含特征库版本，版本变化时自动清空
+    return RecommendationCache(maxsize=1024, ttl=3600)
+
+song_meta, song_features, id_to_info, search_index = load_data_for_ui(current_catalog_version())
 
 # ----------------------------
 # 搜索函数
 # ----------------------------
 def search_songs(query: str):
-    query = query.lower().strip()
-    if not query:
-        return []
-    matches = []
-    # 精确匹配
-    if query in name_to_songs:
-        matches.extend(name_to_songs[query])
-    # 模糊匹配
-    if not matches:
-        for name_key, songs in name_to_songs.items():
-            if query in name_key:
-                matches.extend(songs)
-    # 去重
-    seen = set()
-    unique = []
-    for s in matches:
-        if s["id"] not in seen:
-            unique.append(s)
-            seen.add(s["id"])
-    return unique[:20]
+    # 歌名完全 / 前缀匹配优先，其次艺人，再其次包含匹配
+    return search_index.search(query, limit=20)
 
 # ----------------------------
 # 用户输入
 # ----------------------------
-st.subheader("1. 输入你喜欢的歌曲名称（支持模糊搜索）")
+st.subheader("1. 输入你喜欢的歌曲名称或歌手（支持模糊搜索）")
 user_query = st.text_input("例如: Sugar On My Tongue, 卡农, 亮剑", placeholder="输入歌曲名称...")
 
 liked_song_ids = []
@@ -125,41 +128,19 @@ if st.button("🎧 生成推荐"):
     if not liked_song_ids:
         st.warning("请至少选择一首喜欢的歌曲")
     else:
-        # 构造临时用户
-        mock_user = {"user_id": "web_user", "liked_song_ids": liked_song_ids}
-        temp_users_path = os.path.join(INPUT_DIR, "temp_web_users.json")
-        with open(temp_users_path, "w", encoding="utf-8") as f:
-            json.dump([mock_user], f, ensure_ascii=False, indent=2)
-
         try:
-            # 构造 minimal all_songs（仅包含用户喜欢的歌曲，用于构建画像）
-            minimal_all_songs = []
-            for sid in liked_song_ids:
-                if sid in id_to_info:
-                    info = id_to_info[sid]
-                    # 从 song_meta 补充数值特征（如果存在）
-                    meta = song_meta.get(sid, {})
-                    minimal_all_songs.append({
-                        "id": sid,
-                        "name": info["name"],
-                        "artist": info["artist"],
-                        "type": meta.get("type", ""),
-                        "duration": meta.get("duration", 0),
-                        "stats": {
-                            "comment_count": meta.get("comment_count", 0)  # ✅ 正确嵌套
-                        },
-                        # 其他字段可保留（如果 scorer 需要）
-                        "current_rank": meta.get("current_rank", 0),
-                        "last_rank": meta.get("last_rank", 0)
-                    })
-
-            user_profiles = build_user_profiles(temp_users_path, minimal_all_songs)
-            raw_scores = compute_all_scores(user_profiles, song_meta)
-            recommendations = generate_recommendations(raw_scores, top_k=top_k, fallback_mode="trending")
+            # 进程内直接基于缓存的特征库打分，不写任何临时文件，多个会话互不干扰
+            result = recommend_for_liked(
+                liked_song_ids,
+                song_features,
+                top_k=top_k,
+                fallback_mode="trending",
+                cache=get_recommendation_cache()
+            )
 
             # 显示结果（用 id_to_info 补全歌名和歌手）
             st.subheader("🎯 推荐结果")
-            recs = recommendations[0]["recommendations"]
+            recs = result["recommendations"]
             if recs and recs[0].get("recommend_score", 0) == -1.0:
                 st.info("⚠️ 冷启动模式：返回热门歌曲")
 
@@ -176,9 +157,6 @@ if st.button("🎧 生成推荐"):
 
         except Exception as e:
             st.error(f"❌ 出错了: {str(e)}")
-        finally:
-            if os.path.exists(temp_users_path):
-                os.remove(temp_users_path)
 
 # ----------------------------
 # 统计信息
@@ -0,0 +1,90 @@
+# apply_like_events.py
+import os
+import argparse
+
+from src.catalog import load_catalog
+from src.incremental import (
+    ProfileStateStore,
+    build_profile_state,
+    find_recommendations_file,
+    load_profile_state,
+    merge_recommendations,
+    process_like_events,
+    rebuild_profile_state,
+)
+from src.pipeline_manifest import hash_path
+from src.sinks import existing_outputs, iter_records, open_sink
+from src.user_profiler import iter_blocks, iter_users
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="消费 like / unlike 事件流，增量更新画像并只重算受影响用户的推荐")
+    parser.add_argument("events", help="事件 JSONL 文件，每行 {user_id, song_id, action: like|unlike}")
+    parser.add_argument("--delta-output", default=None,
+                        help="（可选）把受影响用户的新推荐单独写到该文件（.ndjson 为逐行输出）")
+    parser.add_argument("--recommendations", default=None,
+                        help="合并新推荐的完整推荐文件（.json 或 .ndjson[.gz]，分片输出给不带序号的路径）；"
+                             "默认取 output/recommendations.json / .ndjson / .ndjson.gz（含分片）中最新写出的一组")
+    parser.add_argument("--no-merge", action="store_true",
+                        help="不合并到完整推荐文件（只更新画像状态并写 --delta-output），每批的开销只与事件数有关")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    # 配置路径（与 run_pipeline.py 保持一致）
+    INPUT_DIR = "input"
+    OUTPUT_DIR = "output"
+    USERS_FILE = os.path.join(INPUT_DIR, "users.json")
+    CATALOG_DIR = os.path.join(OUTPUT_DIR, "catalog")
+    STATE_DB = os.path.join(OUTPUT_DIR, "profile_state.sqlite")
+    LEGACY_STATE_FILE = os.path.join(OUTPUT_DIR, "profile_state.json")
+
+    recommendations_file = args.recommendations or find_recommendations_file(OUTPUT_DIR)
+
+    song_features = load_catalog(CATALOG_DIR)
+    # 与 PipelineManifest 一样按内容哈希判断输入是否变化
+    users_hash = hash_path(USERS_FILE)
+    catalog_version = song_features["version"]
+
+    with ProfileStateStore(STATE_DB) as store:
+        stored_users_hash = store.get_meta("users_hash")
+        if stored_users_hash != users_hash:
+            # 首次运行或 users.json 已变化：从 users.json 重新初始化；之后每批事件只读写受影响的用户
+            store.clear()
+            if stored_users_hash is None and os.path.exists(LEGACY_STATE_FILE):
+                print(f"⚠️ 从旧的 {LEGACY_STATE_FILE} 导入画像状态...")
+                store.put_many(load_profile_state(LEGACY_STATE_FILE, song_features))
+            else:
+                print(f"⚠️ {STATE_DB} 为空或 {USERS_FILE} 已变化，从 {USERS_FILE} 初始化画像状态...")
+                for block in iter_blocks(iter_users(USERS_FILE), 10000):
+                    store.put_many(build_profile_state(block, song_features))
+            store.set_meta("catalog_version", catalog_version)
+            store.set_meta("users_hash", users_hash)
+        elif store.get_meta("catalog_version") != catalog_version:
+            # 特征库重新编译过：保留已应用的事件，按新特征库从各用户的已听列表重新计算
+            print(f"⚠️ 特征库版本已变化，按新特征库重新计算 {STATE_DB} 中的画像状态...")
+            for batch in store.iter_batches():
+                store.put_many(rebuild_profile_state(batch, song_features))
+            store.set_meta("catalog_version", catalog_version)
+
+        events = list(iter_records(args.events))
+        state = store.get_many(event["user_id"] for event in events if event.get("user_id"))
+
+        delta_sink = open_sink(args.delta_output) if args.delta_output else None
+        try:
+            updates = process_like_events(events, state, song_features, top_k=args.top_k)
+            if delta_sink is not None:
+                for record in updates:
+                    delta_sink.write(record)
+        finally:
+            if delta_sink is not None:
+                delta_sink.close()
+
+        store.put_many({record["user_id"]: state[record["user_id"]] for record in updates})
+    print(f"✅ 已更新 {len(updates)} 个用户的画像，状态保存到 {STATE_DB}")
+
+    if updates and not args.no_merge:
+        if recommendations_file is not None and existing_outputs(recommendations_file):
+            merge_recommendations(recommendations_file, updates)
+            print(f"✅ 已将 {len(updates)} 个用户的新推荐合并到 {recommendations_file}")
+        else:
+            print(f"⚠️ 找不到完整推荐文件 {recommendations_file or os.path.join(OUTPUT_DIR, 'recommendations.*')}，"
+                  f"未合并（可用 --recommendations 指定）")
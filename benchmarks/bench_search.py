@@ -0,0 +1,125 @@
+# benchmarks/bench_search.py
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.search import SongSearchIndex, normalize_text  # noqa: E402
+
+
+def load_songs(all_songs_path: str) -> list:
+    """真实曲库（同一首歌取首次出现的记录）。"""
+    with open(all_songs_path, 'r', encoding='utf-8') as f:
+        all_songs = json.load(f)
+    songs = {}
+    for song in all_songs:
+        sid = str(song.get("id"))
+        if sid not in songs and song.get("name"):
+            songs[sid] = {"id": sid, "name": song["name"], "artist": song.get("artist", "")}
+    return list(songs.values())
+
+
+def synthesize(songs: list, scale: int, rng: random.Random) -> list:
+    """
+    把真实歌名 / 艺人两两拼接（前半段 + 后半段）扩充到 scale 倍，
+    保留真实的中英文字符分布，同时让前缀与 n-gram 足够分散。
+    """
+    def splice(a: str, b: str) -> str:
+        return a[:max(1, len(a) // 2)] + b[len(b) // 2:]
+
+    synthetic = list(songs)
+    for r in range(1, scale):
+        for i, song in enumerate(songs):
+            other = rng.choice(songs)
+            synthetic.append({
+                "id": f"syn{r}_{i}",
+                "name": splice(song["name"], other["name"]),
+                "artist": splice(song["artist"], rng.choice(songs)["artist"]) if song["artist"] else ""
+            })
+    return synthetic
+
+
+def make_queries(songs: list, n: int, rng: random.Random) -> list:
+    """随机截取歌名 / 艺人的 1~6 个字符作为查询（含前缀与中间子串），并混入少量不存在的查询。"""
+    queries = []
+    for _ in range(n):
+        if rng.random() < 0.05:
+            queries.append("zzqx" + str(rng.randint(0, 999)))
+            continue
+        text = rng.choice(songs)[rng.choice(["name", "name", "artist"])] or "a"
+        length = rng.randint(1, min(6, len(text)))
+        start = 0 if rng.random() < 0.5 else rng.randint(0, len(text) - length)
+        queries.append(text[start:start + length])
+    return queries
+
+
+def linear_search(entries: list, query: str, limit: int) -> list:
+    """旧版 app.py 的做法：逐个歌名做子串判断。"""
+    query = query.lower().strip()
+    return [song for key, song in entries if query in key][:limit]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def time_queries(search, queries: list) -> dict:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        "p50_us": round(percentile(latencies, 0.50), 1),
+        "p99_us": round(percentile(latencies, 0.99), 1),
+        "max_us": round(latencies[-1], 1),
+        "mean_us": round(sum(latencies) / len(latencies), 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="歌曲搜索索引基准测试（合成的放大曲库）")
+    parser.add_argument("--all-songs", default=os.path.join("output", "all_songs.json"))
+    parser.add_argument("--scale", type=int, default=100, help="曲库放大倍数")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="（可选）把结果写成 JSON 报告")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base_songs = load_songs(args.all_songs)
+    songs = synthesize(base_songs, args.scale, rng)
+    queries = make_queries(songs, args.queries, rng)
+    print(f"📚 合成曲库: {len(songs)} 首（{len(base_songs)} × {args.scale}），{len(queries)} 个查询")
+
+    start = time.perf_counter()
+    index = SongSearchIndex(songs)
+    build_s = time.perf_counter() - start
+    print(f"   建索引耗时 {build_s:.2f} s")
+
+    indexed = time_queries(lambda q: index.search(q, limit=args.limit), queries)
+    print(f"⚡ 索引查询: p50 {indexed['p50_us']} µs, p99 {indexed['p99_us']} µs, max {indexed['max_us']} µs")
+
+    entries = [(normalize_text(song["name"]), song) for song in songs]
+    linear = time_queries(lambda q: linear_search(entries, q, args.limit), queries[:max(1, len(queries) // 10)])
+    print(f"🐢 线性扫描: p50 {linear['p50_us']} µs, p99 {linear['p99_us']} µs")
+
+    if args.output:
+        report = {
+            "n_songs": len(songs),
+            "scale": args.scale,
+            "n_queries": len(queries),
+            "limit": args.limit,
+            "build_s": round(build_s, 3),
+            "index": indexed,
+            "linear_scan": linear
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 报告已保存到 {args.output}")
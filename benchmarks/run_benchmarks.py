@@ -0,0 +1,241 @@
+# benchmarks/run_benchmarks.py
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import argparse
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from benchmarks.synthetic import generate_playlists, generate_users  # noqa: E402
+from src.data_loader import load_and_merge_playlists  # noqa: E402
+from src.catalog import catalog_songs, compile_catalog, load_catalog  # noqa: E402
+from src.user_profiler import build_user_profiles  # noqa: E402
+from src.scorer import compute_all_scores  # noqa: E402
+from src.recommender import generate_recommendations, recommend_top_k  # noqa: E402
+from src.sinks import open_sink  # noqa: E402
+
+REPORT_VERSION = 1
+
+
+# ----------------------------
+# 各阶段（与 run_pipeline.py 的调用方式一致）
+# ----------------------------
+def stage_load(paths: Dict[str, str]):
+    load_and_merge_playlists(playlists_dir=paths["playlists"], output_dir=paths["out"])
+
+
+def stage_catalog(paths: Dict[str, str]):
+    compile_catalog(paths["metadata"], paths["all_songs"], paths["catalog"])
+
+
+def stage_profiles(paths: Dict[str, str]):
+    build_user_profiles(paths["users"], catalog_songs(load_catalog(paths["catalog"])), paths["profiles"])
+
+
+def stage_scores(paths: Dict[str, str]):
+    with open_sink(paths["raw_scores"], mapping_fields=("user_id", "scores")) as sink:
+        compute_all_scores(paths["profiles"], None, song_features=load_catalog(paths["catalog"]), sink=sink)
+
+
+def stage_generate(paths: Dict[str, str]):
+    with open_sink(paths["raw_recommendations"]) as sink:
+        generate_recommendations(paths["raw_scores"], users_input=paths["users"], sink=sink)
+
+
+def stage_recommend(paths: Dict[str, str]):
+    with open_sink(paths["recommendations"]) as sink:
+        recommend_top_k(paths["profiles"], users_input=paths["users"],
+                        song_features=load_catalog(paths["catalog"]), sink=sink)
+
+
+def stage_recommend_pruned(paths: Dict[str, str]):
+    with open_sink(paths["pruned_recommendations"]) as sink:
+        recommend_top_k(paths["profiles"], users_input=paths["users"],
+                        song_features=load_catalog(paths["catalog"]), sink=sink, prune=True)
+
+
+def stage_end_to_end(paths: Dict[str, str]):
+    # 默认流水线路径：加载榜单 → 编译特征库 → 画像 → 融合打分出 top_k
+    stage_load(paths)
+    stage_catalog(paths)
+    stage_profiles(paths)
+    stage_recommend(paths)
+
+
+# 阶段名 -> (函数, 吞吐量按用户数还是歌曲数计, 是否需要完整打分矩阵)
+STAGES = {
+    "load_and_merge_playlists": (stage_load, "songs", False),
+    "compile_catalog": (stage_catalog, "songs", False),
+    "build_user_profiles": (stage_profiles, "users", False),
+    "compute_all_scores": (stage_scores, "users", True),
+    "generate_recommendations": (stage_generate, "users", True),
+    "recommend_top_k": (stage_recommend, "users", False),
+    "recommend_top_k_pruned": (stage_recommend_pruned, "users", False),
+    "end_to_end": (stage_end_to_end, "users", False),
+}
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return float("nan")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def measure_stage(stage: str, paths: Dict[str, str]) -> Dict[str, float]:
+    """在独立子进程中运行（见 run_stage），峰值 RSS 只反映该阶段本身。"""
+    func = STAGES[stage][0]
+    rss_start = _current_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        func(paths)
+    return {
+        "wall_s": round(time.perf_counter() - wall_start, 4),
+        "cpu_s": round(time.process_time() - cpu_start, 4),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_delta_mb": round(_peak_rss_mb() - rss_start, 1)
+    }
+
+
+def run_stage(stage: str, paths: Dict[str, str]) -> Dict[str, float]:
+    # spawn 出全新的解释器：不继承父进程的内存高水位，也不受前一阶段缓存的影响
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(measure_stage, stage, paths).result()
+
+
+# ----------------------------
+# 合成数据与报告
+# ----------------------------
+def prepare_inputs(work_dir: str, n_users: int, n_songs: int, seed: int) -> Dict[str, str]:
+    """生成（或复用已生成的）合成输入，返回各阶段的输入 / 输出路径。"""
+    songs_dir = os.path.join(work_dir, f"songs_{n_songs}")
+    playlists = os.path.join(songs_dir, "playlists")
+    if not os.path.exists(os.path.join(songs_dir, ".done")):
+        generate_playlists(playlists, n_songs, seed=seed)
+        open(os.path.join(songs_dir, ".done"), 'w').close()
+
+    users = os.path.join(songs_dir, f"users_{n_users}.json")
+    if not os.path.exists(users):
+        generate_users(users + ".tmp", n_users, n_songs, seed=seed)
+        os.replace(users + ".tmp", users)
+
+    out = os.path.join(work_dir, f"run_{n_songs}s_{n_users}u")
+    os.makedirs(out, exist_ok=True)
+    return {
+        "playlists": playlists,
+        "users": users,
+        "out": out,
+        "all_songs": os.path.join(out, "all_songs.json"),
+        "metadata": os.path.join(out, "song_metadata.json"),
+        "catalog": os.path.join(out, "catalog"),
+        "profiles": os.path.join(out, "user_profiles.json"),
+        "raw_scores": os.path.join(out, "raw_scores.ndjson"),
+        "raw_recommendations": os.path.join(out, "recommendations_from_raw.ndjson"),
+        "recommendations": os.path.join(out, "recommendations.ndjson"),
+        "pruned_recommendations": os.path.join(out, "recommendations_pruned.ndjson"),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any]):
+    """按 (用户数, 歌曲数, 阶段) 对比两份报告的耗时与峰值内存，比值 < 1 表示变好。"""
+    base = {(r["n_users"], r["n_songs"], r["stage"]): r for r in baseline["results"] if r["status"] == "ok"}
+    print(f"\n📊 对比基线 {baseline['meta'].get('git_commit') or '?'}（比值 = 当前 / 基线）")
+    for r in report["results"]:
+        old = base.get((r["n_users"], r["n_songs"], r["stage"]))
+        if r["status"] != "ok" or old is None:
+            continue
+        wall_ratio = r["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+        rss_ratio = r["rss_delta_mb"] / old["rss_delta_mb"] if old["rss_delta_mb"] else float("nan")
+        print(f"   {r['n_users']:>8}u {r['n_songs']:>7}s {r['stage']:<26} "
+              f"耗时 ×{wall_ratio:.2f}  内存增量 ×{rss_ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="流水线分阶段基准测试：在合成数据的规模网格上测量耗时、CPU 时间与峰值内存",
+        epilog="完整网格示例: --users 1000 100000 1000000 --songs 1000 50000 200000"
+    )
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000], help="用户数网格")
+    parser.add_argument("--songs", type=int, nargs="+", default=[1000, 10000], help="歌曲数网格")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--max-raw-cells", type=float, default=2e7,
+                        help="用户数 × 歌曲数超过该值时跳过需要完整打分矩阵的阶段（compute_all_scores 等）")
+    parser.add_argument("--work-dir", default=os.path.join("benchmarks", "work"), help="合成数据与中间产出目录")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "report.json"), help="JSON 报告路径")
+    parser.add_argument("--baseline", default=None, help="（可选）之前的报告，输出逐项对比")
+    parser.add_argument("--seed", type=int, default=34)
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "report_version": REPORT_VERSION,
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "grid": {"users": args.users, "songs": args.songs, "max_raw_cells": args.max_raw_cells}
+        },
+        "results": []
+    }
+    results: List[Dict[str, Any]] = report["results"]
+
+    for n_songs in args.songs:
+        for n_users in args.users:
+            print(f"\n🔄 规模: {n_users} 用户 × {n_songs} 首歌")
+            paths = prepare_inputs(args.work_dir, n_users, n_songs, args.seed)
+            # 各阶段按依赖顺序执行，后面的阶段读取前面阶段的产出
+            for stage in STAGES:
+                if stage not in args.stages:
+                    continue
+                _, unit, needs_raw = STAGES[stage]
+                record: Dict[str, Any] = {"n_users": n_users, "n_songs": n_songs, "stage": stage}
+                if needs_raw and n_users * n_songs > args.max_raw_cells:
+                    record["status"] = "skipped"
+                    print(f"   ⏭️ {stage:<26} 跳过（{n_users * n_songs:.0e} 个打分单元超过 --max-raw-cells）")
+                else:
+                    record.update(run_stage(stage, paths))
+                    record["status"] = "ok"
+                    items = n_users if unit == "users" else n_songs
+                    record["throughput_per_s"] = round(items / record["wall_s"], 1) if record["wall_s"] else None
+                    print(f"   ✅ {stage:<26} {record['wall_s']:>9.3f} s  CPU {record['cpu_s']:>9.3f} s  "
+                          f"峰值 RSS {record['peak_rss_mb']:>8.1f} MB（+{record['rss_delta_mb']:.1f}）")
+                results.append(record)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 报告已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare_reports(report, json.load(f))
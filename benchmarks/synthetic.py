@@ -0,0 +1,101 @@
+# benchmarks/synthetic.py
+import os
+import json
+import random
+from typing import List
+
+TYPES = ["流行", "欧美流行", "日语", "古典", "韩语", "中文说唱", "欧美说唱", "摇滚", "民谣", "电子"]
+
+
+def generate_playlists(
+        playlists_dir: str,
+        n_songs: int,
+        songs_per_chart: int = 200,
+        p_duplicate: float = 0.1,
+        seed: int = 34
+) -> int:
+    """
+    生成与 input/netease_playlists 结构相同的合成榜单：每个榜单一个子文件夹、一个 JSON 文件。
+
+    共 n_songs 首唯一歌曲，按 songs_per_chart 切成多个榜单；每个榜单另有 p_duplicate 比例的
+    歌曲取自其它榜单（模拟同一首歌出现在多个榜单上）。
+
+    Returns:
+        生成的榜单数
+    """
+    rng = random.Random(seed)
+    n_artists = max(10, n_songs // 8)
+    os.makedirs(playlists_dir, exist_ok=True)
+
+    n_charts = max(1, -(-n_songs // songs_per_chart))
+    for chart in range(n_charts):
+        first = chart * songs_per_chart
+        song_numbers = list(range(first, min(n_songs, first + songs_per_chart)))
+        n_dup = int(len(song_numbers) * p_duplicate)
+        song_numbers += [rng.randrange(n_songs) for _ in range(n_dup)]
+        chart_size = len(song_numbers)
+        chart_type = TYPES[chart % len(TYPES)]
+
+        songs = []
+        for rank, number in enumerate(song_numbers, 1):
+            song_rng = random.Random(number)  # 同一首歌在不同榜单上的静态属性一致
+            last_rank = rng.choice([0, "等于当前排名", rng.randint(1, chart_size)])
+            songs.append({
+                "id": str(10_000_000 + number),
+                "name": f"合成歌曲 Song {number}",
+                "artist": f"Artist {song_rng.randrange(n_artists)}",
+                "type": TYPES[song_rng.randrange(len(TYPES))] if song_rng.random() < 0.3 else chart_type,
+                "duration": song_rng.randint(90, 420),
+                "current_rank": rank,
+                "last_rank": last_rank,
+                "stats": {"comment_count": int(song_rng.paretovariate(1.2) * 50)}
+            })
+
+        folder = os.path.join(playlists_dir, f"{chart:06d}_synthetic")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, "synthetic.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "playlist_info": {
+                    "id": str(chart),
+                    "name": f"合成榜单 {chart}",
+                    "type": chart_type,
+                    "song_count": chart_size,
+                    "update_time": f"2025-12-12 {chart // 3600 % 24:02d}:{chart // 60 % 60:02d}:{chart % 60:02d}"
+                },
+                "songs": songs
+            }, f, ensure_ascii=False)
+    return n_charts
+
+
+def generate_users(
+        users_file: str,
+        n_users: int,
+        n_songs: int,
+        min_liked: int = 3,
+        max_liked: int = 20,
+        p_cold_start: float = 0.15,
+        p_invalid_id: float = 0.1,
+        seed: int = 34
+):
+    """
+    生成 {"users": [...]} 格式的用户文件，分布与 generate_mock_users.py 的默认配置一致
+    （冷启动用户、无效 ID）；喜欢的歌曲按幂律偏向热门歌曲。逐个用户写出，百万级用户也不占内存。
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(users_file) or ".", exist_ok=True)
+
+    with open(users_file, 'w', encoding='utf-8') as f:
+        f.write('{"users": [\n')
+        for i in range(1, n_users + 1):
+            liked_ids: List[str] = []
+            if rng.random() >= p_cold_start:
+                for _ in range(rng.randint(min_liked, max_liked)):
+                    if rng.random() < p_invalid_id:
+                        liked_ids.append(f"invalid_{rng.randint(1000000, 9999999)}")
+                    else:
+                        number = min(n_songs - 1, int(n_songs * rng.random() ** 2))
+                        liked_ids.append(str(10_000_000 + number))
+            user = {"user_id": f"user_{i:07d}", "liked_song_ids": liked_ids}
+            f.write(json.dumps(user, ensure_ascii=False))
+            f.write(",\n" if i < n_users else "\n")
+        f.write("]}\n")
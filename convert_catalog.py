@@ -0,0 +1,24 @@
+# convert_catalog.py
+import os
+import argparse
+
+from src.catalog import compile_catalog
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 all_songs.json / song_metadata.json 转换为可内存映射的二进制特征库")
+    parser.add_argument("--metadata", default=os.path.join("output", "song_metadata.json"),
+                        help="song_metadata.json 路径")
+    parser.add_argument("--all-songs", default=os.path.join("output", "all_songs.json"),
+                        help="all_songs.json 路径（提供展示用歌名 / 艺人）")
+    parser.add_argument("--output", default=os.path.join("output", "catalog"), help="特征库输出目录")
+    args = parser.parse_args()
+
+    manifest = compile_catalog(
+        song_metadata_input=args.metadata,
+        all_songs_input=args.all_songs,
+        catalog_dir=args.output
+    )
+    total_bytes = sum(
+        os.path.getsize(os.path.join(args.output, f"{name}.npy")) for name in manifest["columns"]
+    )
+    print(f"   共 {len(manifest['columns'])} 列，{total_bytes / 1024:.1f} KB")
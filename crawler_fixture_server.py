@@ -0,0 +1,114 @@
+# crawler_fixture_server.py
+import json
+import time
+import hashlib
+import random
+import signal
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    按请求路径（含查询串）回放录制的响应；没有录制的路径返回 404。
+
+    fail_rate > 0 时按概率返回 503，用于验证爬虫的退避重试；latency 模拟网络延迟。
+    成功的响应带 ETag（响应体的哈希），请求的 If-None-Match 与之相同时返回 304，用于验证条件请求。
+    """
+
+    protocol_version = "HTTP/1.1"
+    fixtures: Dict[str, Dict[str, Any]] = {}
+    latency = 0.0
+    fail_rate = 0.0
+    verbose = False
+    stats = {"requests": 0, "failed": 0, "not_modified": 0, "in_flight": 0, "max_in_flight": 0}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            fixture = self.fixtures.get(self.path)
+            if fixture is not None and random.random() < self.fail_rate:
+                with self.lock:
+                    self.stats["failed"] += 1
+                self._send(503, "text/plain; charset=utf-8", "injected failure")
+            elif fixture is None:
+                self._send(404, "text/plain; charset=utf-8", f"no fixture for {self.path}")
+            else:
+                etag = '"%s"' % hashlib.sha1(fixture["body"].encode("utf-8")).hexdigest()[:16]
+                if fixture["status"] == 200 and self.headers.get("If-None-Match") == etag:
+                    with self.lock:
+                        self.stats["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                else:
+                    self._send(fixture["status"], fixture.get("content_type") or "text/html; charset=utf-8",
+                               fixture["body"], etag if fixture["status"] == 200 else None)
+        finally:
+            with self.lock:
+                self.stats["in_flight"] -= 1
+
+    def _send(self, status: int, content_type: str, body: str, etag: Optional[str] = None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="爬虫替身服务：回放 netease_crawler.py --record 录制的响应，用于离线测试"
+    )
+    parser.add_argument("--fixtures", required=True, help="录制的响应文件（{请求路径: {status, content_type, body}}）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="按该概率返回 503，验证退避重试")
+    parser.add_argument("--seed", type=int, default=34)
+    parser.add_argument("--verbose", action="store_true", help="打印每个请求的访问日志")
+    args = parser.parse_args()
+
+    with open(args.fixtures, 'r', encoding='utf-8') as f:
+        fixtures = json.load(f)
+    random.seed(args.seed)
+
+    handler = type("BoundFixtureHandler", (FixtureHandler,), {
+        "fixtures": fixtures,
+        "latency": args.latency,
+        "fail_rate": args.fail_rate,
+        "verbose": args.verbose
+    })
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # SIGTERM 与 Ctrl+C 一样正常退出，并打印请求统计
+    signal.signal(signal.SIGTERM, stop)
+    print(f"🚀 替身服务已启动: http://{args.host}:{args.port}（{len(fixtures)} 个录制的响应）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n✅ 共 {handler.stats['requests']} 个请求，注入失败 {handler.stats['failed']} 个，"
+              f"304 未修改 {handler.stats['not_modified']} 个，"
+              f"最大并发 {handler.stats['max_in_flight']}")
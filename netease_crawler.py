@@ -5,12 +5,128 @@ import jsonpath
 import re
 import csv
 import time
+import random
+import sqlite3
+import asyncio
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+# 这些状态码视为暂时性错误，异步模式下会退避重试
+RETRY_STATUS = {429, 500, 502, 503, 504}
+SONG_LIST_PATTERN = re.compile(r'<textarea.*?id="song-list-pre-data".*?>(.*?)</textarea>', re.S)
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 个请求，最多允许 burst 个请求突发。"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CrawlCache:
+    """
+    爬虫的持久化缓存（单个 sqlite 文件），跨多次运行保留：
+      - song_stats: 按歌曲 ID 缓存统计数据与获取时间，max_age 秒内视为新鲜，不再请求；
+      - responses: 带 ETag / Last-Modified 的响应，重新请求时发条件请求，304 时复用缓存的响应体。
+    异步模式下会在线程池的多个线程中使用，所有操作串行加锁。
+    """
+
+    def __init__(self, path, max_age=86400):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_age = max_age
+        self.counts = {'fresh': 0, 'fetched': 0, 'not_modified': 0, 'stale_fallback': 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS song_stats ("
+                "song_id TEXT PRIMARY KEY, stats TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_type TEXT, body TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL)"
+            )
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def get_stats(self, song_id, max_age=None):
+        """max_age 秒（默认 self.max_age）内获取过的统计数据；没有或已过期时返回 None。"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stats, fetched_at FROM song_stats WHERE song_id = ?", (song_id,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > max_age:
+            return None
+        return json.loads(row[0])
+
+    def put_stats(self, song_id, stats):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO song_stats (song_id, stats, fetched_at) VALUES (?, ?, ?)",
+                (song_id, json.dumps(stats), time.time())
+            )
+
+    def get_response(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_type, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('etag', 'last_modified', 'content_type', 'body'), row))
+
+    def put_response(self, url, etag, last_modified, content_type, body):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, content_type, body, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_type, body, time.time())
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
 
 class CloudMusicSpider:
-    def __init__(self):
+    def __init__(self, site='https://music.163.com', output_dir='./netease_playlists', timeout=None, record=False,
+                 cache_path=None, stats_max_age=86400, history_dir=None):
+        """
+        Args:
+            site: 网站根地址；可以指向本地的替身服务（crawler_fixture_server.py）做离线测试
+            output_dir: 输出目录
+            timeout: 单个请求的超时秒数，None 表示不限
+            record: 是否记录所有响应，之后用 save_recording 保存为替身服务的 fixtures
+            cache_path: （可选）持久化缓存文件（sqlite）；给出时歌曲统计数据只请求新上榜或已过期的歌曲
+            stats_max_age: 缓存的统计数据在多少秒内视为新鲜，不再请求
+            history_dir: （可选）榜单快照历史目录；给出时每个榜单除覆盖写出 JSON 外，还追加一个压缩快照
+        """
         self.session = requests.Session()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -35,9 +151,29 @@ class CloudMusicSpider:
             '2809513713': {'name': '欧美热歌', 'type': '欧美流行'},
             '12225155968': {'name': '欧美R&B', 'type': 'R&B'},
         }
-        self.base_url = 'https://music.163.com/discover/toplist?id='
-        self.output_dir = './netease_playlists'
+        self.site = site.rstrip('/')
+        self.base_url = f'{self.site}/discover/toplist?id='
+        self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
+        self.timeout = timeout
+        self.recorded = {} if record else None
+        self.cache = CrawlCache(cache_path, max_age=stats_max_age) if cache_path else None
+        # 本次运行已获取的歌曲详情 {song_id: 详情}，播放URL与统计数据共用（见 get_song_details）
+        self.song_details = {}
+        self.history = None
+        if history_dir:
+            from src.history import ChartHistory  # 只在需要时导入（依赖 numpy）
+            self.history = ChartHistory(history_dir)
+
+        # 异步模式的并发、限速与重试设置（见 run_spider_async）
+        self._semaphore = None
+        self._bucket = None
+        self.retries = 3
+        self.backoff = 0.5
+        # 本次运行中正在请求的歌曲详情批次 {song_id: Task}：并发的歌单等待同一个批次，不重复请求
+        self._detail_tasks = {}
+        # 本次运行中每首歌的统计数据任务 {song_id: Task}：同一首歌在多个歌单中只请求一次评论数
+        self._stats_tasks = {}
 
         # 登录凭证（需要用户填写）
         self.cookies = {}
@@ -60,8 +196,8 @@ class CloudMusicSpider:
             print("已设置Cookie，尝试登录...")
 
             # 测试登录状态
-            test_url = "https://music.163.com/"
-            response = self.session.get(test_url, headers=self.headers)
+            test_url = f"{self.site}/"
+            response = self._get(test_url)
             if "登录" not in response.text or "我的音乐" in response.text:
                 print("登录成功！")
                 return True
@@ -72,9 +208,57 @@ class CloudMusicSpider:
             print("未提供Cookie，将以游客身份访问（可能无法获取付费歌曲URL）")
             return True
 
+    def _get(self, url, params=None, conditional=False):
+        """
+        所有请求的统一入口（同一个 Session，复用连接）；开启 record 时记录响应。
+
+        conditional 为 True 且开启了缓存时发条件请求（If-None-Match / If-Modified-Since）：
+        服务器返回 304 时用缓存的响应体构造 200 响应，调用方无需区分。
+        """
+        cached = key = None
+        headers = self.headers
+        if conditional and self.cache is not None:
+            key = requests.Request('GET', url, params=params).prepare().url
+            cached = self.cache.get_response(key)
+            if cached is not None:
+                headers = dict(headers)
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if cached is not None and response.status_code == 304:
+            self.cache.count('not_modified')
+            response.status_code = 200
+            response._content = cached['body'].encode('utf-8')
+            response.encoding = 'utf-8'
+            if cached['content_type']:
+                response.headers['Content-Type'] = cached['content_type']
+            return response
+        if key is not None and response.status_code == 200:
+            # 只有带校验信息的响应才能用于条件请求
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.cache.put_response(key, etag, last_modified, response.headers.get('Content-Type', ''),
+                                        response.text)
+        if self.recorded is not None:
+            self.recorded[response.request.path_url] = {
+                'status': response.status_code,
+                'content_type': response.headers.get('Content-Type', ''),
+                'body': response.text
+            }
+        return response
+
+    def save_recording(self, path):
+        """把记录的响应保存为 {请求路径: {status, content_type, body}}，供 crawler_fixture_server.py 回放。"""
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(self.recorded or {}, f, ensure_ascii=False, indent=2)
+        print(f"已记录 {len(self.recorded or {})} 个响应到 {path}")
+
     def parse_url(self, url):
         try:
-            response = self.session.get(url, headers=self.headers)
+            response = self._get(url)
             if response.status_code == 200:
                 return response.text
         except RequestException:
@@ -113,18 +297,22 @@ class CloudMusicSpider:
 
         return id_list[:200], name_list[:200]
 
-    def get_song_urls(self, song_ids):
-        """批量获取歌曲的真实播放URL"""
-        print("正在获取歌曲播放URL...")
-        song_urls = {}
+    def get_song_details(self, song_ids):
+        """
+        批量获取歌曲详情（/api/song/detail，每次请求 50 首）。
+
+        结果按歌曲 ID 保存在 self.song_details 中：播放URL（名称、歌手、专辑、时长）与统计数据
+        （歌曲是否存在）共用同一份详情，同一次运行中每首歌只请求一次。请求失败的歌曲不在返回值中。
+        """
+        missing = [song_id for song_id in dict.fromkeys(song_ids) if song_id not in self.song_details]
 
         # 网易云音乐获取歌曲详情的API
-        url = "https://music.163.com/api/song/detail"
+        url = f"{self.site}/api/song/detail"
 
         # 分批处理，避免请求过大
         batch_size = 50
-        for i in range(0, len(song_ids), batch_size):
-            batch_ids = song_ids[i:i + batch_size]
+        for i in range(0, len(missing), batch_size):
+            batch_ids = missing[i:i + batch_size]
 
             # 构造请求参数
             ids_str = ','.join(batch_ids)
@@ -133,83 +321,131 @@ class CloudMusicSpider:
             }
 
             try:
-                response = self.session.get(url, params=params, headers=self.headers)
+                response = self._get(url, params=params)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('code') == 200:
                         for song in data.get('songs', []):
-                            song_id = str(song['id'])
-                            # 获取歌曲的MP3 URL
-                            mp3_url = f"https://music.163.com/song/media/outer/url?id={song_id}.mp3"
-                            song_urls[song_id] = {
-                                'name': song['name'],
-                                'artists': ', '.join([artist['name'] for artist in song['artists']]),
-                                'album': song['album']['name'],
-                                'mp3_url': mp3_url,
-                                'duration': song['duration']  # 歌曲时长，毫秒
-                            }
+                            self.song_details[str(song['id'])] = song
                 else:
-                    print(f"获取歌曲URL失败，状态码: {response.status_code}")
+                    print(f"获取歌曲详情失败，状态码: {response.status_code}")
             except Exception as e:
-                print(f"获取歌曲URL时出错: {e}")
+                print(f"获取歌曲详情时出错: {e}")
+
+        return {song_id: self.song_details[song_id] for song_id in song_ids if song_id in self.song_details}
+
+    @staticmethod
+    def song_url_info(song):
+        """由歌曲详情构造播放URL信息"""
+        song_id = str(song['id'])
+        return {
+            'name': song['name'],
+            'artists': ', '.join([artist['name'] for artist in song['artists']]),
+            'album': song['album']['name'],
+            'mp3_url': f"https://music.163.com/song/media/outer/url?id={song_id}.mp3",
+            'duration': song['duration']  # 歌曲时长，毫秒
+        }
+
+    def get_song_urls(self, song_ids):
+        """批量获取歌曲的真实播放URL（来自批量请求的歌曲详情）"""
+        print("正在获取歌曲播放URL...")
+        song_urls = {}
+        for song_id, song in self.get_song_details(song_ids).items():
+            try:
+                song_urls[song_id] = self.song_url_info(song)
+            except (KeyError, TypeError) as e:
+                print(f"解析歌曲 {song_id} 的详情时出错: {e}")
 
         print(f"成功获取 {len(song_urls)} 首歌曲的URL")
         return song_urls
 
     def get_song_detail_stats(self, song_id):
-        """获取单首歌曲的详细数据，包括点赞、收藏、转发量"""
-        try:
-            # 使用网易云音乐API获取歌曲详情
-            detail_url = f"https://music.163.com/api/v1/song/detail/?ids=[{song_id}]"
-            response = self.session.get(detail_url, headers=self.headers)
-
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('code') == 200 and data.get('songs'):
-                    song_data = data['songs'][0]
+        """获取单首歌曲的详细数据，包括点赞、收藏、转发量
 
+        歌曲详情取自 get_song_details（批量请求，已获取过的不再请求），每首歌只需单独请求评论数。
+        """
+        try:
+            if song_id not in self.song_details:
+                self.get_song_details([song_id])
+
+            if song_id in self.song_details:
+                comment_url = f"{self.site}/api/v1/resource/comments/R_SO_4_{song_id}?limit=1"
+                comment_response = self._get(comment_url, conditional=True)
+
+                like_count = 0
+                share_count = 0
+                comment_count = 0
+
+                if comment_response.status_code == 200:
+                    comment_data = comment_response.json()
+                    comment_count = comment_data.get('total', 0)
+
+                stats = {
+                    'like_count': like_count,
+                    'favorite_count': 0,  # 这个数据较难获取
+                    'share_count': share_count,
+                    'comment_count': comment_count
+                }
+                if comment_response.status_code == 200:
+                    self._store_stats(song_id, stats)
+                    return stats
+                return self._stale_stats(song_id, stats)
 
-                    comment_url = f"https://music.163.com/api/v1/resource/comments/R_SO_4_{song_id}?limit=1"
-                    comment_response = self.session.get(comment_url, headers=self.headers)
-
-                    like_count = 0
-                    share_count = 0
-                    comment_count = 0
-
-                    if comment_response.status_code == 200:
-                        comment_data = comment_response.json()
-                        comment_count = comment_data.get('total', 0)
-
-                    return {
-                        'like_count': like_count,
-                        'favorite_count': 0,  # 这个数据较难获取
-                        'share_count': share_count,
-                        'comment_count': comment_count
-                    }
-
-            return {
+            return self._stale_stats(song_id, {
                 'like_count': 0,
                 'favorite_count': 0,
                 'share_count': 0,
                 'comment_count': 0
-            }
+            })
 
         except Exception as e:
             print(f"获取歌曲 {song_id} 详细数据时出错: {e}")
-            return {
+            return self._stale_stats(song_id, {
                 'like_count': 0,
                 'favorite_count': 0,
                 'share_count': 0,
                 'comment_count': 0
-            }
+            })
+
+    def _cached_stats(self, song_ids):
+        """缓存中仍新鲜的统计数据 {song_id: stats}；未开启缓存时为空。"""
+        if self.cache is None:
+            return {}
+        cached = {}
+        for song_id in song_ids:
+            stats = self.cache.get_stats(song_id)
+            if stats is not None:
+                cached[song_id] = stats
+        self.cache.count('fresh', len(cached))
+        print(f"统计数据缓存命中 {len(cached)}/{len(song_ids)} 首"
+              f"（{self.cache.max_age / 3600:g} 小时内获取过），需请求 {len(song_ids) - len(cached)} 首")
+        return cached
+
+    def _store_stats(self, song_id, stats):
+        if self.cache is not None:
+            self.cache.put_stats(song_id, stats)
+            self.cache.count('fetched')
+
+    def _stale_stats(self, song_id, default):
+        """请求失败时：有缓存（即使已过期）就用缓存的值，否则用 default。"""
+        if self.cache is not None:
+            stats = self.cache.get_stats(song_id, max_age=float('inf'))
+            if stats is not None:
+                self.cache.count('stale_fallback')
+                return stats
+        return default
 
     def get_songs_stats_batch(self, song_ids):
         """批量获取歌曲统计数据"""
         print("正在获取歌曲统计数据（点赞、收藏、转发量）...")
-        songs_stats = {}
-
-        # 由于网易云音乐API限制，我们只能逐个获取
-        for i, song_id in enumerate(song_ids):
+        # 开启缓存时只请求新上榜或统计数据已过期的歌曲
+        songs_stats = self._cached_stats(song_ids)
+        to_fetch = [song_id for song_id in song_ids if song_id not in songs_stats]
+        # 歌曲详情批量获取（已随播放URL获取过的不再请求），之后只有评论数需要逐首请求
+        self.get_song_details(to_fetch)
+
+        # 由于网易云音乐API限制，评论数只能逐个获取
+        for i, song_id in enumerate(to_fetch):
             try:
                 stats = self.get_song_detail_stats(song_id)
                 songs_stats[song_id] = stats
@@ -219,7 +455,7 @@ class CloudMusicSpider:
 
                 # 每10首歌曲打印一次进度
                 if (i + 1) % 10 == 0:
-                    print(f"已获取 {i + 1}/{len(song_ids)} 首歌曲的统计数据")
+                    print(f"已获取 {i + 1}/{len(to_fetch)} 首歌曲的统计数据")
 
             except Exception as e:
                 print(f"获取歌曲 {song_id} 统计数据失败: {e}")
@@ -230,16 +466,20 @@ class CloudMusicSpider:
                     'comment_count': 0
                 }
 
+        songs_stats = {song_id: songs_stats[song_id] for song_id in song_ids}
         print(f"成功获取 {len(songs_stats)} 首歌曲的统计数据")
         return songs_stats
 
     def get_json_data(self, html, playlist_id, playlist_info, fav_count, share_count, comment_count, get_urls=False,
-                      get_stats=False):
+                      get_stats=False, song_urls=None, songs_stats=None):
+        """
+        提取歌曲数据并保存。song_urls / songs_stats 已提前获取（异步模式）时直接使用，不再请求。
+        """
         playlist_name = playlist_info['name']
         playlist_type = playlist_info['type']
 
         print(f"正在提取歌单【{playlist_name}】的歌曲数据...")
-        json_text = re.findall(r'<textarea.*?id="song-list-pre-data".*?>(.*?)</textarea>', html, re.S)
+        json_text = SONG_LIST_PATTERN.findall(html)
         if not json_text:
             print("未找到 JSON 数据")
             return []
@@ -254,14 +494,14 @@ class CloudMusicSpider:
         ids, names = self.get_song_ids_and_names(html)
 
         # 如果需要获取歌曲URL
-        song_urls = {}
-        if get_urls:
+        if get_urls and song_urls is None:
             song_urls = self.get_song_urls(ids)
+        song_urls = song_urls or {}
 
         # 如果需要获取歌曲统计数据
-        songs_stats = {}
-        if get_stats:
+        if get_stats and songs_stats is None:
             songs_stats = self.get_songs_stats_batch(ids)
+        songs_stats = songs_stats or {}
 
         # 构建歌曲数据列表
         songs_data = []
@@ -325,6 +565,12 @@ class CloudMusicSpider:
 
         print(f"歌单【{playlist_name}】的数据已导出到 {json_path}")
 
+        # 上面的 JSON 每次都会被覆盖，快照历史按 (歌单ID, 抓取时间) 保留每一次的排名
+        if self.history is not None:
+            info = playlist_data['playlist_info']
+            self.history.add_snapshot(playlist_id, info['update_time'], info['song_count'], songs_data,
+                                      playlist_info=info)
+
         # 如果获取了URL，单独保存URL列表为文本文件
         if get_urls and song_urls:
             urls_path = os.path.join(playlist_dir, f'{playlist_name}_歌曲URL列表.txt')
@@ -395,6 +641,205 @@ class CloudMusicSpider:
         # 保存所有歌单的汇总统计信息
         self.save_summary_stats(all_playlist_stats)
 
+    # ----------------------------
+    # 异步模式：并发上限 + 令牌桶限速 + 退避重试，输出文件与同步模式相同
+    # ----------------------------
+    async def _fetch(self, url, params=None, conditional=False):
+        """
+        异步 GET：在线程池中执行 _get（requests 是同步库），共用同一个 Session 的连接池。
+        网络异常与 RETRY_STATUS 中的状态码按指数退避（带随机抖动）重试，
+        重试用尽后返回最后一次响应，全部为网络异常时返回 None。
+        """
+        response = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+            async with self._semaphore:
+                await self._bucket.acquire()
+                try:
+                    response = await asyncio.to_thread(self._get, url, params, conditional)
+                except RequestException as e:
+                    print(f"请求失败（第 {attempt + 1} 次）: {url} {e}")
+                    response = None
+                    continue
+            if response.status_code not in RETRY_STATUS:
+                return response
+        return response
+
+    async def get_song_details_async(self, song_ids):
+        """
+        get_song_details 的异步版本：各批并发请求，结果同样保存在 self.song_details 中。
+
+        其它歌单已在请求的歌曲不再另发请求，而是等待同一个批次（self._detail_tasks）。
+        """
+        unique_ids = [song_id for song_id in dict.fromkeys(song_ids) if song_id not in self.song_details]
+        pending = {self._detail_tasks[song_id] for song_id in unique_ids if song_id in self._detail_tasks}
+        missing = [song_id for song_id in unique_ids if song_id not in self._detail_tasks]
+        url = f"{self.site}/api/song/detail"
+
+        async def fetch_batch(batch_ids):
+            try:
+                response = await self._fetch(url, params={'ids': f"[{','.join(batch_ids)}]"})
+                if response is None:
+                    print("获取歌曲详情时出错: 请求失败")
+                elif response.status_code == 200:
+                    data = response.json()
+                    if data.get('code') == 200:
+                        for song in data.get('songs', []):
+                            self.song_details[str(song['id'])] = song
+                else:
+                    print(f"获取歌曲详情失败，状态码: {response.status_code}")
+            except Exception as e:
+                print(f"获取歌曲详情时出错: {e}")
+            finally:
+                # 批次结束后不再登记：成功的已在 song_details 中，失败的之后可以重新请求（与同步模式相同）
+                for song_id in batch_ids:
+                    if self._detail_tasks.get(song_id) is task_of[song_id]:
+                        del self._detail_tasks[song_id]
+
+        # 在第一次 await 之前登记所有新批次，同时开始的其它歌单能看到它们
+        batch_size = 50
+        task_of = {}
+        for i in range(0, len(missing), batch_size):
+            batch_ids = missing[i:i + batch_size]
+            task = asyncio.ensure_future(fetch_batch(batch_ids))
+            for song_id in batch_ids:
+                task_of[song_id] = self._detail_tasks[song_id] = task
+        await asyncio.gather(*pending, *set(task_of.values()))
+        return {song_id: self.song_details[song_id] for song_id in song_ids if song_id in self.song_details}
+
+    async def get_song_urls_async(self, song_ids):
+        """get_song_urls 的异步版本（歌曲详情由 get_song_details_async 并发批量获取）。"""
+        print("正在获取歌曲播放URL...")
+        song_urls = {}
+        for song_id, song in (await self.get_song_details_async(song_ids)).items():
+            try:
+                song_urls[song_id] = self.song_url_info(song)
+            except (KeyError, TypeError) as e:
+                print(f"解析歌曲 {song_id} 的详情时出错: {e}")
+        print(f"成功获取 {len(song_urls)} 首歌曲的URL")
+        return song_urls
+
+    async def get_song_detail_stats_async(self, song_id):
+        """get_song_detail_stats 的异步版本（详情取自批量请求，只单独请求评论数）。"""
+        empty = {'like_count': 0, 'favorite_count': 0, 'share_count': 0, 'comment_count': 0}
+        try:
+            if song_id not in self.song_details:
+                await self.get_song_details_async([song_id])
+            if song_id in self.song_details:
+                comment_url = f"{self.site}/api/v1/resource/comments/R_SO_4_{song_id}?limit=1"
+                comment_response = await self._fetch(comment_url, conditional=True)
+                if comment_response is not None and comment_response.status_code == 200:
+                    stats = dict(empty, comment_count=comment_response.json().get('total', 0))
+                    self._store_stats(song_id, stats)
+                    return stats
+            return self._stale_stats(song_id, empty)
+        except Exception as e:
+            print(f"获取歌曲 {song_id} 详细数据时出错: {e}")
+            return self._stale_stats(song_id, empty)
+
+    async def get_songs_stats_batch_async(self, song_ids):
+        """
+        get_songs_stats_batch 的异步版本：所有歌曲并发获取，节奏由令牌桶控制。
+
+        所有歌单同时开始，检查缓存时其它歌单的结果还没写入，因此本次运行已经开始获取的歌曲
+        直接等待同一个任务（self._stats_tasks），不再查缓存或重复请求。
+        """
+        print("正在获取歌曲统计数据（点赞、收藏、转发量）...")
+        unique_ids = list(dict.fromkeys(song_ids))
+        songs_stats = self._cached_stats([song_id for song_id in unique_ids if song_id not in self._stats_tasks])
+        to_fetch = [song_id for song_id in unique_ids
+                    if song_id not in songs_stats and song_id not in self._stats_tasks]
+        # 歌曲详情批量获取一次，各首歌的评论数请求等它完成后再发
+        details = asyncio.ensure_future(self.get_song_details_async(to_fetch))
+        done = 0
+
+        async def fetch_one(song_id):
+            nonlocal done
+            await details
+            stats = await self.get_song_detail_stats_async(song_id)
+            done += 1
+            if done % 10 == 0:
+                print(f"已获取 {done}/{len(to_fetch)} 首歌曲的统计数据")
+            return stats
+
+        # 在第一次 await 之前登记，同时开始的其它歌单能看到这些任务
+        for song_id in to_fetch:
+            self._stats_tasks[song_id] = asyncio.ensure_future(fetch_one(song_id))
+        fetched_ids = [song_id for song_id in unique_ids if song_id not in songs_stats]
+        results = await asyncio.gather(*(self._stats_tasks[song_id] for song_id in fetched_ids))
+        songs_stats.update(zip(fetched_ids, results))
+        songs_stats = {song_id: songs_stats[song_id] for song_id in song_ids}
+        print(f"成功获取 {len(songs_stats)} 首歌曲的统计数据")
+        return songs_stats
+
+    async def crawl_playlist_async(self, playlist_id, playlist_info, get_urls=False, get_stats=False):
+        """爬取单个歌单并保存，返回该歌单的汇总统计（失败时返回 None）。"""
+        playlist_name = playlist_info['name']
+        print(f"\n正在爬取歌单: {playlist_name} (ID: {playlist_id})")
+        response = await self._fetch(self.base_url + playlist_id)
+        html = response.text if response is not None and response.status_code == 200 else None
+        if not html:
+            print(f"获取歌单 {playlist_id} 失败")
+            return None
+
+        fav_count, share_count, comment_count = self.get_playlist_info(html)[1:]
+
+        # 没有歌曲数据时 get_json_data 直接返回，不必请求 URL / 统计数据
+        song_urls = songs_stats = None
+        if SONG_LIST_PATTERN.search(html):
+            ids, _ = self.get_song_ids_and_names(html)
+            # 先取播放URL：统计数据复用同一批歌曲详情，只需再逐首请求评论数
+            if get_urls:
+                song_urls = await self.get_song_urls_async(ids)
+            if get_stats:
+                songs_stats = await self.get_songs_stats_batch_async(ids)
+
+        song_count = self.get_json_data(
+            html, playlist_id, playlist_info,
+            fav_count, share_count, comment_count,
+            get_urls=get_urls,
+            get_stats=get_stats,
+            song_urls=song_urls,
+            songs_stats=songs_stats
+        )
+        return {
+            '歌单ID': playlist_id,
+            '歌单名称': playlist_name,
+            '类型': playlist_info['type'],
+            '收藏数': fav_count,
+            '转发数': share_count,
+            '评论数': comment_count,
+            '歌曲数量': song_count
+        }
+
+    async def run_spider_async(self, get_urls=False, get_stats=False, concurrency=8, rate=30.0, retries=3,
+                               backoff=0.5):
+        """异步版 run_spider：所有歌单与歌曲并发爬取，输出文件与同步模式相同。
+
+        Args:
+            concurrency: 同时进行的最大请求数（也是连接池大小）
+            rate: 平均每秒最多发出的请求数（令牌桶，允许 concurrency 个突发）
+            retries: 网络异常或 429 / 5xx 时的最大重试次数
+            backoff: 首次重试前的等待秒数，之后每次翻倍（另加随机抖动）
+        """
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rate, burst=concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # 默认线程池在单核机器上只有 5 个线程，会把并发压到 5 以下
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+
+        results = await asyncio.gather(*(
+            self.crawl_playlist_async(playlist_id, playlist_info, get_urls, get_stats)
+            for playlist_id, playlist_info in self.playlists.items()
+        ))
+        # 汇总按歌单的定义顺序排列，与同步模式一致
+        self.save_summary_stats([stat for stat in results if stat is not None])
+
     def save_summary_stats(self, stats):
         """保存所有歌单的汇总统计信息"""
         summary_path = os.path.join(self.output_dir, '所有歌单汇总统计.json')
@@ -424,20 +869,63 @@ class CloudMusicSpider:
 
 
 if __name__ == '__main__':
-    spider = CloudMusicSpider()
+    parser = argparse.ArgumentParser(description="爬取网易云音乐榜单")
+    parser.add_argument("--async-mode", action="store_true", help="并发爬取（限速 + 失败重试），输出与同步模式相同")
+    parser.add_argument("--concurrency", type=int, default=8, help="异步模式的最大并发请求数")
+    parser.add_argument("--rate", type=float, default=30.0,
+                        help="异步模式每秒最多发出的请求数（同步模式逐首请求评论数间隔 0.1 秒，约每秒 10 个以内；"
+                             "限速不高于 10 时异步模式不会更快）")
+    parser.add_argument("--retries", type=int, default=3, help="异步模式失败重试次数")
+    parser.add_argument("--site", default="https://music.163.com",
+                        help="网站根地址；指向 crawler_fixture_server.py 可离线回放录制的响应")
+    parser.add_argument("--output-dir", default="./netease_playlists", help="输出目录")
+    parser.add_argument("--record", default=None, help="（可选）把所有响应录制到该 JSON 文件，供替身服务回放")
+    parser.add_argument("--cache-db", default=None,
+                        help="持久化缓存文件（sqlite），默认 cache/crawl_cache.sqlite（放在输出目录之外，"
+                             "不会被 run_pipeline.py 计入榜单目录的哈希）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用缓存，所有歌曲的统计数据都重新请求")
+    parser.add_argument("--stats-max-age", type=float, default=24.0,
+                        help="缓存的统计数据在多少小时内视为新鲜、不再请求；0 表示每次都重新验证")
+    parser.add_argument("--history-dir", default=None,
+                        help="（可选）榜单快照历史目录，每次爬取追加快照（run_pipeline.py --history-dir 用它计算趋势）")
+    parser.add_argument("--urls", choices=["y", "n"], default=None, help="是否获取歌曲播放URL（不指定则交互询问）")
+    parser.add_argument("--stats", choices=["y", "n"], default=None, help="是否获取歌曲统计数据（不指定则交互询问）")
+    parser.add_argument("--cookie", default=None, help="网易云音乐Cookie（不指定则交互询问）")
+    args = parser.parse_args()
+
+    cache_path = None if args.no_cache else args.cache_db or os.path.join('cache', 'crawl_cache.sqlite')
+    spider = CloudMusicSpider(site=args.site, output_dir=args.output_dir, record=args.record is not None,
+                              cache_path=cache_path, stats_max_age=args.stats_max_age * 3600,
+                              history_dir=args.history_dir)
 
     # 登录（可选，如果需要获取付费歌曲URL）
     # 从浏览器登录网易云音乐后，复制Cookie字符串
-    cookie_str = input("请输入网易云音乐Cookie（留空则以游客身份访问）: ").strip()
+    cookie_str = args.cookie
+    if cookie_str is None:
+        cookie_str = input("请输入网易云音乐Cookie（留空则以游客身份访问）: ").strip()
     if cookie_str:
         spider.login(cookie_str)
 
     # 是否获取歌曲URL
-    url_choice = input("是否获取歌曲播放URL？(y/N): ").strip().lower()
+    url_choice = args.urls or input("是否获取歌曲播放URL？(y/N): ").strip().lower()
     get_urls = url_choice == 'y'
 
     # 是否获取歌曲统计数据
-    stats_choice = input("是否获取歌曲统计数据（点赞、收藏、转发量）？(y/N): ").strip().lower()
+    stats_choice = args.stats or input("是否获取歌曲统计数据（点赞、收藏、转发量）？(y/N): ").strip().lower()
     get_stats = stats_choice == 'y'
 
-    spider.run_spider(get_urls=get_urls, get_stats=get_stats)
\ No newline at end of file
+    start = time.perf_counter()
+    if args.async_mode:
+        asyncio.run(spider.run_spider_async(get_urls=get_urls, get_stats=get_stats, concurrency=args.concurrency,
+                                            rate=args.rate, retries=args.retries))
+    else:
+        spider.run_spider(get_urls=get_urls, get_stats=get_stats)
+    print(f"爬取用时 {time.perf_counter() - start:.1f} 秒")
+    if spider.cache is not None:
+        counts = spider.cache.counts
+        print(f"统计数据缓存（{spider.cache.path}）: 直接复用 {counts['fresh']} 首，重新请求 {counts['fetched']} 首，"
+              f"其中 304 未修改的响应 {counts['not_modified']} 个；请求失败改用旧值 {counts['stale_fallback']} 首")
+        spider.cache.close()
+
+    if args.record:
+        spider.save_recording(args.record)
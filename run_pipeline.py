@@ -1,55 +1,248 @@
 # run_pipeline.py
 import os
+import argparse
 from src.data_loader import load_and_merge_playlists
+from src.catalog import catalog_songs, compile_catalog, load_catalog, MANIFEST_NAME
 from src.user_profiler import build_user_profiles
 from src.scorer import compute_all_scores
-from src.recommender import generate_recommendations
+from src.recommender import generate_recommendations, recommend_top_k, recommend_users_streaming
+from src.sinks import open_sink
+from src.pipeline_manifest import PipelineManifest
+from src.metrics import Metrics
+from src.history import INDEX_NAME as HISTORY_INDEX
+
+# 阶段按依赖顺序排列：后面的阶段依赖前面阶段的产出
+STAGES = ["load", "catalog", "profiles", "recommend"]
+
+
+def run_stage(manifest, metrics, forced, name, title, inputs, params, action):
+    """
+    输入文件与参数的哈希和上次一致、且产出仍在时跳过该阶段。
+
+    action() 执行阶段并返回产出文件列表；耗时、内存与计数记入 metrics 中的同名阶段。
+    """
+    print(f"\n🔄 {title}")
+    with metrics.stage(name) as record:
+        fingerprint = PipelineManifest.fingerprint(inputs, params)
+        if name not in forced and manifest.is_fresh(name, fingerprint):
+            print(f"⏭️ 输入与参数未变化，跳过阶段 {name}")
+            record["status"] = "skipped"
+            return
+        outputs = action()
+        manifest.record(name, fingerprint, outputs)
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="运行音乐推荐流水线")
+    parser.add_argument("--save-raw-scores", action="store_true",
+                        help="保存完整打分结果 raw_scores.json（体积很大，默认走融合打分直接生成 top_k）")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="融合打分阶段的并行进程数（按用户分片，歌曲特征走共享内存）")
+    parser.add_argument("--prune", action="store_true",
+                        help="融合打分使用精确剪枝：结果不变，每个用户只对可能进入 top_k 的少量歌曲打分（大曲库更快）")
+    parser.add_argument("--score-cold-users", action="store_true",
+                        help="仍对没有可用喜欢歌曲的用户打分（旧版输出）；默认这些用户直接按趋势走冷启动推荐")
+    parser.add_argument("--loader-workers", type=int, default=8,
+                        help="并行解析榜单文件夹的线程数（合并顺序固定，结果与线程数无关）")
+    parser.add_argument("--chart-precedence", choices=["update_time", "folder"], default="update_time",
+                        help="同一首歌出现在多个榜单时的合并规则：最新抓取的榜单优先 / 按文件夹名排序")
+    parser.add_argument("--history-dir", default=None,
+                        help="（可选）榜单快照历史目录：每次加载把榜单追加为快照，并用最近的多个快照计算趋势得分")
+    parser.add_argument("--history-window", type=int, default=8, help="计算多快照趋势得分时使用的最近快照数")
+    parser.add_argument("--dedupe-catalog", action="store_true",
+                        help="去重模式：all_songs.json 每首歌只存一条并带上所属榜单列表，趋势得分取各榜单的最大值")
+    parser.add_argument("--output-format", choices=["json", "ndjson"], default="json",
+                        help="打分 / 推荐结果的输出格式；ndjson 为每个用户一行，边算边写")
+    parser.add_argument("--gzip", action="store_true", help="NDJSON 输出使用 gzip 压缩")
+    parser.add_argument("--records-per-shard", type=int, default=None,
+                        help="NDJSON 输出每个分片文件的最大用户数，超过后滚动到下一个文件")
+    parser.add_argument("--stream-users", action="store_true",
+                        help="流式读取用户文件，按块完成 画像 → 打分 → 推荐，不生成 user_profiles.json")
+    parser.add_argument("--force", action="store_true", help="忽略 manifest，重新运行全部阶段")
+    parser.add_argument("--from-stage", choices=STAGES, default=None,
+                        help="从指定阶段开始强制重跑（包括其后的所有阶段）")
+    parser.add_argument("--metrics-json", default=os.path.join("output", "run_report.json"),
+                        help="各阶段耗时、CPU、峰值内存、读写字节数与计数的 JSON 运行报告")
+    parser.add_argument("--metrics-prom", default=None,
+                        help="（可选）同时写出 Prometheus 文本格式的指标文件（node_exporter textfile collector）")
+    args = parser.parse_args()
+    if args.output_format == "json" and (args.gzip or args.records_per_shard):
+        parser.error("--gzip / --records-per-shard 需要配合 --output-format ndjson 使用")
+    if args.stream_users and args.save_raw_scores:
+        parser.error("--stream-users 不支持 --save-raw-scores")
+
     # 配置路径
     INPUT_DIR = "input"
     OUTPUT_DIR = "output"
 
     PLAYLISTS_DIR = os.path.join(INPUT_DIR, "netease_playlists")
     USERS_FILE = os.path.join(INPUT_DIR, "users.json")
+    ALL_SONGS_FILE = os.path.join(OUTPUT_DIR, "all_songs.json")
+    METADATA_FILE = os.path.join(OUTPUT_DIR, "song_metadata.json")
+    CATALOG_DIR = os.path.join(OUTPUT_DIR, "catalog")
+    PROFILES_FILE = os.path.join(OUTPUT_DIR, "user_profiles.json")
+    MANIFEST_FILE = os.path.join(OUTPUT_DIR, "pipeline_manifest.json")
+
+    WEIGHTS = {
+        "num": 1.0,
+        "artist": 1.0,
+        "type": 1.0,
+        "trend": 0.8
+    }
+    TOP_K = 10
+
+    ext = ".ndjson" if args.output_format == "ndjson" else ".json"
+    RAW_SCORES_FILE = os.path.join(OUTPUT_DIR, "raw_scores" + ext)
+    RECOMMENDATIONS_FILE = os.path.join(OUTPUT_DIR, "recommendations" + ext)
+    SINK_OPTIONS = {"compress": args.gzip, "records_per_shard": args.records_per_shard}
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    print("🔄 步骤 1/4: 加载并合并榜单数据...")
-    load_and_merge_playlists(
-        playlists_dir=PLAYLISTS_DIR,
-        output_dir=OUTPUT_DIR
-    )
-
-    print("\n🔄 步骤 2/4: 构建用户画像...")
-    build_user_profiles(
-        USERS_FILE,  # ← users_input
-        os.path.join(OUTPUT_DIR, "all_songs.json"),  # ← all_songs_input
-        os.path.join(OUTPUT_DIR, "user_profiles.json")  # ← output_file
-    )
-
-    print("\n🔄 步骤 3/4: 计算歌曲推荐得分...")
-    compute_all_scores(
-        user_profiles_input=os.path.join(OUTPUT_DIR, "user_profiles.json"),   # ← 参数名已改
-        song_metadata_input=os.path.join(OUTPUT_DIR, "song_metadata.json"),
-        all_songs_input=os.path.join(OUTPUT_DIR, "all_songs.json"),
-        output_file=os.path.join(OUTPUT_DIR, "raw_scores.json"),
-        weights={
-            "num": 1.0,
-            "artist": 1.0,
-            "type": 1.0,
-            "trend": 0.8
-        }
-    )
-
-    print("\n🔄 步骤 4/4: 生成最终推荐（含冷启动处理）...")
-    generate_recommendations(
-        raw_scores_input=os.path.join(OUTPUT_DIR, "raw_scores.json"),   # ← 参数名已改
-        users_input=USERS_FILE,                                          # ← 支持路径
-        output_file=os.path.join(OUTPUT_DIR, "recommendations.json"),
-        top_k=10,
-        fallback_mode="trending"
-    )
+    manifest = PipelineManifest(MANIFEST_FILE)
+    metrics = Metrics()
+    if args.force:
+        forced = set(STAGES)
+    elif args.from_stage:
+        forced = set(STAGES[STAGES.index(args.from_stage):])
+    else:
+        forced = set()
+
+    def load_stage():
+        load_and_merge_playlists(
+            playlists_dir=PLAYLISTS_DIR,
+            output_dir=OUTPUT_DIR,
+            workers=args.loader_workers,
+            precedence=args.chart_precedence,
+            history_dir=args.history_dir,
+            history_window=args.history_window,
+            dedupe=args.dedupe_catalog,
+            metrics=metrics
+        )
+        return [ALL_SONGS_FILE, METADATA_FILE]
+
+    def catalog_stage():
+        compile_catalog(
+            song_metadata_input=METADATA_FILE,
+            all_songs_input=ALL_SONGS_FILE,
+            catalog_dir=CATALOG_DIR,
+            metrics=metrics
+        )
+        return [os.path.join(CATALOG_DIR, MANIFEST_NAME)]
+
+    def profiles_stage():
+        build_user_profiles(
+            USERS_FILE,  # ← users_input
+            catalog_songs(load_catalog(CATALOG_DIR)),  # ← all_songs_input（从二进制特征库还原，不再解析 all_songs.json）
+            PROFILES_FILE,  # ← output_file
+            metrics=metrics
+        )
+        return [PROFILES_FILE]
+
+    def recommend_stage():
+        song_features = load_catalog(CATALOG_DIR)
+
+        if args.stream_users:
+            with open_sink(RECOMMENDATIONS_FILE, **SINK_OPTIONS) as rec_sink:
+                n_users = recommend_users_streaming(
+                    users_input=USERS_FILE,
+                    all_songs_input=catalog_songs(song_features),
+                    song_features=song_features,
+                    sink=rec_sink,
+                    top_k=TOP_K,
+                    weights=WEIGHTS,
+                    fallback_mode="trending",
+                    workers=args.workers,
+                    metrics=metrics,
+                    prune=args.prune,
+                    score_cold_users=args.score_cold_users
+                )
+            print(f"   已流式处理 {n_users} 个用户")
+            return rec_sink.paths
+
+        if args.save_raw_scores:
+            print("   计算歌曲推荐得分...")
+            with open_sink(RAW_SCORES_FILE, mapping_fields=("user_id", "scores"), **SINK_OPTIONS) as raw_sink:
+                compute_all_scores(
+                    user_profiles_input=PROFILES_FILE,   # ← 参数名已改
+                    song_metadata_input=METADATA_FILE,
+                    weights=WEIGHTS,
+                    song_features=song_features,
+                    sink=raw_sink,
+                    metrics=metrics,
+                    score_cold_users=args.score_cold_users
+                )
+
+            print("   生成最终推荐（含冷启动处理）...")
+            with open_sink(RECOMMENDATIONS_FILE, **SINK_OPTIONS) as rec_sink:
+                generate_recommendations(
+                    raw_scores_input=raw_sink.paths,    # ← 分片时依次读取本次写出的所有分片
+                    users_input=USERS_FILE,             # ← 支持路径
+                    top_k=TOP_K,
+                    fallback_mode="trending",
+                    sink=rec_sink,
+                    metrics=metrics,
+                    song_features=song_features
+                )
+            return raw_sink.paths + rec_sink.paths
+
+        with open_sink(RECOMMENDATIONS_FILE, **SINK_OPTIONS) as rec_sink:
+            recommend_top_k(
+                user_profiles_input=PROFILES_FILE,
+                users_input=USERS_FILE,
+                top_k=TOP_K,
+                weights=WEIGHTS,
+                fallback_mode="trending",
+                song_features=song_features,
+                workers=args.workers,
+                sink=rec_sink,
+                metrics=metrics,
+                prune=args.prune,
+                score_cold_users=args.score_cold_users
+            )
+        return rec_sink.paths
+
+    # 无论成功与否都写出运行报告，失败的阶段标记为 failed
+    try:
+        # 快照历史也是输入（可能由爬虫追加）；加载阶段自身追加快照后，下一次运行会多重跑一次加载阶段，
+        # 产出不变，之后的阶段仍会跳过
+        load_inputs = [PLAYLISTS_DIR] + ([os.path.join(args.history_dir, HISTORY_INDEX)] if args.history_dir else [])
+        run_stage(manifest, metrics, forced, "load", "步骤 1/4: 加载并合并榜单数据...",
+                  inputs=load_inputs,
+                  params={"precedence": args.chart_precedence, "history_dir": args.history_dir,
+                          "history_window": args.history_window, "dedupe": args.dedupe_catalog},
+                  action=load_stage)
+
+        run_stage(manifest, metrics, forced, "catalog", "步骤 2/4: 编译歌曲特征库...",
+                  inputs=[METADATA_FILE, ALL_SONGS_FILE], params={}, action=catalog_stage)
+
+        if args.stream_users:
+            print("\n🔄 步骤 3/4: 构建用户画像（流式模式下与步骤 4 合并）")
+            recommend_inputs = [os.path.join(CATALOG_DIR, MANIFEST_NAME), USERS_FILE]
+        else:
+            run_stage(manifest, metrics, forced, "profiles", "步骤 3/4: 构建用户画像...",
+                      inputs=[USERS_FILE, os.path.join(CATALOG_DIR, MANIFEST_NAME)], params={}, action=profiles_stage)
+            recommend_inputs = [os.path.join(CATALOG_DIR, MANIFEST_NAME), PROFILES_FILE, USERS_FILE]
+
+        # workers / prune 只影响执行方式、不影响结果，因此不计入参数哈希
+        run_stage(manifest, metrics, forced, "recommend", "步骤 4/4: 打分并生成最终推荐（含冷启动处理）...",
+                  inputs=recommend_inputs,
+                  params={
+                      "weights": WEIGHTS,
+                      "top_k": TOP_K,
+                      "fallback_mode": "trending",
+                      "save_raw_scores": args.save_raw_scores,
+                      "stream_users": args.stream_users,
+                      "output_format": args.output_format,
+                      "gzip": args.gzip,
+                      "records_per_shard": args.records_per_shard,
+                      "score_cold_users": args.score_cold_users
+                  },
+                  action=recommend_stage)
+    finally:
+        metrics.write_json(args.metrics_json)
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
 
     print("\n🎉 推荐系统运行完成！结果已保存至:")
-    print(f"   → {os.path.join(OUTPUT_DIR, 'recommendations.json')}")
\ No newline at end of file
+    print(f"   → {RECOMMENDATIONS_FILE}{'.gz' if args.gzip else ''}")
+    print(f"   运行报告: {args.metrics_json}")
@@ -0,0 +1,76 @@
+# serve.py
+import os
+import argparse
+import signal
+import multiprocessing
+
+from src.catalog import load_catalog
+from src.cache import RecommendationCache
+from src.service import RecommendationService, create_server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动常驻内存的推荐 HTTP 服务（特征库只加载一次）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--catalog", default=os.path.join("output", "catalog"), help="编译好的特征库目录")
+    parser.add_argument("--users", default=os.path.join("input", "users.json"),
+                        help="用户文件，用于按 user_id 推荐；不存在时只支持按歌曲列表推荐")
+    parser.add_argument("--cache-size", type=int, default=4096, help="推荐结果缓存条目数，0 表示不缓存")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="缓存条目的存活秒数（默认不过期）")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="服务进程数；> 1 时各进程通过 SO_REUSEPORT 共享端口，特征库以内存映射方式共享页缓存")
+    parser.add_argument("--verbose", action="store_true", help="打印每个请求的访问日志")
+    args = parser.parse_args()
+
+    # 与 run_pipeline.py 的打分配置保持一致
+    WEIGHTS = {
+        "num": 1.0,
+        "artist": 1.0,
+        "type": 1.0,
+        "trend": 0.8
+    }
+
+    song_features = load_catalog(args.catalog)
+    service = RecommendationService(
+        song_features,
+        users_input=args.users if os.path.exists(args.users) else None,
+        weights=WEIGHTS,
+        fallback_mode="trending",
+        cache=RecommendationCache(args.cache_size, ttl=args.cache_ttl) if args.cache_size > 0 else None,
+        catalog_dir=args.catalog  # 特征库重新编译后自动重新加载
+    )
+    reuse_port = args.processes > 1
+
+    def run_server():
+        server = create_server(service, host=args.host, port=args.port, verbose=args.verbose,
+                               reuse_port=reuse_port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # SIGTERM 与 Ctrl+C 一样正常退出，确保子进程也被回收
+    signal.signal(signal.SIGTERM, stop)
+
+    health = service.health()
+    print(f"✅ 已加载 {health['n_songs']} 首歌曲、{health['n_users']} 个用户（特征库版本 {health['catalog_version'][:12]}）")
+
+    # 子进程 fork 自已加载好特征库的主进程，不再重复加载
+    workers = [
+        multiprocessing.get_context("fork").Process(target=run_server, daemon=True)
+        for _ in range(args.processes - 1)
+    ]
+    for worker in workers:
+        worker.start()
+
+    print(f"🎧 推荐服务已启动（{args.processes} 个进程）: http://{args.host}:{args.port}  (/recommend, /similar, /health)")
+    run_server()
+    for worker in workers:
+        worker.terminate()
+        worker.join()
+    print("\n👋 服务已停止")
@@ -0,0 +1,113 @@
+# src/cache.py
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterable
+
+
+class RecommendationCache:
+    """
+    有界推荐结果缓存：LRU 淘汰 + 可选 TTL，线程安全，带命中 / 未命中计数。
+
+    缓存键由 make_key 生成，包含特征库版本；一旦看到新的特征库版本，
+    旧版本的条目永远不会再命中，因此会被整体清空。
+
+    Parameters:
+        maxsize: 最多缓存的条目数，超出时淘汰最久未使用的条目
+        ttl: （可选）条目的存活秒数，None 表示不过期
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize 必须大于 0: {maxsize}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+            liked_song_ids: Iterable[Any],
+            weights: Dict[str, float],
+            top_k: int,
+            fallback_mode: str,
+            catalog_version: str
+    ) -> str:
+        """
+        规范化的缓存键：喜欢列表排序后（保留重复项，重复会影响画像均值）、
+        按键排序的权重、top_k、冷启动策略与特征库版本的 sha256。
+        """
+        payload = {
+            "liked": sorted(str(sid) for sid in liked_song_ids),
+            "weights": sorted((name, float(value)) for name, value in weights.items()),
+            "top_k": top_k,
+            "fallback_mode": fallback_mode,
+            "catalog_version": catalog_version
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def check_version(self, catalog_version: str):
+        """特征库版本变化时清空缓存。"""
+        with self._lock:
+            if catalog_version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = catalog_version
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: List[Dict[str, Any]]):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "catalog_version": self._version
+            }
@@ -0,0 +1,410 @@
+# src/catalog.py
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Dict, List, Any, Union, Optional
+
+from src.fallback import FallbackRankings, build_fallback_rankings
+from src.ids import IdIndex
+from src.metrics import Metrics
+from src.scorer import build_song_display, build_song_features, codes_incidence
+
+CATALOG_FORMAT_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+
+# 定宽数值列：列名 -> dtype
+NUMERIC_COLUMNS = {
+    "duration": np.float64,
+    "log_comments": np.float64,
+    "norm": np.float64,
+    "trend": np.float64,
+    "artist_codes": np.int32,
+    "type_codes": np.int32,
+    "comment_counts": np.int64,
+    "current_ranks": np.int32,
+    "chart_sizes": np.int32,
+    "display_artist_codes": np.int32,
+    "last_rank_codes": np.int32,
+}
+
+# 去重模式（load_and_merge_playlists(dedupe=True)）的榜单成员列：CSR 结构，
+# membership_offsets[i]:membership_offsets[i + 1] 是第 i 首歌的成员记录
+MEMBERSHIP_COLUMNS = {
+    "membership_offsets": np.int64,
+    "membership_chart_codes": np.int32,
+    "membership_sizes": np.int32,
+    "membership_current_ranks": np.int32,
+    "membership_last_rank_codes": np.int32,
+    "membership_type_codes": np.int32,
+}
+
+
+class StringTable:
+    """
+    只读字符串表：所有字符串按 UTF-8 拼接成一个 uint8 数组，offsets[i]:offsets[i + 1] 是第 i 个字符串。
+
+    两个数组都可以内存映射，按下标访问时才解码，加载时不需要解析任何字符串。
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: List[str]) -> "StringTable":
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self) -> List[str]:
+        # 一次性解码整块字节再切分，比逐个 __getitem__ 快得多
+        raw = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+
+class InternedColumn:
+    """驻留字符串列：每行只存 int32 编码，取值时查小词表。"""
+
+    def __init__(self, codes: np.ndarray, vocab: List[str]):
+        self.codes = codes
+        self.vocab = vocab
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.vocab[self.codes[index]]
+
+    def __iter__(self):
+        for code in self.codes.tolist():
+            yield self.vocab[code]
+
+    def tolist(self) -> List[str]:
+        return list(self)
+
+
+def _intern(values: List[str]) -> tuple:
+    vocab: Dict[str, int] = {}
+    codes = np.array([vocab.setdefault(v, len(vocab)) for v in values], dtype=np.int32)
+    return codes, list(vocab)
+
+
+def _vocab_list(vocab: Dict[str, int]) -> List[str]:
+    items = [""] * len(vocab)
+    for value, code in vocab.items():
+        items[code] = value
+    return items
+
+
+def _content_hash(columns: Dict[str, np.ndarray]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(columns):
+        array = np.ascontiguousarray(columns[name])
+        digest.update(name.encode("utf-8"))
+        digest.update(array.dtype.str.encode("utf-8"))
+        digest.update(str(array.shape).encode("utf-8"))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def compile_catalog(
+        song_metadata_input: Union[str, Dict[str, Any]],
+        all_songs_input: Optional[Union[str, List[Dict]]],
+        catalog_dir: str,
+        metrics: Optional[Metrics] = None
+) -> Dict[str, Any]:
+    """
+    编译歌曲特征库：把与用户无关的特征（时长、log 评论数、L2 范数、趋势得分、
+    艺人 / 类型编码）一次性算好，连同原始元数据按列保存，并写入带内容哈希的 manifest。
+
+    数值列为定宽 .npy；字符串存成驻留后的 UTF-8 字符串表（词表 + int32 编码），
+    所有文件都可以内存映射打开，可完整替代 all_songs.json / song_metadata.json。
+    元数据带榜单成员列表 charts（去重模式）时一并保存为 MEMBERSHIP_COLUMNS。
+
+    Parameters:
+        song_metadata_input: 歌曲元数据 dict 或 JSON 文件路径
+        all_songs_input: （可选）用于补充 name/artist 的歌曲列表或路径
+        catalog_dir: 输出目录（如 output/catalog）
+        metrics: （可选）指标收集器，记录 songs
+
+    Returns:
+        manifest: {format_version, content_hash, n_songs, columns}
+    """
+    if isinstance(song_metadata_input, str):
+        with open(song_metadata_input, 'r', encoding='utf-8') as f:
+            song_metadata = json.load(f)
+    else:
+        song_metadata = song_metadata_input
+
+    features = build_song_features(song_metadata, build_song_display(all_songs_input))
+    metas = [song_metadata[sid] for sid in features["song_ids"]]
+
+    display_artist_codes, display_artist_vocab = _intern(features["display_artists"])
+    memberships = [membership for meta in metas for membership in meta.get("charts", [])]
+    # last_rank 原值可能是整数或 "等于当前排名" 之类的字符串，按 JSON 文本驻留以便原样还原；
+    # 成员记录的 last_rank 与之共用词表
+    last_rank_codes, last_rank_vocab = _intern(
+        [json.dumps(meta["last_rank"], ensure_ascii=False) for meta in metas] +
+        [json.dumps(membership[3], ensure_ascii=False) for membership in memberships]
+    )
+    last_rank_codes, membership_last_rank_codes = last_rank_codes[:len(metas)], last_rank_codes[len(metas):]
+
+    columns: Dict[str, Any] = {
+        "duration": features["num"][:, 0],
+        "log_comments": features["num"][:, 1],
+        "norm": features["norm"],
+        "trend": features["trend"],
+        "artist_codes": features["artist_codes"],
+        "type_codes": features["type_codes"],
+        "comment_counts": [meta["comment_count"] for meta in metas],
+        "current_ranks": [meta["current_rank"] for meta in metas],
+        "chart_sizes": [meta["N"] for meta in metas],
+        "display_artist_codes": display_artist_codes,
+        "last_rank_codes": last_rank_codes,
+    }
+    for name, dtype in NUMERIC_COLUMNS.items():
+        columns[name] = np.ascontiguousarray(columns[name], dtype=dtype)
+
+    tables = {
+        "song_ids": StringTable.from_strings(features["song_ids"]),
+        "names": StringTable.from_strings(features["names"]),
+        "artist_vocab": StringTable.from_strings(_vocab_list(features["artist_vocab"])),
+        "type_vocab": StringTable.from_strings(_vocab_list(features["type_vocab"])),
+        "display_artist_vocab": StringTable.from_strings(display_artist_vocab),
+        "last_rank_vocab": StringTable.from_strings(last_rank_vocab),
+    }
+    if any("charts" in meta for meta in metas):
+        membership_offsets = np.zeros(len(metas) + 1, dtype=np.int64)
+        np.cumsum([len(meta.get("charts", [])) for meta in metas], out=membership_offsets[1:])
+        chart_codes, chart_vocab = _intern([str(membership[0]) for membership in memberships])
+        membership_type_codes, membership_type_vocab = _intern([membership[4] for membership in memberships])
+        columns.update({
+            "membership_offsets": membership_offsets,
+            "membership_chart_codes": chart_codes,
+            "membership_sizes": [membership[1] for membership in memberships],
+            "membership_current_ranks": [membership[2] for membership in memberships],
+            "membership_last_rank_codes": membership_last_rank_codes,
+            "membership_type_codes": membership_type_codes,
+        })
+        for name, dtype in MEMBERSHIP_COLUMNS.items():
+            columns[name] = np.ascontiguousarray(columns[name], dtype=dtype)
+        tables["chart_vocab"] = StringTable.from_strings(chart_vocab)
+        tables["membership_type_vocab"] = StringTable.from_strings(membership_type_vocab)
+
+    for name, table in tables.items():
+        columns[f"{name}.utf8"] = table.data
+        columns[f"{name}.offsets"] = table.offsets
+
+    # 冷启动排序随特征库一起保存（每个版本只算一次）；随机排列的种子取自其余各列的内容哈希，
+    # 同一份数据重新编译得到的版本号不变
+    fallback = build_fallback_rankings(features["trend"], features["type_codes"], len(features["type_names"]),
+                                       seed=int(_content_hash(columns)[:16], 16))
+    columns["fallback_trending"] = fallback.trending
+    columns["fallback_by_type"] = fallback.by_type
+    columns["fallback_by_type_offsets"] = fallback.by_type_offsets
+    columns["fallback_random"] = fallback.random
+
+    os.makedirs(catalog_dir, exist_ok=True)
+    for name, array in columns.items():
+        # 先写临时文件再原子替换：正在内存映射旧文件的进程（推荐服务）不会读到截断的数据
+        path = os.path.join(catalog_dir, f"{name}.npy")
+        with open(path + ".tmp", 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(path + ".tmp", path)
+
+    manifest = {
+        "format_version": CATALOG_FORMAT_VERSION,
+        "content_hash": _content_hash(columns),
+        "n_songs": len(features["song_ids"]),
+        "columns": {name: array.dtype.str for name, array in columns.items()}
+    }
+    # manifest 最后写入：只有列文件全部落盘后，特征库才算完整
+    manifest_path = os.path.join(catalog_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    if metrics is not None:
+        metrics.count("songs", manifest["n_songs"])
+    print(f"✅ 已编译 {manifest['n_songs']} 首歌曲的特征库到 {catalog_dir}（版本 {manifest['content_hash'][:12]}）")
+    return manifest
+
+
+def read_manifest(catalog_dir: str) -> Dict[str, Any]:
+    """读取并校验特征库 manifest。"""
+    manifest_path = os.path.join(catalog_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"找不到特征库 {manifest_path}，请先运行 compile_catalog")
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != CATALOG_FORMAT_VERSION:
+        raise ValueError(
+            f"特征库版本不兼容: {manifest.get('format_version')}，期望 {CATALOG_FORMAT_VERSION}，请重新编译"
+        )
+    return manifest
+
+
+def load_catalog(catalog_dir: str, mmap: bool = True) -> Dict[str, Any]:
+    """
+    加载已编译的特征库，返回与 build_song_features 相同结构的 song_features，
+    并附带 "version"（内容哈希）、"fallback"（预计算的冷启动排序，见 src/fallback.py）
+    和还原元数据所需的原始列（见 catalog_song_metadata）；去重模式的特征库还带 "memberships"
+    （{offsets, charts, sizes, current_ranks, last_ranks, types}，见 MEMBERSHIP_COLUMNS），否则为 None。
+
+    Parameters:
+        catalog_dir: compile_catalog 的输出目录
+        mmap: 各列是否以内存映射方式打开（多个进程可共享同一份页缓存）
+    """
+    manifest = read_manifest(catalog_dir)
+    mmap_mode = "r" if mmap else None
+
+    def load_column(name: str) -> np.ndarray:
+        array = np.load(os.path.join(catalog_dir, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+        # 以普通 ndarray 视图返回（仍由同一映射支撑），避免 np.memmap 子类在每次切片时的额外开销
+        return array.view(np.ndarray)
+
+    def load_table(name: str) -> StringTable:
+        return StringTable(load_column(f"{name}.utf8"), load_column(f"{name}.offsets"))
+
+    song_index = IdIndex(load_table("song_ids").tolist())
+    artist_vocab = load_table("artist_vocab").tolist()
+    type_vocab = load_table("type_vocab").tolist()
+    artist_codes = load_column("artist_codes")
+    type_codes = load_column("type_codes")
+    # 旧版本编译的特征库没有冷启动排序，首次使用时现场计算（见 src/fallback.py）
+    fallback = None
+    if "fallback_trending" in manifest["columns"]:
+        fallback = FallbackRankings(load_column("fallback_trending"), load_column("fallback_by_type"),
+                                    load_column("fallback_by_type_offsets"), load_column("fallback_random"))
+
+    last_rank_vocab = load_table("last_rank_vocab").tolist()
+    memberships = None
+    if "membership_offsets" in manifest["columns"]:
+        memberships = {
+            "offsets": load_column("membership_offsets"),
+            "charts": InternedColumn(load_column("membership_chart_codes"), load_table("chart_vocab").tolist()),
+            "sizes": load_column("membership_sizes"),
+            "current_ranks": load_column("membership_current_ranks"),
+            "last_ranks": InternedColumn(load_column("membership_last_rank_codes"), last_rank_vocab),
+            "types": InternedColumn(load_column("membership_type_codes"),
+                                    load_table("membership_type_vocab").tolist())
+        }
+
+    return {
+        "version": manifest["content_hash"],
+        "song_ids": song_index.ids,
+        "song_index": song_index,
+        "num": np.column_stack([load_column("duration"), load_column("log_comments")]),
+        "norm": load_column("norm"),
+        "trend": load_column("trend"),
+        "artist_codes": artist_codes,
+        "type_codes": type_codes,
+        "artist_incidence": codes_incidence(artist_codes, len(artist_vocab)),
+        "type_incidence": codes_incidence(type_codes, len(type_vocab)),
+        "artist_vocab": {value: code for code, value in enumerate(artist_vocab)},
+        "type_vocab": {value: code for code, value in enumerate(type_vocab)},
+        "artist_names": artist_vocab,
+        "type_names": type_vocab,
+        # 展示用字段按需解码，不在加载时展开
+        "names": load_table("names"),
+        "display_artists": InternedColumn(load_column("display_artist_codes"),
+                                          load_table("display_artist_vocab").tolist()),
+        "comment_counts": load_column("comment_counts"),
+        "current_ranks": load_column("current_ranks"),
+        "chart_sizes": load_column("chart_sizes"),
+        "last_ranks": InternedColumn(load_column("last_rank_codes"), last_rank_vocab),
+        "memberships": memberships,
+        "fallback": fallback
+    }
+
+
+def catalog_song_metadata(song_features: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """从 load_catalog 的结果还原与 song_metadata.json 相同的 {song_id: meta}。"""
+    duration = song_features["num"][:, 0].tolist()
+    artist_codes = song_features["artist_codes"].tolist()
+    type_codes = song_features["type_codes"].tolist()
+    comment_counts = song_features["comment_counts"].tolist()
+    current_ranks = song_features["current_ranks"].tolist()
+    chart_sizes = song_features["chart_sizes"].tolist()
+    last_ranks = [json.loads(v) for v in song_features["last_ranks"]]
+    charts = catalog_memberships(song_features)
+    trend = song_features["trend"].tolist()
+
+    song_metadata: Dict[str, Dict[str, Any]] = {}
+    for i, sid in enumerate(song_features["song_ids"]):
+        song_metadata[sid] = {
+            "N": chart_sizes[i],
+            "artist": song_features["artist_names"][artist_codes[i]],
+            "type": song_features["type_names"][type_codes[i]],
+            "duration": int(duration[i]),
+            "comment_count": comment_counts[i],
+            "current_rank": current_ranks[i],
+            "last_rank": last_ranks[i]
+        }
+        if charts is not None:
+            song_metadata[sid]["charts"] = charts[i]
+            song_metadata[sid]["trend"] = trend[i]
+    return song_metadata
+
+
+def catalog_memberships(song_features: Dict[str, Any]) -> Optional[List[List[List[Any]]]]:
+    """
+    还原每首歌的榜单成员列表（与去重模式的 charts 字段相同，每项字段见 data_loader.MEMBERSHIP_FIELDS）；
+    特征库不是去重模式编译的时返回 None。
+    """
+    memberships = song_features.get("memberships")
+    if memberships is None:
+        return None
+    offsets = memberships["offsets"].tolist()
+    rows = list(zip(
+        memberships["charts"].tolist(),
+        memberships["sizes"].tolist(),
+        memberships["current_ranks"].tolist(),
+        [json.loads(v) for v in memberships["last_ranks"]],
+        memberships["types"].tolist()
+    ))
+    return [[list(row) for row in rows[offsets[i]:offsets[i + 1]]] for i in range(len(offsets) - 1)]
+
+
+def catalog_songs(song_features: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    从 load_catalog 的结果生成每首歌一条的 all_songs 风格列表，可直接作为
+    build_user_profiles / recommend_users_streaming 的 all_songs_input。
+
+    name 取展示用歌名；artist / type / duration / comment_count 与 song_metadata 一致，
+    即与 build_song_lookup 对原始 all_songs.json "后出现者覆盖" 的结果相同；去重模式的特征库同时带上 charts。
+    """
+    song_metadata = catalog_song_metadata(song_features)
+    names = list(song_features["names"])
+    songs: List[Dict[str, Any]] = []
+    for i, (sid, meta) in enumerate(song_metadata.items()):
+        song = {
+            "id": sid,
+            "name": names[i],
+            "artist": meta["artist"],
+            "type": meta["type"],
+            "duration": meta["duration"],
+            "current_rank": meta["current_rank"],
+            "last_rank": meta["last_rank"],
+            "stats": {"comment_count": meta["comment_count"]}
+        }
+        if "charts" in meta:
+            song["charts"] = meta["charts"]
+        songs.append(song)
+    return songs
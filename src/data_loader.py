@@ -1,90 +1,223 @@
 import os
 import json
-from typing import Dict, List, Any
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Any, Optional
 
+from src.metrics import Metrics
+from src.history import ChartHistory
+from src.scorer import compute_trend_score
 
-def load_and_merge_playlists(playlists_dir: str, output_dir: str):
+# 去重模式下每首歌的榜单成员记录：[榜单 ID, 榜单长度 N, current_rank, last_rank, type]
+MEMBERSHIP_FIELDS = ("chart", "N", "current_rank", "last_rank", "type")
+
+
+def _find_chart_json(folder_path: str) -> Optional[str]:
+    # 按文件名排序，保证同一文件夹有多个 .json 时选择结果稳定
+    for file in sorted(os.listdir(folder_path)):
+        if file.endswith('.json'):
+            return os.path.join(folder_path, file)
+    return None
+
+
+def parse_chart_folder(folder_name: str, folder_path: str) -> Dict[str, Any]:
+    """
+    解析单个榜单文件夹（可在线程 / 进程池中并行执行）。
+
+    Returns:
+        {"folder", "chart_id", "file", "N", "update_time", "songs", "parse_ms", "warning"}；
+        文件无效时 songs 为空并带上 warning。
+    """
+    result: Dict[str, Any] = {
+        "folder": folder_name,
+        "chart_id": folder_name,
+        "file": None,
+        "N": None,
+        "update_time": "",
+        "songs": [],
+        "parse_ms": 0.0,
+        "warning": None
+    }
+    start = time.perf_counter()
+
+    # 在子文件夹中查找 .json 文件
+    json_file = _find_chart_json(folder_path)
+    if not json_file or not os.path.isfile(json_file):
+        result["warning"] = f"⚠️ 跳过文件夹 {folder_name}：未找到 .json 文件"
+        return result
+    result["file"] = json_file
+
+    with open(json_file, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            result["warning"] = f"⚠️ 跳过无效 JSON 文件 {json_file}: {e}"
+            return result
+
+    # 提取 playlist_info 和 songs
+    playlist_info = data.get("playlist_info")
+    if not playlist_info:
+        result["warning"] = f"⚠️ 文件 {json_file} 缺少 playlist_info，跳过"
+        return result
+
+    N = playlist_info.get("song_count")
+    if not isinstance(N, int) or N <= 0:
+        result["warning"] = f"⚠️ 文件 {json_file} 的 song_count 无效: {N}，跳过"
+        return result
+
+    songs = data.get("songs", [])
+    if not isinstance(songs, list):
+        result["warning"] = f"⚠️ 文件 {json_file} 的 songs 不是列表，跳过"
+        return result
+
+    # 处理每首歌
+    standardized_songs = []
+    for song in songs:
+        if not isinstance(song, dict):
+            continue
+        song_id = str(song.get("id"))
+        if not song_id:
+            continue
+
+        standardized_songs.append({
+            "id": song_id,
+            "name": song.get("name", ""),
+            "artist": song.get("artist", ""),
+            "type": song.get("type", ""),
+            "duration": int(song.get("duration", 0)),
+            "current_rank": int(song.get("current_rank", 0)),
+            "last_rank": song.get("last_rank"),
+            "stats": {
+                "comment_count": int(song.get("stats", {}).get("comment_count", 0))
+            }
+        })
+
+    result["N"] = N
+    result["chart_id"] = str(playlist_info.get("id") or folder_name)
+    result["update_time"] = str(playlist_info.get("update_time") or "")
+    result["songs"] = standardized_songs
+    result["parse_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _precedence_key(precedence: str):
+    """
+    榜单合并顺序（后合并的覆盖先合并的 song_metadata）：
+    - "update_time"：按榜单抓取时间从旧到新，最新的抓取结果优先；同一时间按文件夹名
+    - "folder"：按文件夹名排序
+    """
+    if precedence == "update_time":
+        return lambda chart: (chart["update_time"], chart["folder"])
+    if precedence == "folder":
+        return lambda chart: chart["folder"]
+    raise ValueError(f"未知的 precedence: {precedence}（可选 'update_time' / 'folder'）")
+
+
+def load_and_merge_playlists(
+        playlists_dir: str,
+        output_dir: str,
+        workers: int = 8,
+        executor: str = "thread",
+        precedence: str = "update_time",
+        history_dir: Optional[str] = None,
+        history_window: int = 8,
+        dedupe: bool = False,
+        metrics: Optional[Metrics] = None
+) -> List[Dict[str, Any]]:
     """
     加载所有榜单 JSON 文件，支持子文件夹结构。
 
+    各榜单并行解析，再按固定的优先级顺序合并，结果与文件系统的遍历顺序无关。
+
     参数:
         playlists_dir (str): 包含子文件夹的根目录路径（如 'netease_playlists'）
         output_dir (str): 输出中间文件的目录
+        workers (int): 并行解析的线程 / 进程数，1 表示串行
+        executor (str): "thread" 或 "process"（榜单很多、单个文件很大时进程池更快）
+        precedence (str): 同一首歌出现在多个榜单时的合并规则，见 _precedence_key
+        history_dir (str): （可选）榜单快照历史目录（见 src/history.py）。给出时每个榜单按 (榜单 ID, 抓取时间)
+            追加为快照，并用最近 history_window 个快照计算多快照趋势得分，写入元数据的 trend 字段
+        history_window (int): 计算趋势得分时使用的最近快照数
+        dedupe (bool): 去重模式。all_songs.json 每首歌只保存一条（字段取合并顺序中最后的榜单），
+            并带上按合并顺序排列的榜单成员列表 charts（每项字段见 MEMBERSHIP_FIELDS）；
+            元数据同样带上 charts，trend 取各榜单趋势得分的最大值（有历史快照的榜单用多快照趋势得分）
+        metrics (Metrics): （可选）指标收集器，记录 charts / charts_skipped / songs / chart_entries /
+            history_snapshots_added
+
+    返回:
+        每个榜单的加载报告 [{"folder", "file", "songs", "parse_ms"}]
     """
     all_songs: List[Dict[str, Any]] = []
     song_metadata: Dict[str, Dict[str, Any]] = {}
+    # 去重模式：{song_id: 最后合并的记录}（保持首次出现的顺序）与 {song_id: [(成员记录, 趋势得分)]}
+    unique_songs: Dict[str, Dict[str, Any]] = {}
+    memberships: Dict[str, List[tuple]] = {}
+    sort_key = _precedence_key(precedence)
 
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
 
     # 遍历每个子文件夹（代表一个榜单）
-    for folder_name in os.listdir(playlists_dir):
-        folder_path = os.path.join(playlists_dir, folder_name)
-        if not os.path.isdir(folder_path):
-            continue  # 跳过非文件夹
-
-        # 在子文件夹中查找 .json 文件
-        json_file = None
-        for file in os.listdir(folder_path):
-            if file.endswith('.json'):
-                json_file = os.path.join(folder_path, file)
-                break
-
-        if not json_file or not os.path.isfile(json_file):
-            print(f"⚠️ 跳过文件夹 {folder_name}：未找到 .json 文件")
-            continue
+    folders = sorted(
+        name for name in os.listdir(playlists_dir)
+        if os.path.isdir(os.path.join(playlists_dir, name))  # 跳过非文件夹
+    )
+    paths = [os.path.join(playlists_dir, name) for name in folders]
 
-        print(f"正在加载榜单: {folder_name}")
+    if workers > 1 and len(folders) > 1:
+        pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        with pool_cls(max_workers=workers) as pool:
+            charts = list(pool.map(parse_chart_folder, folders, paths))
+    else:
+        charts = [parse_chart_folder(name, path) for name, path in zip(folders, paths)]
 
-        with open(json_file, 'r', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                print(f"⚠️ 跳过无效 JSON 文件 {json_file}: {e}")
-                continue
+    history = ChartHistory(history_dir) if history_dir else None
 
-        # 提取 playlist_info 和 songs
-        playlist_info = data.get("playlist_info")
-        if not playlist_info:
-            print(f"⚠️ 文件 {json_file} 缺少 playlist_info，跳过")
+    load_report: List[Dict[str, Any]] = []
+    for chart in sorted(charts, key=sort_key):
+        if chart["warning"]:
+            print(chart["warning"])
+            if metrics is not None:
+                metrics.count("charts_skipped")
             continue
 
-        N = playlist_info.get("song_count")
-        if not isinstance(N, int) or N <= 0:
-            print(f"⚠️ 文件 {json_file} 的 song_count 无效: {N}，跳过")
-            continue
-
-        songs = data.get("songs", [])
-        if not isinstance(songs, list):
-            print(f"⚠️ 文件 {json_file} 的 songs 不是列表，跳过")
-            continue
+        print(f"正在加载榜单: {chart['folder']}（{len(chart['songs'])} 首，解析 {chart['parse_ms']:.1f} ms）")
+        load_report.append({
+            "folder": chart["folder"],
+            "file": chart["file"],
+            "songs": len(chart["songs"]),
+            "parse_ms": round(chart["parse_ms"], 3)
+        })
 
-        # 处理每首歌
-        for song in songs:
-            if not isinstance(song, dict):
-                continue
-            song_id = str(song.get("id"))
-            if not song_id:
-                continue
-
-            standardized_song = {
-                "id": song_id,
-                "name": song.get("name", ""),
-                "artist": song.get("artist", ""),
-                "type": song.get("type", ""),
-                "duration": int(song.get("duration", 0)),
-                "current_rank": int(song.get("current_rank", 0)),
-                "last_rank": song.get("last_rank"),
-                "stats": {
-                    "comment_count": int(song.get("stats", {}).get("comment_count", 0))
-                }
-            }
+        trends: Dict[str, float] = {}
+        if history is not None:
+            # 没有 update_time 的旧文件以修改时间作为抓取时间
+            crawled_at = chart["update_time"] or time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(chart["file"])))
+            if history.add_snapshot(chart["chart_id"], crawled_at, chart["N"], chart["songs"],
+                                    playlist_info={"folder": chart["folder"]}) and metrics is not None:
+                metrics.count("history_snapshots_added")
+            trends = history.trend_scores(chart["chart_id"], last_n=history_window, until=crawled_at)
 
-            all_songs.append(standardized_song)
+        for standardized_song in chart["songs"]:
+            if dedupe:
+                song_id = standardized_song["id"]
+                unique_songs[song_id] = standardized_song
+                trend = trends.get(song_id)
+                if trend is None:
+                    trend = compute_trend_score(standardized_song["current_rank"], standardized_song["last_rank"],
+                                                chart["N"])
+                memberships.setdefault(song_id, []).append((
+                    [chart["chart_id"], chart["N"], standardized_song["current_rank"],
+                     standardized_song["last_rank"], standardized_song["type"]],
+                    trend
+                ))
+            else:
+                all_songs.append(standardized_song)
 
-            # 构建元数据（后出现的会覆盖前面的）
-            song_metadata[song_id] = {
-                "N": N,
+            # 构建元数据（按合并顺序，后合并的榜单覆盖前面的）
+            song_metadata[standardized_song["id"]] = {
+                "N": chart["N"],
                 "artist": standardized_song["artist"],
                 "type": standardized_song["type"],
                 "duration": standardized_song["duration"],
@@ -92,14 +225,40 @@ def load_and_merge_playlists(playlists_dir: str, output_dir: str):
                 "current_rank": standardized_song["current_rank"],
                 "last_rank": standardized_song["last_rank"]
             }
+            # 有历史快照时使用多快照趋势得分，否则由 last_rank 计算（见 build_song_features）
+            if standardized_song["id"] in trends:
+                song_metadata[standardized_song["id"]]["trend"] = trends[standardized_song["id"]]
+
+    if history is not None:
+        history.close()
+
+    n_entries = len(all_songs)
+    if dedupe:
+        for song_id, song in unique_songs.items():
+            charts = [membership for membership, _ in memberships[song_id]]
+            all_songs.append(dict(song, charts=charts))
+            song_metadata[song_id]["charts"] = charts
+            # 多榜单的趋势得分取最大值：在任一榜单上升即视为上升
+            song_metadata[song_id]["trend"] = max(trend for _, trend in memberships[song_id])
+        n_entries = sum(len(songs) for songs in memberships.values())
 
     # 保存结果
     all_songs_path = os.path.join(output_dir, "all_songs.json")
     with open(all_songs_path, 'w', encoding='utf-8') as f:
         json.dump(all_songs, f, ensure_ascii=False, indent=2)
-    print(f"✅ 已保存 {len(all_songs)} 首歌曲到 {all_songs_path}")
+    if dedupe:
+        print(f"✅ 已保存 {len(all_songs)} 首去重后的歌曲（{n_entries} 个榜单条目）到 {all_songs_path}")
+    else:
+        print(f"✅ 已保存 {len(all_songs)} 首歌曲到 {all_songs_path}")
 
     metadata_path = os.path.join(output_dir, "song_metadata.json")
     with open(metadata_path, 'w', encoding='utf-8') as f:
         json.dump(song_metadata, f, ensure_ascii=False, indent=2)
-    print(f"✅ 已保存元数据（{len(song_metadata)} 首唯一歌曲）到 {metadata_path}")
\ No newline at end of file
+    print(f"✅ 已保存元数据（{len(song_metadata)} 首唯一歌曲）到 {metadata_path}")
+
+    if metrics is not None:
+        metrics.count("charts", len(load_report))
+        metrics.count("chart_entries", n_entries)
+        metrics.count("songs", len(song_metadata))
+
+    return load_report
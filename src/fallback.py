@@ -0,0 +1,86 @@
+# src/fallback.py
+import numpy as np
+from typing import Dict, Any, Optional
+
+FALLBACK_MODES = ("trending", "random")
+
+
+class FallbackRankings:
+    """
+    冷启动推荐的预计算排序（每个特征库版本只计算一次，编译特征库时一并保存）：
+      - trending: 全曲库按趋势得分从高到低的行号（同分按行号）
+      - by_type: 按类型分组、组内按趋势得分排序的行号，by_type_offsets[c]:by_type_offsets[c + 1] 是类型 c
+      - random: 全曲库的随机排列（随特征库版本固定）
+
+    select 只扫描排序的前 top_k + 已听数 个位置，与曲库大小无关。
+    """
+
+    def __init__(self, trending: np.ndarray, by_type: np.ndarray, by_type_offsets: np.ndarray, random: np.ndarray):
+        self.trending = trending
+        self.by_type = by_type
+        self.by_type_offsets = by_type_offsets
+        self.random = random
+
+    def order(self, fallback_mode: str, type_code: Optional[int] = None) -> np.ndarray:
+        if type_code is not None:
+            return self.by_type[self.by_type_offsets[type_code]:self.by_type_offsets[type_code + 1]]
+        if fallback_mode == "trending":
+            return self.trending
+        if fallback_mode == "random":
+            return self.random
+        raise ValueError(f"未知的 fallback_mode: {fallback_mode}（可选 {' / '.join(FALLBACK_MODES)}）")
+
+    def select(self, fallback_mode: str, top_k: int, liked_rows: np.ndarray,
+               type_code: Optional[int] = None) -> np.ndarray:
+        """
+        跳过已听歌曲后的前 top_k 个行号。
+
+        type_code 不为 None 时先取该类型内按趋势排序的歌曲，不足 top_k 时再按 fallback_mode 的全局排序补足。
+        """
+        selected = _take(self.order(fallback_mode, type_code), top_k, liked_rows)
+        if type_code is not None and len(selected) < top_k:
+            rest = _take(self.order(fallback_mode), top_k, np.concatenate([liked_rows, selected]))
+            selected = np.concatenate([selected, rest[:top_k - len(selected)]])
+        return selected
+
+
+def _take(order: np.ndarray, top_k: int, excluded_rows: np.ndarray) -> np.ndarray:
+    # 排在前 top_k + len(excluded) 个位置中最多有 len(excluded) 个被排除，剩下的至少还有 top_k 个
+    head = order[:top_k + len(excluded_rows)]
+    if len(excluded_rows):
+        head = head[~np.isin(head, excluded_rows)]
+    return head[:top_k]
+
+
+def build_fallback_rankings(
+        trend: np.ndarray,
+        type_codes: np.ndarray,
+        n_types: int,
+        seed: Optional[int] = None
+) -> FallbackRankings:
+    """
+    由趋势得分与类型编码计算冷启动排序。
+
+    Parameters:
+        seed: 随机排列的种子；编译特征库时由内容哈希导出，同一版本的随机排序固定
+    """
+    n = len(trend)
+    trending = np.argsort(-np.asarray(trend), kind="stable").astype(np.int32)
+    # 按类型稳定排序全局趋势序：每个类型组内仍保持趋势得分从高到低
+    by_type = trending[np.argsort(np.asarray(type_codes)[trending], kind="stable")]
+    offsets = np.zeros(n_types + 1, dtype=np.int64)
+    np.cumsum(np.bincount(type_codes, minlength=n_types), out=offsets[1:])
+    random = np.random.default_rng(seed).permutation(n).astype(np.int32)
+    return FallbackRankings(trending, by_type.astype(np.int32), offsets, random)
+
+
+def fallback_rankings(song_features: Dict[str, Any]) -> FallbackRankings:
+    """
+    song_features 的冷启动排序：load_catalog 已从特征库读出时直接使用，
+    否则（build_song_features 现场构建）计算一次后缓存在 song_features["fallback"] 中。
+    """
+    if song_features.get("fallback") is None:
+        song_features["fallback"] = build_fallback_rankings(
+            song_features["trend"], song_features["type_codes"], len(song_features["type_names"])
+        )
+    return song_features["fallback"]
@@ -0,0 +1,231 @@
+# src/history.py
+import os
+import re
+import gzip
+import json
+import sqlite3
+import numpy as np
+from typing import Dict, List, Any, Optional, Tuple
+
+from src.scorer import compute_trend_scores
+
+SNAPSHOT_DIR = "snapshots"
+INDEX_NAME = "index.sqlite"
+
+
+class ChartHistory:
+    """
+    榜单快照历史：只追加的压缩快照 + sqlite 排名索引。
+
+    目录结构：
+        <root>/snapshots/<chart>/<crawled_at>.json.gz   每次抓取的榜单（gzip 压缩的 JSON，写入后不再修改）
+        <root>/index.sqlite                             快照表与 (快照, 歌曲) -> 排名 的索引
+
+    以 (榜单, 抓取时间) 为键，同一快照重复写入会被忽略，因此反复加载同一批榜单文件是幂等的。
+    排名轨迹、趋势特征等查询只读索引，不需要解析旧快照；快照文件保留完整榜单，供需要时还原。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, SNAPSHOT_DIR), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, INDEX_NAME))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "id INTEGER PRIMARY KEY, chart TEXT NOT NULL, crawled_at TEXT NOT NULL, "
+                "chart_size INTEGER NOT NULL, n_songs INTEGER NOT NULL, file TEXT NOT NULL, "
+                "UNIQUE (chart, crawled_at))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ranks ("
+                "snapshot_id INTEGER NOT NULL, song_id TEXT NOT NULL, rank INTEGER NOT NULL, "
+                "PRIMARY KEY (snapshot_id, song_id)) WITHOUT ROWID"
+            )
+            # 按歌曲查轨迹：(song_id, snapshot_id) 上的覆盖索引
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ranks_by_song ON ranks (song_id, snapshot_id, rank)")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_snapshot(self, chart: str, crawled_at: str, chart_size: int, songs: List[Dict[str, Any]],
+                     playlist_info: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        追加一个榜单快照；(chart, crawled_at) 已存在时不做任何事。
+
+        Parameters:
+            chart: 榜单 ID
+            crawled_at: 抓取时间（"YYYY-MM-DD HH:MM:SS"，按字符串排序即按时间排序）
+            chart_size: 榜单长度 N
+            songs: 榜单歌曲，至少包含 id 与 current_rank
+            playlist_info: （可选）随快照一起保存的榜单信息
+
+        Returns:
+            是否新增了快照
+        """
+        chart, crawled_at = str(chart), str(crawled_at)
+        exists = self._conn.execute(
+            "SELECT 1 FROM snapshots WHERE chart = ? AND crawled_at = ?", (chart, crawled_at)
+        ).fetchone()
+        if exists:
+            return False
+
+        # 先写快照文件（临时文件 + 替换），再提交索引：索引中的快照一定有完整的文件
+        file = os.path.join(SNAPSHOT_DIR, _safe_name(chart), _safe_name(crawled_at) + ".json.gz")
+        path = os.path.join(self.root, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path + ".tmp", 'wt', encoding='utf-8') as f:
+            json.dump({"chart": chart, "crawled_at": crawled_at, "chart_size": chart_size,
+                       "playlist_info": playlist_info or {}, "songs": songs}, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+        ranks: Dict[str, int] = {}
+        for song in songs:
+            rank = int(song.get("current_rank") or 0)
+            if rank > 0:
+                # 同一首歌在榜单中出现多次时取最高排名
+                song_id = str(song["id"])
+                ranks[song_id] = min(rank, ranks.get(song_id, rank))
+
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO snapshots (chart, crawled_at, chart_size, n_songs, file) VALUES (?, ?, ?, ?, ?)",
+                (chart, crawled_at, int(chart_size), len(songs), file)
+            )
+            snapshot_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO ranks (snapshot_id, song_id, rank) VALUES (?, ?, ?)",
+                ((snapshot_id, song_id, rank) for song_id, rank in ranks.items())
+            )
+        return True
+
+    def charts(self) -> List[str]:
+        return [row[0] for row in self._conn.execute("SELECT DISTINCT chart FROM snapshots ORDER BY chart")]
+
+    def snapshots(self, chart: str, last_n: Optional[int] = None,
+                  until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        榜单的快照列表（按抓取时间从旧到新）：[{"id", "crawled_at", "chart_size", "n_songs"}]。
+
+        last_n 只取最近 N 个；until 只取抓取时间不晚于它的快照。
+        """
+        sql = "SELECT id, crawled_at, chart_size, n_songs FROM snapshots WHERE chart = ?"
+        params: List[Any] = [str(chart)]
+        if until is not None:
+            sql += " AND crawled_at <= ?"
+            params.append(str(until))
+        # LIMIT -1 表示不限
+        sql += " ORDER BY crawled_at DESC LIMIT ?"
+        params.append(last_n if last_n is not None else -1)
+        rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(("id", "crawled_at", "chart_size", "n_songs"), row)) for row in reversed(rows)]
+
+    def load_snapshot(self, chart: str, crawled_at: str) -> Optional[Dict[str, Any]]:
+        """读取完整的快照内容；不存在时返回 None。"""
+        row = self._conn.execute(
+            "SELECT file FROM snapshots WHERE chart = ? AND crawled_at = ?", (str(chart), str(crawled_at))
+        ).fetchone()
+        if row is None:
+            return None
+        with gzip.open(os.path.join(self.root, row[0]), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def trajectory(self, song_id: str, last_n: int = 10,
+                   chart: Optional[str] = None) -> Dict[str, List[Tuple[str, Optional[int]]]]:
+        """
+        歌曲在最近 last_n 个快照中的排名轨迹。
+
+        Parameters:
+            song_id: 歌曲 ID
+            last_n: 每个榜单取最近的快照数
+            chart: （可选）只查该榜单；默认查歌曲出现过的所有榜单
+
+        Returns:
+            {chart: [(crawled_at, rank), ...]}，按时间从旧到新；不在榜上的快照 rank 为 None
+        """
+        song_id = str(song_id)
+        if chart is None:
+            charts = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT s.chart FROM ranks r JOIN snapshots s ON s.id = r.snapshot_id "
+                "WHERE r.song_id = ? ORDER BY s.chart", (song_id,)
+            )]
+        else:
+            charts = [str(chart)]
+
+        result: Dict[str, List[Tuple[str, Optional[int]]]] = {}
+        for name in charts:
+            rows = self._conn.execute(
+                "SELECT s.crawled_at, r.rank FROM ("
+                "  SELECT id, crawled_at FROM snapshots WHERE chart = ? ORDER BY crawled_at DESC LIMIT ?"
+                ") s LEFT JOIN ranks r ON r.snapshot_id = s.id AND r.song_id = ? ORDER BY s.crawled_at",
+                (name, last_n, song_id)
+            ).fetchall()
+            result[name] = [(crawled_at, rank) for crawled_at, rank in rows]
+        return result
+
+    def rank_matrix(self, chart: str, last_n: int = 10,
+                    until: Optional[str] = None) -> Tuple[List[str], np.ndarray, List[str], np.ndarray]:
+        """
+        榜单最近 last_n 个快照的排名矩阵，一次查询取出，供批量计算趋势特征。
+
+        Returns:
+            (crawled_at 列表, (T,) 各快照的榜单长度, 歌曲 ID 列表, (歌曲数, T) int32 排名矩阵)；
+            歌曲为这些快照中出现过的全部歌曲，不在榜上的位置为 0
+        """
+        snapshots = self.snapshots(chart, last_n=last_n, until=until)
+        column = {snapshot["id"]: t for t, snapshot in enumerate(snapshots)}
+        rows = self._conn.execute(
+            f"SELECT snapshot_id, song_id, rank FROM ranks WHERE snapshot_id IN ({','.join('?' * len(column))})",
+            list(column)
+        ).fetchall() if column else []
+
+        song_row: Dict[str, int] = {}
+        cols = np.fromiter((column[snapshot_id] for snapshot_id, _, _ in rows), dtype=np.int64, count=len(rows))
+        song_rows = np.fromiter((song_row.setdefault(song_id, len(song_row)) for _, song_id, _ in rows),
+                                dtype=np.int64, count=len(rows))
+        ranks = np.zeros((len(song_row), len(snapshots)), dtype=np.int32)
+        ranks[song_rows, cols] = np.fromiter((rank for _, _, rank in rows), dtype=np.int32, count=len(rows))
+        return (
+            [snapshot["crawled_at"] for snapshot in snapshots],
+            np.array([snapshot["chart_size"] for snapshot in snapshots], dtype=np.int64),
+            list(song_row),
+            ranks
+        )
+
+    def trend_scores(self, chart: str, last_n: int = 8, decay: float = 0.5,
+                     until: Optional[str] = None) -> Dict[str, float]:
+        """
+        多快照趋势得分：对最近 last_n 个快照中每对相邻快照按 compute_trend_scores 计算单步得分
+        （上一快照不在榜上视为新上榜，排名不变或下降为 0），再按 decay 的幂次加权平均，越近的权重越大。
+
+        只对最新快照（不晚于 until）中在榜的歌曲给出得分；快照少于两个时返回空 dict，
+        调用方应退回榜单文件中的 last_rank。
+        """
+        _, sizes, song_ids, ranks = self.rank_matrix(chart, last_n=last_n, until=until)
+        n_steps = ranks.shape[1] - 1
+        if n_steps < 1:
+            return {}
+
+        total = np.zeros(len(song_ids), dtype=np.float64)
+        weight_sum = 0.0
+        for t in range(1, n_steps + 1):
+            weight = decay ** (n_steps - t)
+            current, previous = ranks[:, t], ranks[:, t - 1]
+            step = compute_trend_scores(current, previous, np.full(len(song_ids), sizes[t]))
+            total += weight * np.where(current > 0, step, 0.0)
+            weight_sum += weight
+
+        on_chart = ranks[:, -1] > 0
+        scores = total / weight_sum
+        return {song_id: float(scores[i]) for i, song_id in enumerate(song_ids) if on_chart[i]}
+
+
+def _safe_name(text: str) -> str:
+    # 快照文件名：只保留字母数字与 - _ .，其它字符（空格、冒号等）替换为 _
+    return re.sub(r"[^0-9A-Za-z._-]", "_", text)
@@ -0,0 +1,68 @@
+# src/ids.py
+import numpy as np
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+
+class IdIndex:
+    """
+    外部 ID（字符串）与稠密 int32 下标之间的双向字典。
+
+    ID 在进入流水线时统一转成字符串并分配下标，之后已听集合、候选数组、屏蔽掩码
+    都只处理 int32 下标，输出时再用 decode 还原成字符串。
+
+    兼容 dict 的只读接口（index[id]、id in index、index.get(id)），
+    可以直接替换原来的 {song_id: 行号} 字典。
+    """
+
+    def __init__(self, ids: Iterable[Any] = ()):
+        self._index: Dict[str, int] = {}
+        self._ids: List[str] = []
+        for external_id in ids:
+            self.add(external_id)
+
+    def add(self, external_id: Any) -> int:
+        """返回 ID 的下标，不存在时分配下一个下标。"""
+        key = str(external_id)
+        index = self._index.get(key)
+        if index is None:
+            index = len(self._ids)
+            self._index[key] = index
+            self._ids.append(key)
+        return index
+
+    def get(self, external_id: Any, default: Optional[int] = None) -> Optional[int]:
+        return self._index.get(str(external_id), default)
+
+    def __getitem__(self, external_id: Any) -> int:
+        return self._index[str(external_id)]
+
+    def __contains__(self, external_id: Any) -> bool:
+        return str(external_id) in self._index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
+
+    @property
+    def ids(self) -> List[str]:
+        """按下标排列的外部 ID 列表。"""
+        return self._ids
+
+    def encode(self, external_ids: Iterable[Any], add: bool = False) -> np.ndarray:
+        """
+        批量转换为 int32 下标数组（保持输入顺序）。
+
+        add=False 时忽略不认识的 ID（如 invalid_xxx：不在曲库中，不会被推荐，也无需屏蔽）。
+        """
+        if add:
+            indices = [self.add(external_id) for external_id in external_ids]
+        else:
+            lookup = self._index
+            indices = [lookup[key] for key in (str(external_id) for external_id in external_ids) if key in lookup]
+        return np.array(indices, dtype=np.int32)
+
+    def decode(self, indices: Iterable[int]) -> List[str]:
+        ids = self._ids
+        return [ids[i] for i in indices]
@@ -0,0 +1,368 @@
+# src/incremental.py
+import os
+import json
+import sqlite3
+from typing import Dict, List, Any, Set, Union, Optional, Iterable, Iterator
+
+from src.metrics import Metrics
+from src.recommender import recommend_top_k
+from src.sinks import NdjsonSink, existing_outputs, is_ndjson_path, iter_records, shard_paths, split_ndjson_ext
+
+
+def _song_attrs(song_features: Dict[str, Any], sid: str) -> Optional[Dict[str, Any]]:
+    """从特征库取画像所需的歌曲属性；不在曲库中的 ID（如 invalid_xxx）返回 None。"""
+    row = song_features["song_index"].get(sid)
+    if row is None:
+        return None
+    return {
+        "duration": float(song_features["num"][row, 0]),
+        "log_comment": float(song_features["num"][row, 1]),
+        "artist": song_features["artist_names"][song_features["artist_codes"][row]],
+        "type": song_features["type_names"][song_features["type_codes"][row]]
+    }
+
+
+def _empty_user_state() -> Dict[str, Any]:
+    # liked_ids: {song_id: [次数, 计入累加和时的歌曲属性（不在曲库中为 None）]}，保持喜欢的先后顺序；
+    # like / unlike 时 O(1) 查找与删除，unlike 减去的正是当初加上的属性，与特征库之后是否变化无关
+    return {
+        "liked_ids": {},
+        "sum_duration": 0.0,
+        "sum_log_comment": 0.0,
+        "count": 0,
+        "artist_counts": {},
+        "type_counts": {}
+    }
+
+
+def _add_song(user_state: Dict[str, Any], attrs: Dict[str, Any], sign: int):
+    user_state["sum_duration"] += sign * attrs["duration"]
+    user_state["sum_log_comment"] += sign * attrs["log_comment"]
+    user_state["count"] += sign
+    for field, key in (("artist_counts", "artist"), ("type_counts", "type")):
+        value = attrs[key]
+        if not value:
+            continue
+        counts = user_state[field]
+        counts[value] = counts.get(value, 0) + sign
+        if counts[value] <= 0:
+            del counts[value]
+
+
+def build_profile_state(users: Iterable[Dict], song_features: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    从用户列表构建增量画像状态：每个用户保存已听歌曲的计数与计入时的属性、数值特征的累加和与计数，
+    以及艺人 / 类型的引用计数（取消喜欢时才能正确移除）。
+    """
+    state: Dict[str, Dict[str, Any]] = {}
+    for user in users:
+        user_id = user.get("user_id")
+        if not user_id:
+            continue
+        user_state = _empty_user_state()
+        liked = user_state["liked_ids"]
+        for sid in (str(s) for s in user.get("liked_song_ids", [])):
+            entry = liked.get(sid)
+            if entry is None:
+                entry = liked[sid] = [0, _song_attrs(song_features, sid)]
+            entry[0] += 1
+            if entry[1] is not None:
+                _add_song(user_state, entry[1], +1)
+        state[user_id] = user_state
+    return state
+
+
+def rebuild_profile_state(state: Dict[str, Dict[str, Any]], song_features: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """按当前特征库从各用户的已听列表重新计算状态（特征库版本变化或导入旧格式的状态时使用）。"""
+    return build_profile_state(
+        ({"user_id": user_id, "liked_song_ids": _liked_list(user_state)} for user_id, user_state in state.items()),
+        song_features
+    )
+
+
+def apply_like_events(
+        state: Dict[str, Dict[str, Any]],
+        events: Iterable[Dict[str, Any]],
+        song_features: Dict[str, Any]
+) -> Set[str]:
+    """
+    按顺序应用 like / unlike 事件，O(事件数) 更新累加和与计数。
+
+    事件格式：{"user_id": "...", "song_id": "...", "action": "like" | "unlike"}
+    重复的 like、未喜欢过的 unlike 会被忽略。
+
+    Returns:
+        画像发生变化的用户集合
+    """
+    touched: Set[str] = set()
+
+    for event in events:
+        user_id = event.get("user_id")
+        sid = str(event.get("song_id", ""))
+        action = event.get("action")
+        if not user_id or not sid or action not in ("like", "unlike"):
+            print(f"⚠️ 跳过无效事件: {event}")
+            continue
+
+        user_state = state.setdefault(user_id, _empty_user_state())
+        liked = user_state["liked_ids"]
+
+        if action == "like":
+            if sid in liked:
+                continue
+            attrs = _song_attrs(song_features, sid)
+            liked[sid] = [1, attrs]
+            if attrs is not None:
+                _add_song(user_state, attrs, +1)
+        else:
+            entry = liked.pop(sid, None)
+            if entry is None:
+                continue
+            occurrences, attrs = entry
+            if attrs is not None:
+                _add_song(user_state, attrs, -occurrences)
+
+        touched.add(user_id)
+
+    return touched
+
+
+def _liked_list(user_state: Dict[str, Any]) -> List[str]:
+    # 展开为列表（重复喜欢的歌曲按次数重复，与 build_user_profiles 的 liked_ids 一致）
+    liked = user_state["liked_ids"]
+    if isinstance(liked, list):
+        return list(liked)  # 旧版本保存的列表
+    # 旧版本保存的 {song_id: 次数} 与当前的 {song_id: [次数, 属性]}
+    return [sid for sid, entry in liked.items() for _ in range(entry if isinstance(entry, int) else entry[0])]
+
+
+def state_to_profile(user_state: Dict[str, Any]) -> Dict[str, Any]:
+    """把增量状态转换为与 build_user_profiles 相同结构的画像。"""
+    count = user_state["count"]
+    if count <= 0:
+        return {
+            "num_vec": [0.0, 0.0],
+            "artists": [],
+            "types": [],
+            "liked_ids": []
+        }
+    return {
+        "num_vec": [user_state["sum_duration"] / count, user_state["sum_log_comment"] / count],
+        "artists": list(user_state["artist_counts"]),
+        "types": list(user_state["type_counts"]),
+        "liked_ids": _liked_list(user_state)
+    }
+
+
+def load_profile_state(state_file: str, song_features: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    读入 save_profile_state 保存的状态。文件不记录构建时的特征库版本（旧版本还没有保存歌曲属性），
+    因此按当前特征库从已听列表重新计算。
+    """
+    with open(state_file, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return rebuild_profile_state(state, song_features)
+
+
+def save_profile_state(state: Dict[str, Dict[str, Any]], state_file: str):
+    tmp_path = state_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_file)
+
+
+class ProfileStateStore:
+    """
+    增量画像状态的持久化存储：sqlite 中每个用户一行（状态为 JSON）。
+
+    每批事件只读出、写回受影响的用户，开销与事件数成正比，与用户总数无关；
+    save_profile_state 的单个 JSON 文件每次都要整体读写。
+
+    meta 表记录状态对应的输入（如 users.json 的内容哈希、特征库版本），
+    调用方据此判断状态是否需要重建（见 apply_like_events.py）。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profile_state (user_id TEXT PRIMARY KEY, state TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def is_empty(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM profile_state LIMIT 1").fetchone() is None
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def clear(self):
+        """删除全部状态与 meta（重建前调用；重建中途被打断时 meta 为空，下次仍会重建）。"""
+        with self._conn:
+            self._conn.execute("DELETE FROM profile_state")
+            self._conn.execute("DELETE FROM meta")
+
+    def iter_batches(self, batch_size: int = 10000) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """按 user_id 顺序分批读出全部状态；每批读完才返回，调用方可以边读边 put_many 写回。"""
+        last_user_id = ""
+        while True:
+            rows = self._conn.execute(
+                "SELECT user_id, state FROM profile_state WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last_user_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield {user_id: json.loads(text) for user_id, text in rows}
+            last_user_id = rows[-1][0]
+
+    def get_many(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """读出给定用户的状态 {user_id: state}；不存在的用户不在结果中。"""
+        user_ids = list(dict.fromkeys(user_ids))
+        state: Dict[str, Dict[str, Any]] = {}
+        # 每条查询的参数个数有上限（SQLITE_MAX_VARIABLE_NUMBER），分批查询
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT user_id, state FROM profile_state WHERE user_id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for user_id, text in rows:
+                state[user_id] = json.loads(text)
+        return state
+
+    def put_many(self, state: Dict[str, Dict[str, Any]]):
+        """写入（覆盖）给定用户的状态，在一个事务中提交。"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO profile_state (user_id, state) VALUES (?, ?)",
+                ((user_id, json.dumps(user_state, ensure_ascii=False)) for user_id, user_state in state.items())
+            )
+
+
+def _iter_events(events_input: Union[str, Iterable[Dict[str, Any]]]) -> Iterable[Dict[str, Any]]:
+    if isinstance(events_input, str):
+        return iter_records(events_input)
+    return events_input
+
+
+def process_like_events(
+        events_input: Union[str, Iterable[Dict[str, Any]]],
+        state: Dict[str, Dict[str, Any]],
+        song_features: Dict[str, Any],
+        top_k: int = 10,
+        weights: Optional[Dict[str, float]] = None,
+        fallback_mode: str = "trending",
+        sink: Optional[Any] = None,
+        metrics: Optional[Metrics] = None
+) -> List[Dict[str, Any]]:
+    """
+    消费 like / unlike 事件流（JSONL 文件路径或事件列表），更新画像状态，
+    并只为受影响的用户重新打分、生成推荐。传入 metrics 时同 recommend_top_k 记录计数。
+
+    Returns:
+        受影响用户的最新推荐 [{user_id, recommendations: [...]}]（传入 sink 时写入 sink）
+    """
+    touched = apply_like_events(state, _iter_events(events_input), song_features)
+    if not touched:
+        return []
+
+    user_ids = sorted(touched)
+    profiles = {uid: state_to_profile(state[uid]) for uid in user_ids}
+    users = [{"user_id": uid, "liked_song_ids": list(state[uid]["liked_ids"])} for uid in user_ids]
+
+    return recommend_top_k(
+        user_profiles_input=profiles,
+        users_input=users,
+        top_k=top_k,
+        weights=weights,
+        fallback_mode=fallback_mode,
+        song_features=song_features,
+        sink=sink,
+        metrics=metrics
+    )
+
+
+def find_recommendations_file(output_dir: str, name: str = "recommendations") -> Optional[str]:
+    """
+    最近一次写出的完整推荐：在 name.json / .ndjson / .ndjson.gz（含分片 name-00000.ndjson ...）中
+    取修改时间最新的一组，返回 iter_records / merge_recommendations 使用的路径（分片时为不带序号的路径）。
+    都不存在时返回 None。
+    """
+    newest, newest_mtime = None, None
+    for ext in (".json", ".ndjson", ".ndjson.gz"):
+        path = os.path.join(output_dir, name + ext)
+        files = existing_outputs(path)
+        if not files:
+            continue
+        mtime = max(os.path.getmtime(file_path) for file_path in files)
+        if newest_mtime is None or mtime > newest_mtime:
+            newest, newest_mtime = path, mtime
+    return newest
+
+
+def _merge_records(records: Iterable[Dict[str, Any]], updates_by_user: Dict[str, Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    # 已有用户原位替换，新用户追加到末尾（updates_by_user 会被清空）
+    for record in records:
+        yield updates_by_user.pop(record["user_id"], record)
+    yield from updates_by_user.values()
+    updates_by_user.clear()
+
+
+def merge_recommendations(recommendations_file: str, updates: List[Dict[str, Any]]):
+    """
+    把增量推荐合并回完整的推荐文件（JSON 列表、单个 NDJSON 文件或 NdjsonSink 的分片）：
+    已有用户原位替换，新用户追加到末尾。
+
+    NDJSON 逐行读写，内存只与更新数有关；JSON 列表需要整体读入。
+    recommendations_file 不存在时按分片命名规则合并所有分片：按第一个分片的记录数重新分片，
+    原有分片的边界不变，新用户接在最后一个分片之后（写满再滚动到新的分片）。
+    """
+    updates_by_user = {record["user_id"]: record for record in updates}
+
+    if is_ndjson_path(recommendations_file):
+        base, ext = split_ndjson_ext(recommendations_file)
+        tmp_path = f"{base}.tmp{ext}"
+        if os.path.exists(recommendations_file):
+            with NdjsonSink(tmp_path, compress=ext.endswith(".gz")) as sink:
+                for record in _merge_records(iter_records(recommendations_file), updates_by_user):
+                    sink.write(record)
+            os.replace(tmp_path, recommendations_file)
+            return
+
+        shards = shard_paths(recommendations_file)
+        if not shards:
+            raise FileNotFoundError(f"找不到推荐文件 {recommendations_file}")
+        records_per_shard = sum(1 for _ in iter_records([shards[0]]))
+        with NdjsonSink(tmp_path, compress=ext.endswith(".gz"), records_per_shard=records_per_shard) as sink:
+            for record in _merge_records(iter_records(shards), updates_by_user):
+                sink.write(record)
+        for index, path in enumerate(sink.paths):
+            os.replace(path, f"{base}-{index:05d}{ext}")
+        for path in shards[len(sink.paths):]:
+            os.remove(path)
+        return
+
+    with open(recommendations_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+
+    merged = list(_merge_records(records, updates_by_user))
+
+    tmp_path = recommendations_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, recommendations_file)
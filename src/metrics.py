@@ -0,0 +1,137 @@
+# src/metrics.py
+import os
+import sys
+import json
+import time
+import resource
+import contextlib
+from typing import Dict, List, Any, Optional, Iterator
+
+
+def _peak_rss_mb() -> float:
+    """本进程与已回收子进程（进程池）中较大的峰值 RSS。"""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux 单位是 KB，macOS 是字节
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def _cpu_seconds() -> float:
+    # 包含已结束的子进程（并行打分 / 解析的进程池）
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _io_bytes() -> Optional[Dict[str, int]]:
+    """本进程经由 read / write 系统调用读写的字节数（Linux /proc/self/io；其它平台返回 None）。"""
+    try:
+        with open("/proc/self/io", 'r') as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"read": int(fields["rchar"]), "written": int(fields["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class Metrics:
+    """
+    运行指标收集器：按阶段记录墙钟时间、CPU 时间、峰值 RSS、读写字节数，以及由各函数上报的计数
+    （用户数、歌曲数、打分的 用户-歌曲 对数、冷启动用户数、跳过的无效 ID 数……）。
+
+    src 中的阶段函数都接受可选的 metrics 参数，处理过程中调用 count() 累加计数，
+    计数记到当前所在的阶段；不传 metrics 时不做任何记录。
+
+    注意：峰值 RSS 是进程启动以来的最高水位，因此某阶段的值包含它之前各阶段的峰值；
+    读写字节数来自 /proc/self/io，不包含内存映射的读取与子进程的读写。
+    """
+
+    def __init__(self):
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, int] = {}  # 不在任何阶段内的计数
+        self._current: Optional[str] = None
+        self._wall_start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        """
+        记录一个阶段；产出该阶段的记录 dict，可在其中补充字段（如 status）。
+        同名阶段再次进入时时间与计数累加。
+        """
+        record = self.stages.setdefault(name, {"status": "ok", "wall_s": 0.0, "cpu_s": 0.0, "counters": {}})
+        parent, self._current = self._current, name
+        wall_start, cpu_start, io_start = time.perf_counter(), _cpu_seconds(), _io_bytes()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            self._current = parent
+            record["wall_s"] = round(record["wall_s"] + time.perf_counter() - wall_start, 4)
+            record["cpu_s"] = round(record["cpu_s"] + _cpu_seconds() - cpu_start, 4)
+            record["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+            io_end = _io_bytes()
+            if io_start is not None and io_end is not None:
+                record["bytes_read"] = record.get("bytes_read", 0) + io_end["read"] - io_start["read"]
+                record["bytes_written"] = record.get("bytes_written", 0) + io_end["written"] - io_start["written"]
+
+    def count(self, name: str, n: int = 1):
+        counters = self.stages[self._current]["counters"] if self._current is not None else self.counters
+        counters[name] = counters.get(name, 0) + int(n)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "wall_s": round(time.perf_counter() - self._wall_start, 4),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "stages": [dict(name=name, **record) for name, record in self.stages.items()],
+            "counters": self.counters
+        }
+
+    def write_json(self, path: str):
+        _write_atomic(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + "\n")
+
+    def write_prometheus(self, path: str, prefix: str = "music_pipeline"):
+        """
+        写出 Prometheus 文本格式（可由 node_exporter 的 textfile collector 采集）。
+        阶段指标带 stage 标签，计数器以 {prefix}_{name}_total 命名。
+        """
+        gauges = [
+            ("stage_wall_seconds", "wall_s", "阶段墙钟时间（秒）"),
+            ("stage_cpu_seconds", "cpu_s", "阶段 CPU 时间（秒，含子进程）"),
+            ("stage_peak_rss_bytes", "peak_rss_mb", "阶段结束时的进程峰值 RSS（字节）"),
+            ("stage_read_bytes", "bytes_read", "阶段读取的字节数"),
+            ("stage_written_bytes", "bytes_written", "阶段写入的字节数"),
+        ]
+        lines: List[str] = []
+        for metric, field, help_text in gauges:
+            samples = [(name, record[field]) for name, record in self.stages.items() if field in record]
+            if not samples:
+                continue
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} gauge")
+            for name, value in samples:
+                if field == "peak_rss_mb":
+                    value = int(value * 2 ** 20)
+                lines.append(f'{prefix}_{metric}{{stage="{name}"}} {value}')
+
+        lines.append(f"# HELP {prefix}_stage_skipped 阶段是否因输入未变化而跳过（1 = 跳过）")
+        lines.append(f"# TYPE {prefix}_stage_skipped gauge")
+        for name, record in self.stages.items():
+            lines.append(f'{prefix}_stage_skipped{{stage="{name}"}} {int(record["status"] == "skipped")}')
+
+        counter_names = sorted({c for record in self.stages.values() for c in record["counters"]})
+        for counter in counter_names:
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            for name, record in self.stages.items():
+                if counter in record["counters"]:
+                    lines.append(f'{prefix}_{counter}_total{{stage="{name}"}} {record["counters"][counter]}')
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path: str, text: str):
+    # 先写临时文件再替换：采集方不会读到写了一半的文件
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,135 @@
+# src/parallel.py
+import numpy as np
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Any, Iterable, Iterator, Tuple
+
+from src.scorer import codes_incidence, select_block_top_k, select_block_top_k_pruned
+
+# 子进程打分所需的歌曲数值列（字符串列只在主进程组装结果时使用）
+SHARED_COLUMNS = ["num", "norm", "trend", "artist_codes", "type_codes"]
+
+# 子进程内的歌曲特征（由 _init_worker 挂载共享内存后填充）
+_worker_state: Dict[str, Any] = {}
+
+
+def share_song_features(song_features: Dict[str, Any]) -> Tuple[List[SharedMemory], Dict[str, Any]]:
+    """
+    把歌曲数值列复制到共享内存。
+
+    Returns:
+        (共享内存句柄列表（由调用方负责 close/unlink）, 供子进程挂载的描述信息)
+    """
+    handles: List[SharedMemory] = []
+    spec: Dict[str, Any] = {
+        "columns": {},
+        "n_artists": len(song_features["artist_vocab"]),
+        "n_types": len(song_features["type_vocab"])
+    }
+    try:
+        for name in SHARED_COLUMNS:
+            array = np.ascontiguousarray(song_features[name])
+            shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+            handles.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            spec["columns"][name] = (shm.name, array.shape, array.dtype.str)
+    except Exception:
+        release_shared(handles)
+        raise
+    return handles, spec
+
+
+def release_shared(handles: List[SharedMemory]):
+    for shm in handles:
+        shm.close()
+        shm.unlink()
+
+
+def _init_worker(spec: Dict[str, Any]):
+    handles = []
+    features: Dict[str, Any] = {}
+    for name, (shm_name, shape, dtype) in spec["columns"].items():
+        shm = SharedMemory(name=shm_name)
+        handles.append(shm)  # 保持引用，避免映射被回收
+        features[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+    features["artist_incidence"] = codes_incidence(features["artist_codes"], spec["n_artists"])
+    features["type_incidence"] = codes_incidence(features["type_codes"], spec["n_types"])
+    _worker_state["handles"] = handles
+    _worker_state["song_features"] = features
+
+
+def _score_shard(task: Tuple[Dict[str, Any], Dict[str, float], int, bool]):
+    user_features, weights, top_k, prune = task
+    song_features = _worker_state["song_features"]
+    if prune:
+        # 剪枝排序表在每个子进程首次用到时构建，之后缓存在 song_features 中
+        return (user_features["user_ids"],) + select_block_top_k_pruned(user_features, song_features, weights, top_k)
+    rows_list, scores_list = select_block_top_k(user_features, song_features, weights, top_k)
+    return user_features["user_ids"], rows_list, scores_list, len(user_features["user_ids"]) * len(song_features["trend"])
+
+
+class ScoringPool:
+    """
+    常驻的打分进程池：歌曲特征只复制到共享内存一次，进程池只启动一次，
+    之后可以对任意多批用户分片调用 select_top_k（如 recommend_users_streaming 的每个用户块）。
+
+    用法：
+        with ScoringPool(song_features, workers) as pool:
+            for result in pool.select_top_k(user_blocks, weights, top_k):
+                ...
+    """
+
+    def __init__(self, song_features: Dict[str, Any], workers: int):
+        self.handles, spec = share_song_features(song_features)
+        try:
+            self.pool = get_context().Pool(processes=workers, initializer=_init_worker, initargs=(spec,))
+        except Exception:
+            release_shared(self.handles)
+            raise
+
+    def select_top_k(
+            self,
+            user_blocks: Iterable[Dict[str, Any]],
+            weights: Dict[str, float],
+            top_k: int,
+            prune: bool = False
+    ) -> Iterator[Tuple[List[str], List[np.ndarray], List[np.ndarray], int]]:
+        """同 select_top_k_parallel，使用已启动的进程池。"""
+        tasks = ((user_features, weights, top_k, prune) for user_features in user_blocks)
+        yield from self.pool.imap(_score_shard, tasks)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        release_shared(self.handles)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def select_top_k_parallel(
+        user_blocks: Iterable[Dict[str, Any]],
+        song_features: Dict[str, Any],
+        weights: Dict[str, float],
+        top_k: int,
+        workers: int,
+        prune: bool = False
+) -> Iterator[Tuple[List[str], List[np.ndarray], List[np.ndarray], int]]:
+    """
+    多进程版的分块 top_k 选择。
+
+    每个用户分片（build_user_features 的结果）作为一个任务分发给进程池；
+    歌曲特征只通过共享内存挂载一次，不随任务序列化。结果按输入分片顺序返回。
+
+    prune=True 时子进程使用精确剪枝打分（select_block_top_k_pruned）。
+    需要对多批用户打分时使用 ScoringPool，避免每批重新启动进程池。
+
+    Yields:
+        (user_ids, 每个用户入选的歌曲行号, 对应得分, 实际打分的 用户-歌曲 对数)
+    """
+    with ScoringPool(song_features, workers) as pool:
+        yield from pool.select_top_k(user_blocks, weights, top_k, prune)
@@ -0,0 +1,83 @@
+# src/pipeline_manifest.py
+import os
+import json
+import hashlib
+from typing import Dict, List, Any, Optional
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_path(path: str) -> Optional[str]:
+    """
+    文件取内容哈希；目录按相对路径排序后逐个文件计入（文件名与内容都参与）。
+    以 "." 开头的文件和目录（缓存、临时文件等）不参与哈希。路径不存在时返回 None。
+    """
+    if os.path.isfile(path):
+        return hash_file(path)
+    if not os.path.isdir(path):
+        return None
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(name for name in files if not name.startswith(".")):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode("utf-8"))
+            digest.update(hash_file(file_path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def hash_params(params: Dict[str, Any]) -> str:
+    encoded = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class PipelineManifest:
+    """
+    记录每个阶段上次运行时的输入哈希、参数哈希与产出文件。
+
+    manifest 文件格式：
+        {stage: {"fingerprint": {"inputs": {path: hash}, "params": hash}, "outputs": [path, ...]}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                try:
+                    self.stages = json.load(f)
+                except json.JSONDecodeError:
+                    print(f"⚠️ manifest {path} 已损坏，将重新运行全部阶段")
+                    self.stages = {}
+
+    @staticmethod
+    def fingerprint(inputs: List[str], params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "inputs": {path: hash_path(path) for path in inputs},
+            "params": hash_params(params)
+        }
+
+    def is_fresh(self, stage: str, fingerprint: Dict[str, Any]) -> bool:
+        """输入与参数均未变化，且上次的产出文件都还在。"""
+        record = self.stages.get(stage)
+        if not record or record.get("fingerprint") != fingerprint:
+            return False
+        return all(os.path.exists(path) for path in record.get("outputs", []))
+
+    def record(self, stage: str, fingerprint: Dict[str, Any], outputs: List[str]):
+        self.stages[stage] = {"fingerprint": fingerprint, "outputs": outputs}
+        self.save()
+
+    def save(self):
+        # 先写临时文件再替换，避免中途被打断留下半个 manifest
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stages, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
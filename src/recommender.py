@@ -1,93 +1,92 @@
 # src/recommender.py
 import json
-import random
-from typing import List, Dict, Any, Set, Union, Optional
+import numpy as np
+from collections import Counter, deque
+from typing import List, Dict, Any, Set, Union, Optional, Deque, Iterator, Tuple
+
+from src.cache import RecommendationCache
+from src.fallback import FallbackRankings, build_fallback_rankings, fallback_rankings
+from src.ids import IdIndex
+from src.metrics import Metrics
+from src.parallel import ScoringPool, select_top_k_parallel
+from src.user_profiler import (
+    build_liked_profile,
+    build_song_lookup,
+    iter_blocks,
+    iter_user_profiles,
+    iter_users,
+)
+from src.sinks import open_sink, is_ndjson_path, iter_records
+from src.scorer import (
+    DEFAULT_WEIGHTS,
+    build_song_display,
+    build_song_features,
+    build_user_features,
+    select_block_top_k,
+    select_block_top_k_pruned,
+)
 
 
 def generate_recommendations(
-        raw_scores_input: Union[str, Dict[str, List[Dict]]],
+        raw_scores_input: Union[str, List[str], Dict[str, List[Dict]]],
         users_input: Optional[Union[str, List[Dict]]] = None,
         all_songs_for_fallback: Optional[List[Dict]] = None,
         output_file: Optional[str] = None,
         top_k: int = 10,
-        fallback_mode: str = "trending"
+        fallback_mode: str = "trending",
+        sink: Optional[Any] = None,
+        metrics: Optional[Metrics] = None,
+        song_features: Optional[Dict[str, Any]] = None
 ) -> List[Dict[str, Any]]:
     """
     生成推荐，支持冷启动 fallback。
 
     Parameters:
-        raw_scores_input: 打分结果（文件路径 或 {user_id: [scores]} dict）
+        raw_scores_input: 打分结果（JSON / NDJSON 文件路径、输出对象的 paths 列表 或 {user_id: [scores]} dict）
         users_input: （可选）用户列表，用于保持顺序和 liked_ids（文件或 list）
         all_songs_for_fallback: （可选）用于冷启动的完整歌曲池（当 raw_scores 为空时）
-        output_file: （可选）输出 JSON 路径
+        output_file: （可选）输出路径（.ndjson / .jsonl 扩展名时逐行写出）
         top_k: 推荐数量
         fallback_mode: "trending"（按 trend_score）或 "random"
+        sink: （可选）src.sinks 中的输出对象；传入时逐用户写出，不在内存中保留（返回空列表）
+        metrics: （可选）指标收集器，记录 users / fallback_users（走冷启动 fallback 的用户）
+        song_features: （可选）打分所用的歌曲特征（load_catalog）；传入时冷启动用户取自随特征库版本
+            预计算的排序（见 src/fallback.py），否则对 raw_scores 中出现过的全部歌曲按 trend_score 现场排序
 
     Returns:
         recommendations: [{user_id, recommendations: [...]}]
     """
-    # 加载 raw_scores
-    if isinstance(raw_scores_input, str):
-        with open(raw_scores_input, 'r', encoding='utf-8') as f:
-            raw_scores = json.load(f)
-    else:
-        raw_scores = raw_scores_input
-
     # 构建 user_liked_map 和 user_order
     user_liked_map: Dict[str, Set[str]] = {}
     user_order: List[str] = []
 
+    raw_scores = _iter_raw_scores(raw_scores_input)
     if users_input is not None:
-        if isinstance(users_input, str):
-            with open(users_input, 'r', encoding='utf-8') as f:
-                users_data = json.load(f)
-            users_list = users_data.get("users", [])
-        else:
-            users_list = users_input
-
-        for user in users_list:
+        for user in iter_users(users_input):
             uid = user.get("user_id")
             if uid:
                 user_order.append(uid)
                 liked_ids = set(str(sid) for sid in user.get("liked_song_ids", []))
                 user_liked_map[uid] = liked_ids
+        user_scores = _align_raw_scores(user_order, raw_scores)
     else:
-        # 若未提供 users_input，则按 raw_scores 的 key 顺序
-        user_order = list(raw_scores.keys())
-
-    # 获取候选歌曲池（用于 fallback）
-    fallback_pool: List[Dict] = []
-    if raw_scores:
-        # 从任意用户的打分列表中提取（假设所有用户候选池相同）
-        first_user_scores = next(iter(raw_scores.values()))
-        fallback_pool = first_user_scores
-    elif all_songs_for_fallback:
-        # 如果 raw_scores 为空（如全新系统），用外部提供的歌曲池
-        fallback_pool = all_songs_for_fallback
-    else:
-        fallback_pool = []
-
-    # 对 fallback_pool 排序（仅使用 raw_scores 中已有的字段）
-    if fallback_mode == "trending":
-        # 使用 trend_score（来自 compute_all_scores）作为热度指标
-        fallback_pool = sorted(
-            fallback_pool,
-            key=lambda x: x.get("trend_score", 0),
-            reverse=True
-        )
-    elif fallback_mode == "random":
-        fallback_pool = fallback_pool.copy()
-        random.shuffle(fallback_pool)
+        # 若未提供 users_input，则按 raw_scores 的顺序
+        user_scores = raw_scores
+
+    # 获取候选歌曲池（用于 fallback）；有预计算的排序时不需要，否则在遇到第一个冷启动用户时才构建
+    fallback = fallback_rankings(song_features) if song_features is not None else None
+    fallback_pool: Optional[Tuple[List[Dict], IdIndex, FallbackRankings]] = None
 
     # 生成推荐
     recommendations: List[Dict[str, Any]] = []
+    n_users = 0
 
-    for user_id in user_order:
+    for user_id, scores in user_scores:
         liked_set = user_liked_map.get(user_id, set())
+        n_users += 1
 
-        if user_id in raw_scores and raw_scores[user_id]:
+        if scores:
             # 正常推荐
-            scores = raw_scores[user_id]
             sorted_songs = sorted(scores, key=lambda x: x["total_score"], reverse=True)
             top_songs = [s for s in sorted_songs if s["song_id"] not in liked_set][:top_k]
             rec_list = [
@@ -100,9 +99,23 @@ def generate_recommendations(
                 for song in top_songs
             ]
         else:
-            # 冷启动：从 fallback_pool 过滤已听后取 top_k
-            filtered = [s for s in fallback_pool if s["song_id"] not in liked_set]
-            selected = filtered[:top_k]
+            # 冷启动：按 fallback 排序跳过已听歌曲，取满 top_k 即停止
+            if fallback is not None:
+                rows = fallback.select(fallback_mode, top_k, song_features["song_index"].encode(liked_set))
+                selected = [
+                    {
+                        "song_id": song_features["song_ids"][i],
+                        "name": song_features["names"][i],
+                        "artist": song_features["display_artists"][i]
+                    }
+                    for i in rows.tolist()
+                ]
+            else:
+                if fallback_pool is None:
+                    fallback_pool = _build_fallback_pool(raw_scores_input, all_songs_for_fallback)
+                pool_songs, pool_index, pool_rankings = fallback_pool
+                rows = pool_rankings.select(fallback_mode, top_k, pool_index.encode(liked_set))
+                selected = [pool_songs[i] for i in rows.tolist()]
             rec_list = [
                 {
                     "song_id": song["song_id"],
@@ -112,15 +125,432 @@ def generate_recommendations(
                 }
                 for song in selected
             ]
+            if metrics is not None:
+                metrics.count("fallback_users")
 
-        recommendations.append({
+        record = {
             "user_id": user_id,
             "recommendations": rec_list
-        })
+        }
+        if sink is not None:
+            sink.write(record)
+        else:
+            recommendations.append(record)
+    if metrics is not None:
+        metrics.count("users", n_users)
 
     # 可选：保存到文件
     if output_file:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(recommendations, f, ensure_ascii=False, indent=2)
+        with open_sink(output_file) as file_sink:
+            for record in recommendations:
+                file_sink.write(record)
+
+    return recommendations
+
+
+def _iter_raw_scores(
+        raw_scores_input: Union[str, List[str], Dict[str, List[Dict]]]
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """逐用户产出 (user_id, scores)；NDJSON 输入逐行读取，不整体加载。"""
+    if isinstance(raw_scores_input, dict):
+        yield from raw_scores_input.items()
+        return
+    if isinstance(raw_scores_input, list) and len(raw_scores_input) == 1:
+        raw_scores_input = raw_scores_input[0]
+    if isinstance(raw_scores_input, list) or is_ndjson_path(raw_scores_input):
+        # 分片输出按 paths 的顺序读取，不会混入目录中其它同名前缀的文件
+        for record in iter_records(raw_scores_input):
+            yield record["user_id"], record["scores"]
+    else:
+        with open(raw_scores_input, 'r', encoding='utf-8') as f:
+            yield from json.load(f).items()
+
+
+def _align_raw_scores(
+        user_order: List[str],
+        raw_scores: Iterator[Tuple[str, List[Dict]]]
+) -> Iterator[Tuple[str, Optional[List[Dict]]]]:
+    """
+    按 user_order 产出每个用户的打分列表（没有打分结果时为 None）。
+
+    compute_all_scores 按用户顺序写出，此时逐条取用、不保留任何记录；
+    只有乱序到达或在 user_order 中重复出现的用户才暂存到 pending。
+    """
+    remaining = Counter(user_order)
+    pending: Dict[str, List[Dict]] = {}
+
+    for user_id in user_order:
+        remaining[user_id] -= 1
+        if user_id in pending:
+            scores = pending[user_id] if remaining[user_id] else pending.pop(user_id)
+            yield user_id, scores
+            continue
+
+        scores = None
+        for uid, uid_scores in raw_scores:
+            if uid == user_id:
+                scores = uid_scores
+                if remaining[user_id]:
+                    pending[user_id] = scores
+                break
+            if remaining[uid]:
+                pending[uid] = uid_scores
+        yield user_id, scores
+
+
+def _build_fallback_pool(
+        raw_scores_input: Union[str, List[str], Dict[str, List[Dict]]],
+        all_songs_for_fallback: Optional[List[Dict]]
+) -> Tuple[List[Dict], IdIndex, FallbackRankings]:
+    """
+    没有特征库时的冷启动歌曲池：raw_scores 中出现过的全部歌曲（每个用户的列表都排除了自己的已听歌曲，
+    取并集才是完整曲库）；raw_scores 为空（如全新系统）时用 all_songs_for_fallback。
+    排序与特征库的预计算排序相同（build_fallback_rankings，按 trend_score 或随机排列），只是不分类型。
+
+    Returns:
+        (歌曲列表 [{song_id, name, artist}], 歌曲 ID 到行号的 IdIndex, 冷启动排序)
+    """
+    song_index = IdIndex()
+    songs: List[Dict] = []
+    trend: List[float] = []
+
+    def add(song: Dict):
+        sid = str(song.get("song_id", song.get("id")))
+        if sid in song_index:
+            return
+        song_index.add(sid)
+        songs.append({"song_id": sid, "name": song.get("name"), "artist": song.get("artist")})
+        trend.append(song.get("trend_score", 0))
+
+    for _, scores in _iter_raw_scores(raw_scores_input):
+        for song in scores:
+            add(song)
+    if not songs:
+        for song in all_songs_for_fallback or []:
+            add(song)
+
+    rankings = build_fallback_rankings(np.asarray(trend, dtype=np.float64), np.zeros(len(songs), dtype=np.int64), 1)
+    return songs, song_index, rankings
+
+
+def _load_users_list(users_input: Union[str, List[Dict]]) -> List[Dict]:
+    if isinstance(users_input, str):
+        return list(iter_users(users_input))
+    return users_input
+
+
+def recommend_top_k(
+        user_profiles_input: Union[str, Dict[str, Any]],
+        song_metadata_input: Optional[Union[str, Dict[str, Any]]] = None,
+        users_input: Optional[Union[str, List[Dict]]] = None,
+        all_songs_input: Optional[Union[str, List[Dict]]] = None,
+        output_file: Optional[str] = None,
+        top_k: int = 10,
+        weights: Optional[Dict[str, float]] = None,
+        fallback_mode: str = "trending",
+        song_features: Optional[Dict[str, Any]] = None,
+        block_size: int = 1024,
+        fallback_type: Optional[str] = None,
+        workers: int = 1,
+        sink: Optional[Any] = None,
+        metrics: Optional[Metrics] = None,
+        prune: bool = False,
+        pool: Optional[ScoringPool] = None,
+        score_cold_users: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    打分与 top_k 选择融合：按用户分块打分、屏蔽已听歌曲后直接做部分选择，
+    不生成完整的 raw_scores。
+
+    输出与 generate_recommendations 相同；内存占用随 用户数 × top_k 增长，
+    只有入选的歌曲才会补充 name/artist 等展示字段。
+
+    Parameters:
+        user_profiles_input: 用户画像 dict 或 JSON 文件路径
+        song_metadata_input: 歌曲元数据 dict 或 JSON 文件路径（传入 song_features 时可省略）
+        users_input: （可选）用户列表，用于保持顺序和 liked_ids（文件或 list）
+        all_songs_input: （可选）用于补充 name/artist 的歌曲列表或路径
+        output_file: （可选）输出路径（.ndjson / .jsonl 扩展名时逐行写出）
+        top_k: 推荐数量
+        weights: 各项权重，默认同 compute_all_scores
+        fallback_mode: "trending"（按 trend_score）或 "random"；冷启动用户取自随特征库版本预计算的排序
+            （见 src/fallback.py），所有用户共用
+        song_features: （可选）已构建好的歌曲特征（build_song_features）
+        block_size: 每批打分的用户数（也是多进程模式下每个分片的大小）
+        fallback_type: （可选）冷启动用户（包括画像中没有可用喜欢歌曲的用户）优先推荐该类型中趋势最高的歌曲，
+            不足 top_k 时按 fallback_mode 补足
+        workers: 打分进程数；> 1 时按用户分片并行，歌曲特征通过共享内存传给子进程
+        sink: （可选）src.sinks 中的输出对象；传入时每块用户的推荐算完即写出，
+              不在内存中保留（返回空列表）
+        metrics: （可选）指标收集器，记录 users / scored_pairs / fallback_users（走冷启动 fallback 的用户）
+        prune: 使用精确剪枝打分（select_block_top_k_pruned）：结果不变，
+               每个用户只对可能进入 top_k 的一小部分歌曲打分，曲库越大收益越明显
+        pool: （可选）已启动的 ScoringPool（src/parallel.py）；传入时用它打分、忽略 workers，
+              多次调用共用同一个进程池与共享内存
+        score_cold_users: 默认画像中没有可用喜欢歌曲的用户不打分，直接走冷启动 fallback；
+              为 True 时仍对这些用户打分（旧版输出，推荐分数不是 -1.0）。指定 fallback_type 时总是走冷启动
+
+    Returns:
+        recommendations: [{user_id, recommendations: [...]}]
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+
+    if isinstance(user_profiles_input, str):
+        with open(user_profiles_input, 'r', encoding='utf-8') as f:
+            user_profiles = json.load(f)
+    else:
+        user_profiles = user_profiles_input
+
+    if song_features is None:
+        if isinstance(song_metadata_input, str):
+            with open(song_metadata_input, 'r', encoding='utf-8') as f:
+                song_metadata = json.load(f)
+        else:
+            song_metadata = song_metadata_input or {}
+        song_features = build_song_features(song_metadata, build_song_display(all_songs_input))
+
+    song_ids = song_features["song_ids"]
+    names = song_features["names"]
+    display_artists = song_features["display_artists"]
+    song_index = song_features["song_index"]
+    fallback_type_code = None
+    if fallback_type is not None:
+        if fallback_type not in song_features["type_vocab"]:
+            raise ValueError(f"未知的类型: {fallback_type}")
+        fallback_type_code = song_features["type_vocab"][fallback_type]
+
+    # 用户顺序与已听歌曲：用户 ID 转成稠密下标，已听列表转成 int32 行号数组
+    user_index = IdIndex()
+    user_liked_rows: List[np.ndarray] = []  # 按用户下标存放
+    user_order: List[int] = []
+    no_rows = np.zeros(0, dtype=np.int32)
+    if users_input is not None:
+        for user in _load_users_list(users_input):
+            uid = user.get("user_id")
+            if uid:
+                u = user_index.add(uid)
+                liked_rows = song_index.encode(user.get("liked_song_ids", []))
+                if u == len(user_liked_rows):
+                    user_liked_rows.append(liked_rows)
+                else:
+                    user_liked_rows[u] = liked_rows  # 重复的 user_id 以最后一条为准
+                user_order.append(u)
+    else:
+        for uid in user_profiles:
+            user_order.append(user_index.add(uid))
+            user_liked_rows.append(no_rows)
+
+    # 分块打分 + 部分选择：按 user_order 分块，每块只保留各用户的 top_k 行号
+    chunks: Deque[List[int]] = deque()
+
+    def iter_user_blocks():
+        for start in range(0, len(user_order), block_size):
+            chunk = user_order[start:start + block_size]
+            chunks.append(chunk)
+            block_ids = [uid for uid in user_index.decode(dict.fromkeys(chunk)) if uid in user_profiles]
+            if fallback_type_code is not None or not score_cold_users:
+                # 没有可用喜欢歌曲的用户不打分，直接走冷启动（指定了 fallback_type 时按类型）
+                block_ids = [uid for uid in block_ids if user_profiles[uid].get("liked_ids")]
+            user_features = build_user_features(block_ids, user_profiles, song_features)
+            if metrics is not None:
+                metrics.count("users", len(chunk))
+            # users_input 中的已听歌曲同样需要屏蔽
+            for u, user_id in enumerate(block_ids):
+                extra_rows = user_liked_rows[user_index[user_id]]
+                if len(extra_rows):
+                    user_features["liked_rows"][u] = np.union1d(user_features["liked_rows"][u], extra_rows)
+            yield user_features
+
+    if pool is not None:
+        block_results = pool.select_top_k(iter_user_blocks(), weights, top_k, prune)
+    elif workers > 1:
+        block_results = select_top_k_parallel(iter_user_blocks(), song_features, weights, top_k, workers, prune)
+    elif prune:
+        block_results = (
+            (user_features["user_ids"],) + select_block_top_k_pruned(user_features, song_features, weights, top_k)
+            for user_features in iter_user_blocks()
+        )
+    else:
+        block_results = (
+            (user_features["user_ids"],) + select_block_top_k(user_features, song_features, weights, top_k)
+            + (len(user_features["user_ids"]) * len(song_ids),)
+            for user_features in iter_user_blocks()
+        )
+
+    recommendations: List[Dict[str, Any]] = []
+    external_sink = sink is not None
+    if not external_sink and output_file:
+        sink = open_sink(output_file)
+
+    fallback = None
+    try:
+        for block_ids, rows_list, scores_list, n_scored in block_results:
+            if metrics is not None:
+                metrics.count("scored_pairs", n_scored)
+            top_rows = {
+                user_index[uid]: (rows.tolist(), scores.tolist())
+                for uid, rows, scores in zip(block_ids, rows_list, scores_list)
+            }
+
+            # 组装结果：正常用户取 top_k，无可推荐歌曲的用户走冷启动
+            for u in chunks.popleft():
+                rows, scores = top_rows.get(u, ([], []))
+                if rows:
+                    rec_list = [
+                        {
+                            "song_id": song_ids[i],
+                            "name": names[i],
+                            "artist": display_artists[i],
+                            "recommend_score": score
+                        }
+                        for i, score in zip(rows, scores)
+                    ]
+                else:
+                    if fallback is None:
+                        fallback = fallback_rankings(song_features)
+                    selected = fallback.select(fallback_mode, top_k, user_liked_rows[u], fallback_type_code).tolist()
+                    rec_list = [
+                        {
+                            "song_id": song_ids[i],
+                            "name": names[i],
+                            "artist": display_artists[i],
+                            "recommend_score": -1.0  # 标记为 fallback
+                        }
+                        for i in selected
+                    ]
+                    if metrics is not None:
+                        metrics.count("fallback_users")
+
+                record = {
+                    "user_id": user_index.ids[u],
+                    "recommendations": rec_list
+                }
+                if sink is not None:
+                    sink.write(record)
+                if not external_sink:
+                    recommendations.append(record)
+    finally:
+        if sink is not None and not external_sink:
+            sink.close()
+
+    return recommendations
+
+
+def recommend_for_liked(
+        liked_song_ids: List[str],
+        song_features: Dict[str, Any],
+        top_k: int = 10,
+        weights: Optional[Dict[str, float]] = None,
+        fallback_mode: str = "trending",
+        user_id: str = "web_user",
+        cache: Optional[RecommendationCache] = None,
+        fallback_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    在线请求路径：给定一组喜欢的歌曲 ID，直接基于内存中的特征库返回 top_k 推荐，
+    不读写任何文件。
+
+    Parameters:
+        cache: （可选）RecommendationCache；相同的喜欢列表、权重、top_k 与特征库版本直接返回缓存结果。
+               特征库没有版本号（build_song_features 现场构建）或 fallback_mode="random" 时不缓存
+        fallback_type: （可选）没有可用的喜欢歌曲时优先推荐该类型的热门歌曲（同 recommend_top_k）
+
+    Returns:
+        与 generate_recommendations 中单个用户相同的结构 {user_id, recommendations: [...]}
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+
+    key = None
+    catalog_version = song_features.get("version")
+    if cache is not None and catalog_version is not None and fallback_mode != "random":
+        cache.check_version(catalog_version)
+        mode = fallback_mode if fallback_type is None else f"{fallback_mode}:{fallback_type}"
+        key = cache.make_key(liked_song_ids, weights, top_k, mode, catalog_version)
+        cached = cache.get(key)
+        if cached is not None:
+            return {"user_id": user_id, "recommendations": [dict(rec) for rec in cached]}
+
+    profile = build_liked_profile(liked_song_ids, song_features)
+    result = recommend_top_k(
+        user_profiles_input={user_id: profile},
+        users_input=[{"user_id": user_id, "liked_song_ids": list(liked_song_ids)}],
+        top_k=top_k,
+        weights=weights,
+        fallback_mode=fallback_mode,
+        song_features=song_features,
+        fallback_type=fallback_type
+    )[0]
+
+    if key is not None:
+        cache.put(key, [dict(rec) for rec in result["recommendations"]])
+    return result
+
+
+def recommend_users_streaming(
+        users_input: Union[str, List[Dict]],
+        all_songs_input: Union[str, List[Dict]],
+        song_features: Dict[str, Any],
+        sink: Any,
+        top_k: int = 10,
+        weights: Optional[Dict[str, float]] = None,
+        fallback_mode: str = "trending",
+        users_per_block: int = 10000,
+        workers: int = 1,
+        profiles_sink: Optional[Any] = None,
+        metrics: Optional[Metrics] = None,
+        prune: bool = False,
+        score_cold_users: bool = False
+) -> int:
+    """
+    流式批处理：按 users_per_block 分块读取用户 → 构建画像 → 打分选 top_k → 写入 sink。
+
+    用户文件只读一遍（iter_users，兼容 {"users": [...]}、列表与 NDJSON），
+    内存占用只与块大小和 top_k 有关，与用户总数无关。
+    workers > 1 时进程池与共享内存只在开始时创建一次，所有用户块共用。
+
+    Parameters:
+        users_input: 用户文件路径或可迭代的用户记录
+        all_songs_input: 用于构建画像的歌曲列表或路径
+        song_features: 已构建好的歌曲特征（load_catalog / build_song_features）
+        sink: 推荐结果输出（src.sinks）
+        profiles_sink: （可选）同时把画像 {"user_id", ...profile} 写到该输出
+        metrics: （可选）指标收集器，记录 users / invalid_ids_skipped / cold_start_users / scored_pairs / fallback_users
+        prune: 同 recommend_top_k
+        score_cold_users: 同 recommend_top_k
+
+    Returns:
+        处理的用户记录数
+    """
+    song_dict = build_song_lookup(all_songs_input)
+    n_users = 0
+
+    pool = ScoringPool(song_features, workers) if workers > 1 else None
+    try:
+        for block in iter_blocks(iter_users(users_input), users_per_block):
+            profiles = dict(iter_user_profiles(block, song_dict, metrics))
+            if profiles_sink is not None:
+                for user_id, profile in profiles.items():
+                    profiles_sink.write(dict(user_id=user_id, **profile))
+
+            recommend_top_k(
+                user_profiles_input=profiles,
+                users_input=block,
+                top_k=top_k,
+                weights=weights,
+                fallback_mode=fallback_mode,
+                song_features=song_features,
+                workers=workers,
+                sink=sink,
+                metrics=metrics,
+                prune=prune,
+                pool=pool,
+                score_cold_users=score_cold_users
+            )
+            n_users += len(block)
+    finally:
+        if pool is not None:
+            pool.close()
 
-    return recommendations
\ No newline at end of file
+    return n_users
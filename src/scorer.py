@@ -2,8 +2,14 @@
 import json
 import math
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import Dict, List, Any, Union, Optional
+import scipy.sparse as sp
+from typing import Dict, List, Any, Union, Optional, Iterator, Tuple
+
+from src.ids import IdIndex
+from src.metrics import Metrics
+from src.sinks import open_sink
+
+DEFAULT_WEIGHTS = {"num": 1.0, "artist": 1.0, "type": 1.0, "trend": 0.8}
 
 
 def parse_last_rank(last_rank_val: Union[int, str]) -> Union[int, None]:
@@ -33,16 +39,294 @@ def compute_trend_score(current_rank: int, last_rank_raw: Union[int, str], N: in
     return score
 
 
+def compute_trend_scores(current_rank: np.ndarray, last_rank: np.ndarray, N: np.ndarray) -> np.ndarray:
+    """
+    compute_trend_score 的向量化版本。
+
+    last_rank 中用 -1 表示"无信号"（parse_last_rank 返回 None 的情况）。
+    """
+    current_rank = current_rank.astype(np.float64)
+    last_rank = last_rank.astype(np.float64)
+    N = N.astype(np.float64)
+    scores = np.zeros(len(current_rank), dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 新上榜：last_rank == 0
+        new_entry = (last_rank == 0) & (N > 0)
+        new_score = np.clip(((N + 1) - current_rank) / N, 0.0, 1.0)
+        scores[new_entry] = new_score[new_entry]
+
+        # 排名上升：last_rank > 0 且 delta > 0
+        delta = last_rank - current_rank
+        max_possible_delta = N - 1
+        rising = (last_rank > 0) & (delta > 0) & (max_possible_delta > 0)
+        rising_score = np.minimum(1.0, delta / max_possible_delta)
+        scores[rising] = rising_score[rising]
+
+    return scores
+
+
+def incidence_matrix(row_codes: List[List[int]], n_cols: int) -> sp.csr_matrix:
+    """
+    构建 one-hot（多值时为 multi-hot）关联矩阵：第 i 行在 row_codes[i] 各列上为 1。
+    """
+    indptr = np.zeros(len(row_codes) + 1, dtype=np.int64)
+    np.cumsum([len(codes) for codes in row_codes], out=indptr[1:])
+    indices = np.fromiter((c for codes in row_codes for c in codes), dtype=np.int32, count=int(indptr[-1]))
+    data = np.ones(len(indices), dtype=np.float64)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(row_codes), n_cols))
+
+
+def codes_incidence(codes: np.ndarray, n_cols: int) -> sp.csr_matrix:
+    """每行恰好一个编码时的 incidence_matrix 快捷版本（歌曲 × 艺人 / 类型）。"""
+    n = len(codes)
+    return sp.csr_matrix(
+        (np.ones(n, dtype=np.float64), np.asarray(codes, dtype=np.int32), np.arange(n + 1, dtype=np.int64)),
+        shape=(n, n_cols)
+    )
+
+
+def build_song_features(
+        song_metadata: Dict[str, Dict[str, Any]],
+        song_display: Optional[Dict[str, Dict[str, str]]] = None
+) -> Dict[str, Any]:
+    """
+    将 song_metadata 编译为按列存放的歌曲特征矩阵（与用户无关，只需构建一次）。
+
+    Returns:
+        song_features: {
+            "song_ids": [song_id, ...],
+            "song_index": IdIndex，song_id -> 行号（稠密 int32 下标）,
+            "num": (n_songs, 2) 数值特征 [duration, log(1 + comment_count)],
+            "norm": (n_songs,) 数值特征的 L2 范数,
+            "trend": (n_songs,) 趋势得分（元数据带 trend 字段时直接使用，如多快照趋势得分；否则由 last_rank 计算）,
+            "artist_codes" / "type_codes": (n_songs,) 艺人 / 类型编码,
+            "artist_incidence" / "type_incidence": 歌曲 × 艺人 / 类型 的稀疏关联矩阵,
+            "artist_vocab" / "type_vocab": {名称: 编码},
+            "artist_names" / "type_names": 按编码排列的名称列表,
+            "names" / "display_artists": 展示用歌名 / 艺人
+        }
+    """
+    song_ids = list(song_metadata.keys())
+    n = len(song_ids)
+    song_display = song_display or {}
+
+    num = np.zeros((n, 2), dtype=np.float64)
+    current_rank = np.zeros(n, dtype=np.int64)
+    last_rank = np.full(n, -1, dtype=np.int64)
+    chart_size = np.zeros(n, dtype=np.int64)
+    given_trend = np.full(n, np.nan, dtype=np.float64)
+    artist_codes = np.zeros(n, dtype=np.int32)
+    type_codes = np.zeros(n, dtype=np.int32)
+    artist_vocab: Dict[str, int] = {}
+    type_vocab: Dict[str, int] = {}
+    names: List[str] = []
+    display_artists: List[str] = []
+
+    for i, song_id in enumerate(song_ids):
+        meta = song_metadata[song_id]
+        num[i, 0] = meta["duration"]
+        num[i, 1] = math.log(1 + meta["comment_count"])
+        current_rank[i] = meta["current_rank"]
+        parsed = parse_last_rank(meta["last_rank"])
+        if parsed is not None:
+            last_rank[i] = parsed
+        chart_size[i] = meta["N"]
+        if meta.get("trend") is not None:
+            given_trend[i] = meta["trend"]
+        artist_codes[i] = artist_vocab.setdefault(meta["artist"], len(artist_vocab))
+        type_codes[i] = type_vocab.setdefault(meta["type"], len(type_vocab))
+        display = song_display.get(song_id, {})
+        names.append(display.get("name", ""))
+        display_artists.append(display.get("artist", ""))
+
+    return {
+        "song_ids": song_ids,
+        "song_index": IdIndex(song_ids),
+        "num": num,
+        "norm": np.sqrt(np.einsum("ij,ij->i", num, num)),
+        "trend": np.where(np.isnan(given_trend), compute_trend_scores(current_rank, last_rank, chart_size),
+                          given_trend),
+        "artist_codes": artist_codes,
+        "type_codes": type_codes,
+        "artist_incidence": codes_incidence(artist_codes, len(artist_vocab)),
+        "type_incidence": codes_incidence(type_codes, len(type_vocab)),
+        "artist_vocab": artist_vocab,
+        "type_vocab": type_vocab,
+        "artist_names": list(artist_vocab),
+        "type_names": list(type_vocab),
+        "names": names,
+        "display_artists": display_artists
+    }
+
+
+def build_user_features(
+        user_ids: List[str],
+        user_profiles: Dict[str, Any],
+        song_features: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    将一批用户画像转换为矩阵：数值向量、用户 × 艺人 / 类型稀疏关联矩阵与已听歌曲行号。
+
+    不在曲库词表中的艺人 / 类型不可能命中任何歌曲，直接忽略。
+    """
+    n_users = len(user_ids)
+    artist_vocab = song_features["artist_vocab"]
+    type_vocab = song_features["type_vocab"]
+    song_index = song_features["song_index"]
+
+    num = np.zeros((n_users, 2), dtype=np.float64)
+    artist_codes: List[List[int]] = []
+    type_codes: List[List[int]] = []
+    liked_rows: List[np.ndarray] = []  # 每个用户已听歌曲的 int32 行号
+
+    for u, user_id in enumerate(user_ids):
+        profile = user_profiles[user_id]
+        num[u] = profile["num_vec"]
+        artist_codes.append(sorted({artist_vocab[a] for a in profile["artists"] if a in artist_vocab}))
+        type_codes.append(sorted({type_vocab[t] for t in profile["types"] if t in type_vocab}))
+        liked_rows.append(song_index.encode(profile["liked_ids"]))
+
+    return {
+        "user_ids": user_ids,
+        "num": num,
+        "norm": np.sqrt(np.einsum("ij,ij->i", num, num)),
+        "artist_incidence": incidence_matrix(artist_codes, len(artist_vocab)),
+        "type_incidence": incidence_matrix(type_codes, len(type_vocab)),
+        "liked_rows": liked_rows
+    }
+
+
+def _normalize_rows(matrix: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化；零向量保持为零（与 sklearn cosine_similarity 行为一致）。"""
+    safe = np.where(norms == 0.0, 1.0, norms)
+    return matrix / safe[:, None]
+
+
+def _num_similarity(user_unit: np.ndarray, song_unit: np.ndarray) -> np.ndarray:
+    """
+    (n_users, n_songs) 数值特征余弦相似度（输入已按行归一化）。
+
+    逐列相乘再相加而不用矩阵乘法：BLAS 会按矩阵形状选择不同的累加方式，
+    逐元素计算则保证无论一次算多少用户、多少首歌，同一对的结果都逐位相同
+    （剪枝模式只对部分歌曲打分，必须与穷举打分完全一致）。
+    """
+    sim = user_unit[:, 0:1] * song_unit[:, 0]
+    for j in range(1, user_unit.shape[1]):
+        sim += user_unit[:, j:j + 1] * song_unit[:, j]
+    return sim
+
+
+def _match_matrix(user_incidence: sp.csr_matrix, song_incidence: sp.csr_matrix) -> np.ndarray:
+    """(n_users, n_songs) 0/1 矩阵：歌曲的任一艺人 / 类型出现在用户偏好中即为 1。"""
+    if user_incidence.shape[0] == 1:
+        # 单个用户（在线请求）：直接在歌曲关联矩阵的非零元上查找，避开稀疏矩阵乘法的固定开销
+        hit = np.isin(song_incidence.indices, user_incidence.indices)
+        counts = np.concatenate(([0], np.cumsum(hit)))
+        indptr = song_incidence.indptr
+        return (counts[indptr[1:]] > counts[indptr[:-1]]).astype(np.float64)[None, :]
+    hits = (user_incidence @ song_incidence.T).toarray()
+    return (hits > 0).astype(np.float64)
+
+
+def score_user_block(
+        user_features: Dict[str, Any],
+        song_features: Dict[str, Any],
+        weights: Dict[str, float]
+) -> Dict[str, np.ndarray]:
+    """
+    对一批用户 × 全部歌曲批量打分。
+
+    Returns:
+        {"num_sim", "artist_sim", "type_sim", "total": (n_users, n_songs), "trend": (n_songs,)}
+    """
+    user_unit = _normalize_rows(user_features["num"], user_features["norm"])
+    song_unit = _normalize_rows(song_features["num"], song_features["norm"])
+    num_sim = _num_similarity(user_unit, song_unit)
+
+    # 用户 × 艺人 与 歌曲 × 艺人 关联矩阵相乘，一次得到整块用户的匹配矩阵
+    artist_sim = _match_matrix(user_features["artist_incidence"], song_features["artist_incidence"])
+    type_sim = _match_matrix(user_features["type_incidence"], song_features["type_incidence"])
+    trend = song_features["trend"]
+
+    total = (
+            weights["num"] * num_sim +
+            weights["artist"] * artist_sim +
+            weights["type"] * type_sim +
+            weights["trend"] * trend
+    )
+
+    return {
+        "num_sim": num_sim,
+        "artist_sim": artist_sim,
+        "type_sim": type_sim,
+        "trend": trend,
+        "total": total
+    }
+
+
+def iter_score_blocks(
+        user_profiles: Dict[str, Any],
+        song_features: Dict[str, Any],
+        weights: Optional[Dict[str, float]] = None,
+        block_size: int = 1024
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+    """
+    按用户分块计算打分矩阵，每块内存占用为 block_size × n_songs。
+
+    Yields:
+        (user_features, block_scores)
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+
+    user_ids = list(user_profiles.keys())
+    for start in range(0, len(user_ids), block_size):
+        block_ids = user_ids[start:start + block_size]
+        user_features = build_user_features(block_ids, user_profiles, song_features)
+        yield user_features, score_user_block(user_features, song_features, weights)
+
+
+def _load_json_input(data_input: Union[str, Any]) -> Any:
+    if isinstance(data_input, str):
+        with open(data_input, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return data_input
+
+
+def build_song_display(all_songs_input: Optional[Union[str, List[Dict]]]) -> Dict[str, Dict[str, str]]:
+    """从 all_songs 构建 {song_id: {name, artist}}（同一首歌取首次出现的记录）。"""
+    song_display: Dict[str, Dict[str, str]] = {}
+    if all_songs_input is None:
+        return song_display
+
+    for song in _load_json_input(all_songs_input):
+        sid = str(song["id"])
+        if sid not in song_display:
+            song_display[sid] = {
+                "name": song.get("name", ""),
+                "artist": song.get("artist", "")
+            }
+    return song_display
+
+
 def compute_all_scores(
         user_profiles_input: Union[str, Dict[str, Any]],
         song_metadata_input: Union[str, Dict[str, Any]],
         all_songs_input: Optional[Union[str, List[Dict]]] = None,
         output_file: Optional[str] = None,
-        weights: Optional[Dict[str, float]] = None
+        weights: Optional[Dict[str, float]] = None,
+        song_features: Optional[Dict[str, Any]] = None,
+        block_size: int = 1024,
+        sink: Optional[Any] = None,
+        metrics: Optional[Metrics] = None,
+        score_cold_users: bool = False
 ) -> Dict[str, List[Dict]]:
     """
     为每个用户-歌曲对计算推荐分数。
 
+    内部使用矩阵引擎（iter_score_blocks）批量计算，返回值为兼容旧接口的 dict 视图。
+
     支持两种调用方式：
     - 文件模式：传入路径（用于 CLI）
     - 内存模式：传入 Python 对象（用于 Web UI）
@@ -51,101 +335,361 @@ def compute_all_scores(
         user_profiles_input: 用户画像 dict 或 JSON 文件路径
         song_metadata_input: 歌曲元数据 dict 或 JSON 文件路径
         all_songs_input: （可选）用于补充 name/artist 的歌曲列表或路径
-        output_file: （可选）保存原始打分结果的路径
+        output_file: （可选）保存原始打分结果的路径（.ndjson / .jsonl 扩展名时逐行写出）
         weights: 各项权重，默认 {"num": 1.0, "artist": 1.0, "type": 1.0, "trend": 0.8}
+        song_features: （可选）已构建好的歌曲特征（build_song_features），传入时忽略 song_metadata_input
+        block_size: 每批打分的用户数
+        sink: （可选）src.sinks 中的输出对象；传入时每个用户的结果
+              {"user_id", "scores"} 算完即写出，不在内存中保留（返回空 dict）
+        metrics: （可选）指标收集器，记录 scored_pairs（用户数由后续的 generate_recommendations 记录）
+        score_cold_users: 默认画像中没有可用喜欢歌曲的用户不打分，输出空列表
+              （generate_recommendations 对其走冷启动 fallback）；为 True 时仍对其打分（旧版输出）
 
     Returns:
         raw_scores: {user_id: [候选歌曲打分列表]}
     """
     if weights is None:
-        weights = {"num": 1.0, "artist": 1.0, "type": 1.0, "trend": 0.8}
+        weights = DEFAULT_WEIGHTS
 
-    # 加载 user_profiles
-    if isinstance(user_profiles_input, str):
-        with open(user_profiles_input, 'r', encoding='utf-8') as f:
-            user_profiles = json.load(f)
-    else:
-        user_profiles = user_profiles_input
+    user_profiles = _load_json_input(user_profiles_input)
 
-    # 加载 song_metadata
-    if isinstance(song_metadata_input, str):
-        with open(song_metadata_input, 'r', encoding='utf-8') as f:
-            song_metadata = json.load(f)
-    else:
-        song_metadata = song_metadata_input
-
-    # 构建 song_display（用于可读性）
-    song_display = {}
-    if all_songs_input is not None:
-        if isinstance(all_songs_input, str):
-            with open(all_songs_input, 'r', encoding='utf-8') as f:
-                all_songs = json.load(f)
-        else:
-            all_songs = all_songs_input
-
-        for song in all_songs:
-            sid = str(song["id"])
-            if sid not in song_display:
-                song_display[sid] = {
-                    "name": song.get("name", ""),
-                    "artist": song.get("artist", "")
-                }
+    if song_features is None:
+        song_metadata = _load_json_input(song_metadata_input)
+        song_features = build_song_features(song_metadata, build_song_display(all_songs_input))
 
     raw_scores: Dict[str, List[Dict]] = {}
+    external_sink = sink is not None
+    if not external_sink and output_file:
+        sink = open_sink(output_file, mapping_fields=("user_id", "scores"))
+
+    try:
+        _write_score_blocks(
+            user_profiles, song_features, weights, block_size,
+            sink, None if external_sink else raw_scores, metrics, score_cold_users
+        )
+    finally:
+        if sink is not None and not external_sink:
+            sink.close()
+
+    return raw_scores
+
+
+def _write_score_blocks(
+        user_profiles: Dict[str, Any],
+        song_features: Dict[str, Any],
+        weights: Dict[str, float],
+        block_size: int,
+        sink: Optional[Any],
+        raw_scores: Optional[Dict[str, List[Dict]]],
+        metrics: Optional[Metrics] = None,
+        score_cold_users: bool = False
+):
+    song_ids = song_features["song_ids"]
+    # 特征库中的展示字段是按需解码的字符串表，逐首歌输出前先整体展开
+    names = list(song_features["names"])
+    display_artists = list(song_features["display_artists"])
+
+    def write(user_id: str, scores: List[Dict]):
+        if sink is not None:
+            sink.write({"user_id": user_id, "scores": scores})
+        if raw_scores is not None:
+            raw_scores[user_id] = scores
+
+    # 冷启动用户不参与打分，按原顺序在相邻的已打分用户之间写出空列表
+    user_order = iter(user_profiles)
+    scored_profiles = user_profiles
+    if not score_cold_users:
+        scored_profiles = {uid: profile for uid, profile in user_profiles.items() if profile.get("liked_ids")}
+
+    for user_features, block in iter_score_blocks(scored_profiles, song_features, weights, block_size):
+        if metrics is not None:
+            metrics.count("scored_pairs", len(user_features["user_ids"]) * len(song_ids))
+        num_sim = np.round(block["num_sim"], 4).tolist()
+        total = np.round(block["total"], 4).tolist()
+        artist_sim = block["artist_sim"].tolist()
+        type_sim = block["type_sim"].tolist()
+        trend = np.round(block["trend"], 4).tolist()
+
+        candidates = np.ones(len(song_ids), dtype=bool)
+        for u, user_id in enumerate(user_features["user_ids"]):
+            # 已听歌曲用布尔掩码屏蔽，剩下的行号按顺序输出
+            candidates[user_features["liked_rows"][u]] = False
+            scores = [
+                {
+                    "song_id": song_ids[i],
+                    "name": names[i],
+                    "artist": display_artists[i],
+                    "num_sim": num_sim[u][i],
+                    "artist_sim": artist_sim[u][i],
+                    "type_sim": type_sim[u][i],
+                    "trend_score": trend[i],
+                    "total_score": total[u][i]
+                }
+                for i in np.flatnonzero(candidates).tolist()
+            ]
+            candidates[user_features["liked_rows"][u]] = True
+            for uid in user_order:
+                if uid == user_id:
+                    break
+                write(uid, [])
+            write(user_id, scores)
+    for uid in user_order:
+        write(uid, [])
+
+
+def select_top_k(scores: np.ndarray, k: int) -> List[np.ndarray]:
+    """
+    按行选出得分最高的 k 个列号（得分降序，同分按列号升序，与稳定排序一致）。
+
+    先用 argpartition 找出第 k 大的分数作为门槛，再只对不低于门槛的候选排序，
+    无需对整行做全排序。值为 -inf 的位置（已屏蔽的歌曲）不会被选中。
+    """
+    n_rows, n_cols = scores.shape
+    k = min(k, n_cols)
+    if k <= 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(n_rows)]
+
+    if k < n_cols:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        kth = scores[np.arange(n_rows)[:, None], part].min(axis=1)
+    else:
+        kth = scores.min(axis=1)
+
+    selected: List[np.ndarray] = []
+    for u in range(n_rows):
+        row = scores[u]
+        candidates = np.flatnonzero((row >= kth[u]) & (row > -np.inf))
+        order = np.lexsort((candidates, -row[candidates]))
+        selected.append(candidates[order][:k])
+    return selected
+
+
+def select_block_top_k(
+        user_features: Dict[str, Any],
+        song_features: Dict[str, Any],
+        weights: Dict[str, float],
+        k: int
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    对一批用户打分、屏蔽 liked_rows 后选出 top_k。
+
+    Returns:
+        (每个用户入选的歌曲行号, 对应的 total_score（已保留 4 位小数）)
+    """
+    total = np.round(score_user_block(user_features, song_features, weights)["total"], 4)
+    for u, rows in enumerate(user_features["liked_rows"]):
+        total[u, rows] = -np.inf
+
+    selected = select_top_k(total, k)
+    return selected, [total[u, rows] for u, rows in enumerate(selected)]
+
+
+def build_pruning_index(song_features: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    剪枝打分（select_block_top_k_pruned）用的歌曲排序表，与用户无关，每个特征库只需构建一次。
+
+    按类型分组，每组两张表：按 trend 降序的行号、按数值特征夹角排序的行号。
+    数值特征非负时所有向量落在第一象限，余弦相似度随夹角差单调递减，
+    因此从用户的夹角位置向两侧扫描即可得到未扫描歌曲 num_sim 的上界。
+    数值特征不是二维或出现负值时返回 None（调用方退回穷举打分）。
+    """
+    num = song_features["num"]
+    if num.shape[1] != 2 or (len(num) and num.min() < 0):
+        return None
+
+    norm = song_features["norm"]
+    trend = song_features["trend"]
+    type_codes = song_features["type_codes"]
+    angle = np.arctan2(num[:, 1], num[:, 0])
+    nonzero = norm > 0
+
+    groups: List[Dict[str, np.ndarray]] = []
+    by_type = np.argsort(type_codes, kind="stable")
+    counts = np.bincount(type_codes, minlength=song_features["type_incidence"].shape[1])
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    for c in range(len(counts)):
+        rows = by_type[offsets[c]:offsets[c + 1]]
+        by_angle = rows[nonzero[rows]]
+        by_angle = by_angle[np.argsort(angle[by_angle], kind="stable")]
+        groups.append({
+            "by_trend": rows[np.argsort(-trend[rows], kind="stable")],
+            "by_angle": by_angle,
+            "angles": angle[by_angle]
+        })
+
+    artist_csc = song_features["artist_incidence"].tocsc()
+    return {
+        "song_unit": _normalize_rows(num, norm),
+        "groups": groups,
+        # 零向量歌曲的 num_sim 恒为 0，不在夹角表中，始终直接打分
+        "zero_norm": np.flatnonzero(~nonzero),
+        "artist_indptr": artist_csc.indptr,
+        "artist_rows": artist_csc.indices
+    }
+
+
+def _pruned_user_top_k(
+        unit: np.ndarray,
+        artists: np.ndarray,
+        types: np.ndarray,
+        liked_rows: np.ndarray,
+        song_features: Dict[str, Any],
+        index: Dict[str, Any],
+        weights: Dict[str, float],
+        k: int,
+        seen: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    阈值算法：先给偏好艺人的全部歌曲打分，再在各类型组内交替沿 trend 表与夹角表扫描，
+    直到任何未扫描歌曲的得分上界都低于当前第 k 名为止。
+
+    seen 为 n_songs 的布尔工作区（调用方提供，返回前恢复为全 False）。
+    """
+    trend = song_features["trend"]
+    artist_codes = song_features["artist_codes"]
+    type_codes = song_features["type_codes"]
+    song_unit = index["song_unit"]
+    groups = index["groups"]
+    w_num, w_artist, w_type, w_trend = weights["num"], weights["artist"], weights["type"], weights["trend"]
+
+    touched = [liked_rows]
+    seen[liked_rows] = True  # 已听歌曲不参与排名，视为已扫描
+    top_rows = np.zeros(0, dtype=np.int64)
+    top_scores = np.zeros(0, dtype=np.float64)
+    kth = -np.inf
+    n_scored = 0
+
+    # 用户偏好的艺人 / 类型编码 -> 布尔查找表
+    artist_hit = np.zeros(index["artist_indptr"].shape[0] - 1, dtype=bool)
+    artist_hit[artists] = True
+    type_hit = np.zeros(len(groups), dtype=bool)
+    type_hit[types] = True
+
+    def score(rows: np.ndarray):
+        """给 rows 中尚未扫描的歌曲打分（rows 内部不能有重复）。"""
+        nonlocal top_rows, top_scores, kth, n_scored
+        rows = rows[~seen[rows]]
+        if not len(rows):
+            return
+        seen[rows] = True
+        touched.append(rows)
+        n_scored += len(rows)
+        # 与 score_user_block 相同的运算顺序，保证得分逐位一致
+        total = (
+                w_num * _num_similarity(unit[None, :], song_unit[rows])[0] +
+                w_artist * artist_hit[artist_codes[rows]].astype(np.float64) +
+                w_type * type_hit[type_codes[rows]].astype(np.float64) +
+                w_trend * trend[rows]
+        )
+        top_rows = np.concatenate((top_rows, rows))
+        top_scores = np.concatenate((top_scores, np.round(total, 4)))
+        if len(top_scores) >= k:
+            kth = np.partition(top_scores, len(top_scores) - k)[len(top_scores) - k]
+            keep = top_scores >= kth  # 与第 k 名同分的歌曲都要保留，最后按行号决胜
+            top_rows, top_scores = top_rows[keep], top_scores[keep]
+
+    def frontier_sim(group: Dict[str, np.ndarray], lo: int, hi: int) -> float:
+        rows = group["by_angle"][[i for i in (lo, hi) if 0 <= i < len(group["by_angle"])]]
+        if not len(rows):
+            return -np.inf
+        return float(_num_similarity(unit[None, :], song_unit[rows])[0].max())
+
+    matched = [index["artist_rows"][index["artist_indptr"][a]:index["artist_indptr"][a + 1]] for a in artists.tolist()]
+    score(np.unique(np.concatenate(matched + [index["zero_norm"]]).astype(np.int64)))
+
+    # 每组的扫描位置：trend 表下标、夹角表中用户两侧的下一个位置、下一次扫描的步长
+    type_set = set(types.tolist())
+    angle_u = float(np.arctan2(unit[1], unit[0]))
+    state = []
+    for c, group in enumerate(groups):
+        pos = int(np.searchsorted(group["angles"], angle_u))
+        state.append([0, pos - 1, pos, max(k, 16)])
+
+    # 某一项对所有歌曲恒定时（权重为 0，或用户数值向量为零），对应的排序表不提供信息，不必扫描
+    scan_trend = w_trend != 0
+    scan_angle = w_num != 0 and bool(unit.any())
+    if not (scan_trend or scan_angle):
+        scan_trend = True
+    max_scan = len(trend) // 4
+
+    def upper_bound(c: int) -> float:
+        group = groups[c]
+        t, lo, hi, _ = state[c]
+        num_bound = frontier_sim(group, lo, hi)
+        if t >= len(group["by_trend"]) or num_bound == -np.inf:
+            return -np.inf  # 任一张表扫描完，组内歌曲就已全部打过分
+        return (w_type if c in type_set else 0.0) + w_num * num_bound + w_trend * trend[group["by_trend"][t]]
+
+    bounds = [upper_bound(c) for c in range(len(groups))]
+    while bounds:
+        c = int(np.argmax(bounds))
+        # 上界留出浮点误差余量；舍入单调，上界舍入后仍低于第 k 名时不可能入选或同分
+        if bounds[c] == -np.inf or np.round(bounds[c] + 1e-9, 4) < kth:
+            break
+        if n_scored >= max_scan:
+            # 剪枝效果差（如大量同分）时剩余歌曲一次性打分，最坏情况与穷举相当
+            score(np.flatnonzero(~seen))
+            break
+        group = groups[c]
+        t, lo, hi, step = state[c]
+        if scan_trend:
+            score(group["by_trend"][t:t + step])
+            t += step
+        if scan_angle:
+            # 两侧的区间互不重叠，可以合并成一批（lo 越过表头后为负数，不能当作从表尾倒数的下标）
+            score(np.concatenate((group["by_angle"][max(lo - step + 1, 0):max(lo + 1, 0)],
+                                  group["by_angle"][hi:hi + step])))
+            lo, hi = lo - step, hi + step
+        state[c] = [t, lo, hi, step * 2]
+        bounds[c] = upper_bound(c)
+
+    seen[np.concatenate(touched)] = False
+    order = np.lexsort((top_rows, -top_scores))[:k]
+    return top_rows[order], top_scores[order], n_scored
+
+
+def select_block_top_k_pruned(
+        user_features: Dict[str, Any],
+        song_features: Dict[str, Any],
+        weights: Dict[str, float],
+        k: int
+) -> Tuple[List[np.ndarray], List[np.ndarray], int]:
+    """
+    select_block_top_k 的精确剪枝版本：结果（行号、得分与同分时的顺序）与穷举打分完全相同，
+    但每个用户只对可能进入 top_k 的一小部分歌曲打分。
+
+    得分 = w_num·num_sim + w_artist·artist_sim + w_type·type_sim + w_trend·trend，
+    其中 num_sim、trend ≤ 1，而大多数歌曲的 artist / type 项为 0，见 _pruned_user_top_k。
+    权重出现负值或无法建立排序表时退回穷举打分。
+
+    Returns:
+        (每个用户入选的歌曲行号, 对应的 total_score（已保留 4 位小数）, 实际打分的 用户-歌曲 对数)
+    """
+    if "pruning_index" not in song_features:
+        song_features["pruning_index"] = build_pruning_index(song_features)
+    index = song_features["pruning_index"]
+    n_users = len(user_features["user_ids"])
+    if index is None or min(weights.values()) < 0:
+        selected, scores = select_block_top_k(user_features, song_features, weights, k)
+        return selected, scores, n_users * len(song_features["trend"])
+
+    user_unit = _normalize_rows(user_features["num"], user_features["norm"])
+    artist_incidence = user_features["artist_incidence"]
+    type_incidence = user_features["type_incidence"]
+    seen = np.zeros(len(song_features["trend"]), dtype=bool)
 
-    for user_id, profile in user_profiles.items():
-        liked_ids_set = set(str(sid) for sid in profile["liked_ids"])
-        num_vec = np.array(profile["num_vec"]).reshape(1, -1)
-        artist_set = set(profile["artists"])
-        type_set = set(profile["types"])
-
-        candidate_scores = []
-
-        for song_id, meta in song_metadata.items():
-            if song_id in liked_ids_set:
-                continue
-
-            # 数值相似度
-            song_vec = np.array([
-                meta["duration"],
-                math.log(1 + meta["comment_count"])
-            ]).reshape(1, -1)
-            num_sim = float(cosine_similarity(num_vec, song_vec)[0][0])
-
-            # 艺人 & 类型匹配
-            artist_sim = 1.0 if meta["artist"] in artist_set else 0.0
-            type_sim = 1.0 if meta["type"] in type_set else 0.0
-
-            # 趋势得分
-            trend_score = compute_trend_score(
-                current_rank=meta["current_rank"],
-                last_rank_raw=meta["last_rank"],
-                N=meta["N"]
-            )
-
-            total_score = (
-                    weights["num"] * num_sim +
-                    weights["artist"] * artist_sim +
-                    weights["type"] * type_sim +
-                    weights["trend"] * trend_score
-            )
-
-            candidate_scores.append({
-                "song_id": song_id,
-                "name": song_display.get(song_id, {}).get("name", ""),
-                "artist": song_display.get(song_id, {}).get("artist", ""),
-                "num_sim": round(num_sim, 4),
-                "artist_sim": artist_sim,
-                "type_sim": type_sim,
-                "trend_score": round(trend_score, 4),
-                "total_score": round(total_score, 4)
-            })
-
-        raw_scores[user_id] = candidate_scores
-
-    # 可选：保存到文件
-    if output_file:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(raw_scores, f, ensure_ascii=False, indent=2)
-
-    return raw_scores
\ No newline at end of file
+    selected: List[np.ndarray] = []
+    scores: List[np.ndarray] = []
+    n_scored = 0
+    for u in range(n_users):
+        rows, row_scores, n = _pruned_user_top_k(
+            user_unit[u],
+            artist_incidence.indices[artist_incidence.indptr[u]:artist_incidence.indptr[u + 1]],
+            type_incidence.indices[type_incidence.indptr[u]:type_incidence.indptr[u + 1]],
+            user_features["liked_rows"][u],
+            song_features, index, weights, k, seen
+        )
+        selected.append(rows)
+        scores.append(row_scores)
+        n_scored += n
+    return selected, scores, n_scored
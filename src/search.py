@@ -0,0 +1,134 @@
+# src/search.py
+import bisect
+import unicodedata
+import numpy as np
+from typing import Dict, List, Any, Iterable, Optional
+
+FIELDS = ("name", "artist")
+
+
+def normalize_text(text: str) -> str:
+    """统一全角 / 半角与大小写（NFKC + casefold），去掉首尾空白。"""
+    return unicodedata.normalize("NFKC", text or "").casefold().strip()
+
+
+GRAM_SIZES = (1, 2, 3)
+
+
+def _grams(text: str) -> set:
+    """
+    1~3 字 n-gram。单字用于一个字的查询（中文常见），双字用于两个字的查询，
+    更长的查询用三字 n-gram 求交集，候选更少、需要校验的误报更少。
+    """
+    return {text[i:i + n] for n in GRAM_SIZES for i in range(len(text) - n + 1)}
+
+
+def _query_grams(query: str) -> set:
+    n = min(len(query), GRAM_SIZES[-1])
+    return {query[i:i + n] for i in range(len(query) - n + 1)}
+
+
+class SongSearchIndex:
+    """
+    歌名 / 艺人搜索索引：字符 n-gram（1~3 字）倒排表 + 排序后的前缀表。
+
+    字符级切分不依赖分词，中英文标题都适用。结果分层排序，每层按需取到 limit 为止：
+      1. 歌名以查询开头（完全匹配排在最前）  2. 艺人以查询开头
+      3. 歌名包含查询  4. 艺人包含查询
+    同层内前缀匹配按字典序，包含匹配按歌曲在输入中的顺序。
+
+    Parameters:
+        songs: [{"id", "name", "artist"}, ...]（app.py 的 id_to_info 展开后的形式）
+    """
+
+    def __init__(self, songs: Iterable[Dict[str, Any]]):
+        self.songs: List[Dict[str, Any]] = []
+        texts: Dict[str, List[str]] = {field: [] for field in FIELDS}
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in FIELDS}
+
+        for doc, song in enumerate(songs):
+            self.songs.append({"id": str(song["id"]), "name": song.get("name", ""), "artist": song.get("artist", "")})
+            for field in FIELDS:
+                text = normalize_text(song.get(field, ""))
+                texts[field].append(text)
+                for gram in _grams(text):
+                    postings[field].setdefault(gram, []).append(doc)
+
+        self._texts = texts
+        # 倒排表：n-gram -> 升序的 int32 文档号数组
+        self._postings = {
+            field: {gram: np.array(docs, dtype=np.int32) for gram, docs in field_postings.items()}
+            for field, field_postings in postings.items()
+        }
+        # 前缀表：按规范化文本排序的 (text, doc)，用 bisect 定位前缀区间
+        self._sorted = {
+            field: sorted((text, doc) for doc, text in enumerate(texts[field]) if text)
+            for field in FIELDS
+        }
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def _prefix_docs(self, field: str, query: str) -> Iterable[int]:
+        entries = self._sorted[field]
+        for i in range(bisect.bisect_left(entries, (query, -1)), len(entries)):
+            text, doc = entries[i]
+            if not text.startswith(query):
+                break
+            yield doc
+
+    def _candidate_docs(self, field: str, query: str) -> np.ndarray:
+        """包含查询所有 n-gram 的文档（候选的超集，需再校验子串）。"""
+        field_postings = self._postings[field]
+        lists = []
+        for gram in _query_grams(query):
+            docs = field_postings.get(gram)
+            if docs is None:
+                return np.zeros(0, dtype=np.int32)
+            lists.append(docs)
+        lists.sort(key=len)  # 从最短的倒排表开始求交集
+        candidates = lists[0]
+        for docs in lists[1:]:
+            candidates = np.intersect1d(candidates, docs, assume_unique=True)
+            if not len(candidates):
+                break
+        return candidates
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        按歌名和艺人搜索，返回最多 limit 条 {"id", "name", "artist"}。
+        """
+        query = normalize_text(query)
+        if not query or limit <= 0:
+            return []
+
+        results: List[int] = []
+        seen = set()
+
+        def take(docs: Iterable[int], field: Optional[str] = None) -> bool:
+            # 依次加入文档；field 不为 None 时校验子串。结果够 limit 时返回 True
+            texts = self._texts[field] if field else None
+            for doc in docs:
+                if doc in seen or (texts is not None and query not in texts[doc]):
+                    continue
+                seen.add(doc)
+                results.append(doc)
+                if len(results) >= limit:
+                    return True
+            return False
+
+        # 前缀区间按字典序排列，与查询完全相同的文本天然排在区间最前面
+        for field in FIELDS:
+            if take(self._prefix_docs(field, query)):
+                return self._format(results)
+
+        for field in FIELDS:
+            candidates = self._candidate_docs(field, query)
+            # 分段转换为 Python 列表，常见字的长倒排表在结果取够后即停止
+            for offset in range(0, len(candidates), 256):
+                if take(candidates[offset:offset + 256].tolist(), field):
+                    return self._format(results)
+        return self._format(results)
+
+    def _format(self, docs: List[int]) -> List[Dict[str, Any]]:
+        return [dict(self.songs[doc]) for doc in docs]
@@ -0,0 +1,251 @@
+# src/service.py
+import json
+import time
+import socket
+import threading
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, List, Any, Union, Optional, Iterable
+
+from src.cache import RecommendationCache
+from src.catalog import load_catalog, read_manifest
+from src.recommender import recommend_for_liked
+from src.user_profiler import iter_users
+
+MAX_TOP_K = 100
+
+
+class NotFoundError(LookupError):
+    """请求的用户或歌曲不存在（HTTP 接口返回 404）。"""
+
+
+class RecommendationService:
+    """
+    常驻内存的推荐服务：特征库与用户已听列表只在启动时加载一次，
+    之后每个请求只对单个用户打分，不读写任何文件。
+
+    Parameters:
+        song_features: 已加载的歌曲特征（load_catalog）
+        users_input: （可选）用户文件路径或用户列表，用于按 user_id 推荐
+        weights / fallback_mode: 同 recommend_top_k
+        cache: （可选）RecommendationCache，相同请求直接返回缓存结果
+        catalog_dir: （可选）特征库目录；设置后每隔 reload_interval 秒检查 manifest，
+            特征库重新编译后自动重新加载（缓存随版本号一起失效）
+    """
+
+    def __init__(
+            self,
+            song_features: Dict[str, Any],
+            users_input: Optional[Union[str, Iterable[Dict]]] = None,
+            weights: Optional[Dict[str, float]] = None,
+            fallback_mode: str = "trending",
+            cache: Optional[RecommendationCache] = None,
+            catalog_dir: Optional[str] = None,
+            reload_interval: float = 1.0
+    ):
+        self.song_features = song_features
+        self.weights = weights
+        self.fallback_mode = fallback_mode
+        self.cache = cache
+        self.catalog_dir = catalog_dir
+        self.reload_interval = reload_interval
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self.user_liked: Dict[str, List[str]] = {}
+        if users_input is not None:
+            for user in iter_users(users_input):
+                uid = user.get("user_id")
+                if uid:
+                    self.user_liked[uid] = [str(sid) for sid in user.get("liked_song_ids", [])]
+
+    def _current_features(self) -> Dict[str, Any]:
+        """返回当前特征库；到了检查间隔时对比 manifest 的内容哈希，变化则重新加载。"""
+        if self.catalog_dir is None or time.monotonic() - self._checked_at < self.reload_interval:
+            return self.song_features
+        # 只让一个线程做检查，其它线程继续使用当前特征库
+        if not self._reload_lock.acquire(blocking=False):
+            return self.song_features
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                version = read_manifest(self.catalog_dir)["content_hash"]
+            except (FileNotFoundError, ValueError):
+                return self.song_features  # 正在重新编译或版本不兼容时继续使用旧特征库
+            if version != self.song_features.get("version"):
+                self.song_features = load_catalog(self.catalog_dir)
+                print(f"🔄 特征库已更新，重新加载（版本 {version[:12]}）")
+        finally:
+            self._reload_lock.release()
+        return self.song_features
+
+    def recommend(self, liked_song_ids: List[str], top_k: int = 10, user_id: str = "web_user",
+                  fallback_type: Optional[str] = None) -> Dict[str, Any]:
+        """按一组喜欢的歌曲推荐；没有可用的喜欢歌曲时可指定 fallback_type，推荐该类型的热门歌曲。"""
+        return recommend_for_liked(
+            liked_song_ids,
+            self._current_features(),
+            top_k=top_k,
+            weights=self.weights,
+            fallback_mode=self.fallback_mode,
+            user_id=user_id,
+            cache=self.cache,
+            fallback_type=fallback_type
+        )
+
+    def recommend_user(self, user_id: str, top_k: int = 10) -> Dict[str, Any]:
+        """按已知用户推荐（结果与流水线的 recommendations.json 一致）。"""
+        if user_id not in self.user_liked:
+            raise NotFoundError(f"未知用户: {user_id}")
+        return self.recommend(self.user_liked[user_id], top_k=top_k, user_id=user_id)
+
+    def similar(self, song_id: str, top_k: int = 10) -> Dict[str, Any]:
+        """与单首歌最相似的歌曲（以这首歌作为唯一的喜欢歌曲打分，结果中不含它本身）。"""
+        if song_id not in self._current_features()["song_index"]:
+            raise NotFoundError(f"未知歌曲: {song_id}")
+        result = self.recommend([song_id], top_k=top_k)
+        return {"song_id": song_id, "recommendations": result["recommendations"]}
+
+    def health(self) -> Dict[str, Any]:
+        song_features = self._current_features()
+        return {
+            "status": "ok",
+            "catalog_version": song_features.get("version"),
+            "n_songs": len(song_features["song_ids"]),
+            "n_users": len(self.user_liked),
+            "cache": self.cache.stats() if self.cache is not None else None
+        }
+
+
+def _parse_top_k(value: Any) -> int:
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"top_k 必须是整数: {value}")
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f"top_k 必须在 1 到 {MAX_TOP_K} 之间: {top_k}")
+    return top_k
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    """
+    GET  /recommend?user_id=user_001&top_k=10
+    GET  /recommend?liked=id1,id2&top_k=10&type=摇滚   （type：没有可用的喜欢歌曲时推荐该类型的热门歌曲）
+    POST /recommend  {"liked_song_ids": [...], "top_k": 10} 或 {"user_id": "...", "top_k": 10}
+    GET  /similar?song_id=...&top_k=10
+    GET  /health
+    """
+
+    protocol_version = "HTTP/1.1"  # 保持连接，避免每个请求重新建连
+    disable_nagle_algorithm = True
+    service: RecommendationService = None
+    verbose = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if "liked" in params:
+            params["liked_song_ids"] = [sid for sid in params.pop("liked").split(",") if sid]
+        self._dispatch(url.path, params)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # 无法确定请求体的边界，回应后关闭连接
+            self.close_connection = True
+            self._send(400, {"error": f"无效的 Content-Length: {self.headers.get('Content-Length')}"})
+            return
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send(400, {"error": f"请求体不是有效的 JSON: {e}"})
+            return
+        if not isinstance(params, dict):
+            self._send(400, {"error": "请求体必须是 JSON 对象"})
+            return
+        self._dispatch(urlparse(self.path).path, params)
+
+    def _dispatch(self, path: str, params: Dict[str, Any]):
+        try:
+            top_k = _parse_top_k(params.get("top_k", 10))
+            if path == "/recommend":
+                if "liked_song_ids" in params:
+                    liked = params["liked_song_ids"]
+                    if not isinstance(liked, list):
+                        raise ValueError("liked_song_ids 必须是列表")
+                    fallback_type = params.get("type") or None
+                    if fallback_type is not None and not isinstance(fallback_type, str):
+                        raise ValueError("type 必须是字符串")
+                    body = self.service.recommend(liked, top_k=top_k,
+                                                  user_id=str(params.get("user_id") or "web_user"),
+                                                  fallback_type=fallback_type)
+                elif params.get("user_id"):
+                    body = self.service.recommend_user(str(params["user_id"]), top_k=top_k)
+                else:
+                    raise ValueError("需要提供 liked_song_ids（或 liked）或 user_id")
+            elif path == "/similar":
+                if not params.get("song_id"):
+                    raise ValueError("需要提供 song_id")
+                body = self.service.similar(str(params["song_id"]), top_k=top_k)
+            elif path == "/health":
+                body = self.service.health()
+            else:
+                self._send(404, {"error": f"未知路径: {path}"})
+                return
+        except NotFoundError as e:
+            self._send(404, {"error": str(e)})
+            return
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception:
+            # 其它异常是服务自身的问题：打印堆栈，返回 500，连接不会被直接断开
+            traceback.print_exc()
+            self._send(500, {"error": "服务内部错误"})
+            return
+        self._send(200, body)
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class _ReusePortHTTPServer(ThreadingHTTPServer):
+    def server_bind(self):
+        # 多个进程绑定同一端口，由内核在进程间分发连接
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def create_server(
+        service: RecommendationService,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        verbose: bool = False,
+        reuse_port: bool = False
+) -> ThreadingHTTPServer:
+    """
+    创建多线程 HTTP 服务（每个连接一个线程）；调用 serve_forever() 开始处理请求。
+
+    reuse_port=True 时允许多个进程监听同一端口（SO_REUSEPORT），用于绕开 GIL 横向扩展。
+    """
+    handler = type("BoundRecommendationHandler", (RecommendationHandler,), {
+        "service": service,
+        "verbose": verbose
+    })
+    server_cls = _ReusePortHTTPServer if reuse_port else ThreadingHTTPServer
+    server = server_cls((host, port), handler)
+    server.daemon_threads = True
+    return server
+
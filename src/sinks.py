@@ -0,0 +1,171 @@
+# src/sinks.py
+import os
+import glob
+import gzip
+import json
+from typing import Dict, List, Any, Iterator, Optional, IO, Union
+
+
+class JsonSink:
+    """
+    兼容旧格式的输出：收集全部记录，关闭时一次性写出 indent=2 的 JSON。
+
+    mapping_fields=(key, value) 时写成 {record[key]: record[value]} 的字典
+    （raw_scores.json 的格式），否则写成记录列表（recommendations.json 的格式）。
+    """
+
+    def __init__(self, path: str, mapping_fields: Optional[tuple] = None):
+        self.path = path
+        self.paths = [path]
+        self.mapping_fields = mapping_fields
+        self.records: List[Dict[str, Any]] = []
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]):
+        self.records.append(record)
+        self.count += 1
+
+    def close(self):
+        if self.mapping_fields:
+            key, value = self.mapping_fields
+            data: Any = {record[key]: record[value] for record in self.records}
+        else:
+            data = self.records
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.records = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class NdjsonSink:
+    """
+    流式输出：每条记录一行 JSON（NDJSON），边计算边写出，不在内存中保留结果。
+
+    Parameters:
+        path: 输出路径（如 output/recommendations.ndjson）；compress=True 时自动补 .gz
+        compress: 是否 gzip 压缩
+        records_per_shard: 每个文件最多写入的记录数；设置后按
+            recommendations-00000.ndjson、recommendations-00001.ndjson ... 滚动分片
+
+    创建时会删除同一路径上次留下的输出（未分片的文件和所有分片），
+    避免切换分片设置后 iter_records 读到旧文件。
+    """
+
+    def __init__(self, path: str, compress: bool = False, records_per_shard: Optional[int] = None):
+        if compress and not path.endswith(".gz"):
+            path += ".gz"
+        self.path = path
+        self.compress = compress
+        self.records_per_shard = records_per_shard
+        self.count = 0
+        self.paths: List[str] = []
+        self._file: Optional[IO[str]] = None
+        self._shard_count = 0
+        for stale_path in existing_outputs(path):
+            os.remove(stale_path)
+
+    def _shard_path(self, index: int) -> str:
+        if not self.records_per_shard:
+            return self.path
+        base, ext = split_ndjson_ext(self.path)
+        return f"{base}-{index:05d}{ext}"
+
+    def _open_next(self):
+        if self._file is not None:
+            self._file.close()
+        path = self._shard_path(len(self.paths))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.compress:
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+        self.paths.append(path)
+        self._shard_count = 0
+
+    def write(self, record: Dict[str, Any]):
+        if self._file is None or (self.records_per_shard and self._shard_count >= self.records_per_shard):
+            self._open_next()
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self._file.write("\n")
+        self._shard_count += 1
+        self.count += 1
+
+    def close(self):
+        # 没有任何记录时也生成一个空文件，方便下游判断
+        if self._file is None:
+            self._open_next()
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def split_ndjson_ext(path: str) -> tuple:
+    """把 a/b.ndjson.gz 拆成 ('a/b', '.ndjson.gz')。"""
+    for ext in (".ndjson.gz", ".jsonl.gz", ".ndjson", ".jsonl", ".gz"):
+        if path.endswith(ext):
+            return path[:-len(ext)], ext
+    return path, ""
+
+
+def is_ndjson_path(path: str) -> bool:
+    return split_ndjson_ext(path)[1] != ""
+
+
+def open_sink(
+        path: str,
+        mapping_fields: Optional[tuple] = None,
+        compress: bool = False,
+        records_per_shard: Optional[int] = None
+):
+    """
+    按扩展名选择输出格式：.ndjson / .jsonl（可带 .gz）走 NdjsonSink，其它走 JsonSink。
+    """
+    if is_ndjson_path(path) or compress or records_per_shard:
+        return NdjsonSink(path, compress=compress or path.endswith(".gz"), records_per_shard=records_per_shard)
+    return JsonSink(path, mapping_fields=mapping_fields)
+
+
+def shard_paths(path: str) -> List[str]:
+    """path 按 NdjsonSink 分片命名规则对应的所有分片（按序号排序）。"""
+    base, ext = split_ndjson_ext(path)
+    return sorted(glob.glob(f"{glob.escape(base)}-[0-9][0-9][0-9][0-9][0-9]{ext}"))
+
+
+def existing_outputs(path: str) -> List[str]:
+    """NdjsonSink(path) 已经写出的文件：未分片的 path 本身和所有分片。"""
+    return ([path] if os.path.exists(path) else []) + shard_paths(path)
+
+
+def iter_records(path: Union[str, List[str]]) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取 NdjsonSink 的输出。
+
+    path 可以是 NdjsonSink.paths（按顺序读取列表中的文件），
+    也可以是单个路径：存在时直接读取，否则按分片命名规则依次读取所有分片。
+    """
+    if isinstance(path, list):
+        paths = path
+    elif os.path.exists(path):
+        paths = [path]
+    else:
+        paths = shard_paths(path)
+        if not paths:
+            raise FileNotFoundError(f"找不到输出文件 {path}")
+
+    for shard_path in paths:
+        opener = gzip.open if shard_path.endswith(".gz") else open
+        with opener(shard_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
@@ -1,31 +1,154 @@
 # src/user_profiler.py
+import re
 import json
 import math
 import numpy as np
-from typing import Dict, List, Any, Union, Optional
+from typing import Dict, List, Any, Union, Optional, Iterable, Iterator, Tuple
 
+from src.metrics import Metrics
+from src.sinks import is_ndjson_path, iter_records
 
-def build_user_profiles(
-        users_input: Union[str, List[Dict]],
-        all_songs_input: Union[str, List[Dict]],
-        output_file: Optional[str] = None
-) -> Dict[str, Dict]:
-    """
-    构建用户画像。
+_READ_CHUNK = 1 << 16
+_SEPARATORS = re.compile(r"[\s,]*")
+_WRAPPED_USERS = re.compile(r'\s*\{\s*"users"\s*:\s*\[')
 
-    支持两种调用方式：
-    - 文件模式：传入文件路径（用于 CLI）
-    - 内存模式：传入 Python 对象（用于 Web UI）
 
-    Parameters:
-        users_input: 用户数据（JSON 文件路径 或 用户列表）
-        all_songs_input: 歌曲数据（JSON 文件路径 或 歌曲列表）
-        output_file: （可选）输出 JSON 路径，若为 None 则不保存
+def _iter_json_array(f, buf: str, pos: int) -> Iterator[Any]:
+    """从 buf[pos:]（位于 '[' 之后）开始，逐个解析 JSON 数组元素，按需从 f 继续读取。"""
+    decoder = json.JSONDecoder()
+    eof = False
+    while True:
+        match = _SEPARATORS.match(buf, pos)
+        pos = match.end()
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("users 文件不完整：JSON 数组没有闭合")
+            chunk = f.read(_READ_CHUNK)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        if buf[pos] == "]":
+            return
 
-    Returns:
-        user_profiles: {user_id: profile} 字典
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            end = None
+        # 解析失败或元素恰好停在缓冲区末尾（可能被截断）时，先补读再重试
+        if end is None or (end == len(buf) and not eof):
+            if eof:
+                raise ValueError(f"users 文件中存在无效 JSON（位置 {pos} 附近）")
+            chunk = f.read(_READ_CHUNK)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        yield obj
+        pos = end
+        if pos > _READ_CHUNK:
+            buf, pos = buf[pos:], 0
+
+
+def iter_users(users_input: Union[str, Iterable[Dict], Dict[str, Any]]) -> Iterator[Dict]:
     """
-    # 1. 加载所有歌曲
+    逐个产出用户记录，不把整个用户文件读入内存。
+
+    支持的格式：
+    - {"users": [...]}（"users" 为第一个键时流式解析，generate_mock_users.py 的输出即如此；
+      否则退回整体读取）
+    - 直接的用户列表 [...]
+    - NDJSON：每行一个用户（.ndjson / .jsonl 扩展名，或内容按行排列的 JSON 对象）
+    - 内存中的用户列表 / {"users": [...]} dict
+    空文件视为没有用户。
+    """
+    if not isinstance(users_input, str):
+        if isinstance(users_input, dict):
+            users_input = users_input.get("users", [])
+        yield from users_input
+        return
+
+    if is_ndjson_path(users_input):
+        yield from iter_records(users_input)
+        return
+
+    with open(users_input, 'r', encoding='utf-8') as f:
+        buf = f.read(_READ_CHUNK)
+        # 保证缓冲区足够判断文件格式
+        while len(buf) < 256:
+            chunk = f.read(_READ_CHUNK)
+            if not chunk:
+                break
+            buf += chunk
+        head = buf.lstrip()
+        if not head:
+            return  # 空文件：没有用户
+        if head.startswith("["):
+            yield from _iter_json_array(f, buf, buf.index("[") + 1)
+            return
+
+        match = _WRAPPED_USERS.match(buf)
+        if match:
+            yield from _iter_json_array(f, buf, match.end())
+            return
+
+        if not head.startswith("{"):
+            raise ValueError("users_input 必须是用户列表、包含 'users' 键的字典或 NDJSON")
+
+        # NDJSON：逐行解析；第一行就不是完整 JSON 时，按普通 JSON 文档整体读取
+        first_line = True
+        for line in _iter_lines(f, buf):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if not first_line:
+                    raise
+                yield from _load_users_document(f)
+                return
+            if first_line and "users" in record and "user_id" not in record:
+                # 单行的 {"users": [...]} 文档
+                yield from record["users"]
+                return
+            first_line = False
+            yield record
+
+
+def _iter_lines(f, buf: str) -> Iterator[str]:
+    pending = ""
+    while buf:
+        lines = (pending + buf).split("\n")
+        pending = lines.pop()
+        yield from lines
+        buf = f.read(_READ_CHUNK)
+    if pending:
+        yield pending
+
+
+def _load_users_document(f) -> List[Dict]:
+    f.seek(0)
+    users_data = json.load(f)
+    if isinstance(users_data, list):
+        return users_data
+    if isinstance(users_data, dict):
+        return users_data.get("users", [])
+    raise ValueError("users_input 必须是用户列表或包含 'users' 键的字典")
+
+
+def iter_blocks(items: Iterable[Any], block_size: int) -> Iterator[List[Any]]:
+    """把任意可迭代对象切成固定大小的块。"""
+    block: List[Any] = []
+    for item in items:
+        block.append(item)
+        if len(block) >= block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def build_song_lookup(all_songs_input: Union[str, List[Dict]]) -> Dict[str, Dict]:
+    """{song_id: song}，同一首歌以最后出现的记录为准。"""
     if isinstance(all_songs_input, str):
         with open(all_songs_input, 'r', encoding='utf-8') as f:
             all_songs = json.load(f)
@@ -36,25 +159,20 @@ def build_user_profiles(
     for song in all_songs:
         song_id = str(song["id"])
         song_dict[song_id] = song
+    return song_dict
 
-    # 2. 加载用户数据
-    if isinstance(users_input, str):
-        with open(users_input, 'r', encoding='utf-8') as f:
-            users_data = json.load(f)
-
-        # 兼容两种格式：
-        if isinstance(users_data, list):
-            users_list = users_data  # 直接是用户列表
-        elif isinstance(users_data, dict):
-            users_list = users_data.get("users", [])
-        else:
-            raise ValueError("users_input 必须是用户列表或包含 'users' 键的字典")
-    else:
-        users_list = users_input
-
-    user_profiles: Dict[str, Dict] = {}
 
-    for user in users_list:
+def iter_user_profiles(
+        users: Iterable[Dict],
+        song_dict: Dict[str, Dict],
+        metrics: Optional[Metrics] = None
+) -> Iterator[Tuple[str, Dict]]:
+    """
+    逐个用户构建画像，产出 (user_id, profile)；没有 user_id 的记录静默跳过。
+    传入 metrics 时记录不在曲库中、被跳过的喜欢歌曲 ID 数（invalid_ids_skipped），
+    以及没有任何有效喜欢歌曲的冷启动用户数（cold_start_users）。
+    """
+    for user in users:
         user_id = user.get("user_id")
         liked_ids_raw = user.get("liked_song_ids", [])
 
@@ -67,9 +185,13 @@ def build_user_profiles(
         for sid in liked_ids:
             if sid in song_dict:
                 liked_songs.append(song_dict[sid])
+        if metrics is not None and len(liked_songs) < len(liked_ids):
+            metrics.count("invalid_ids_skipped", len(liked_ids) - len(liked_songs))
 
         if not liked_songs:
-            user_profiles[user_id] = {
+            if metrics is not None:
+                metrics.count("cold_start_users")
+            yield user_id, {
                 "num_vec": [0.0, 0.0],
                 "artists": [],
                 "types": [],
@@ -88,13 +210,73 @@ def build_user_profiles(
         artists = list(set(s["artist"] for s in liked_songs if s.get("artist")))
         types = list(set(s["type"] for s in liked_songs if s.get("type")))
 
-        user_profiles[user_id] = {
+        yield user_id, {
             "num_vec": [avg_duration, avg_comment_log],
             "artists": artists,
             "types": types,
             "liked_ids": liked_ids
         }
 
+
+def build_liked_profile(liked_song_ids: Iterable[Any], song_features: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    直接用歌曲特征库（load_catalog / build_song_features）为一组喜欢的歌曲构建画像，
+    不需要 all_songs 列表。规则与 iter_user_profiles 相同，结果一致。
+    """
+    liked_ids = [str(sid) for sid in liked_song_ids]
+    rows = song_features["song_index"].encode(liked_ids)
+    if not len(rows):
+        return {
+            "num_vec": [0.0, 0.0],
+            "artists": [],
+            "types": [],
+            "liked_ids": []
+        }
+
+    num = song_features["num"][rows]
+    artist_names = song_features["artist_names"]
+    type_names = song_features["type_names"]
+    artists = {artist_names[code] for code in song_features["artist_codes"][rows].tolist()}
+    types = {type_names[code] for code in song_features["type_codes"][rows].tolist()}
+
+    return {
+        "num_vec": [float(np.mean(num[:, 0])), float(np.mean(num[:, 1]))],
+        "artists": [a for a in artists if a],
+        "types": [t for t in types if t],
+        "liked_ids": liked_ids
+    }
+
+
+def build_user_profiles(
+        users_input: Union[str, List[Dict]],
+        all_songs_input: Union[str, List[Dict]],
+        output_file: Optional[str] = None,
+        metrics: Optional[Metrics] = None
+) -> Dict[str, Dict]:
+    """
+    构建用户画像。
+
+    支持两种调用方式：
+    - 文件模式：传入文件路径（用于 CLI）
+    - 内存模式：传入 Python 对象（用于 Web UI）
+
+    Parameters:
+        users_input: 用户数据（JSON 文件路径 或 用户列表）
+        all_songs_input: 歌曲数据（JSON 文件路径 或 歌曲列表）
+        output_file: （可选）输出 JSON 路径，若为 None 则不保存
+        metrics: （可选）指标收集器，记录 users / invalid_ids_skipped / cold_start_users
+
+    Returns:
+        user_profiles: {user_id: profile} 字典
+    """
+    # 1. 加载所有歌曲
+    song_dict = build_song_lookup(all_songs_input)
+
+    # 2. 逐个读取用户并构建画像（文件模式下流式读取，兼容 {"users": [...]}、列表与 NDJSON）
+    user_profiles: Dict[str, Dict] = dict(iter_user_profiles(iter_users(users_input), song_dict, metrics))
+    if metrics is not None:
+        metrics.count("users", len(user_profiles))
+
     # 3. 可选：保存到文件
     if output_file:
         with open(output_file, 'w', encoding='utf-8') as f:
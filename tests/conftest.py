@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# 与 run_pipeline.py 等入口脚本一样以仓库根目录为导入起点（from src.xxx import ...）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,58 @@
+# tests/test_parallel.py
+import random
+
+import pytest
+
+from src.parallel import ScoringPool
+from src.recommender import recommend_top_k
+from src.scorer import build_song_features
+
+
+@pytest.fixture(scope="module")
+def song_features():
+    rng = random.Random(0)
+    song_metadata = {
+        f"s{i}": {
+            "artist": f"artist_{rng.randrange(10)}",
+            "type": f"type_{rng.randrange(3)}",
+            "duration": rng.choice([180, 200, 240]),
+            "comment_count": rng.choice([0, 10, 100]),
+            "current_rank": rng.randint(1, 20),
+            "last_rank": rng.choice([0, 5, 20, "等于当前排名"]),
+            "N": 20
+        }
+        for i in range(200)
+    }
+    return build_song_features(song_metadata, {sid: {"name": sid, "artist": "-"} for sid in song_metadata})
+
+
+@pytest.fixture(scope="module")
+def profiles(song_features):
+    rng = random.Random(1)
+    result = {}
+    for u in range(50):
+        liked = rng.sample(song_features["song_ids"], rng.randint(0, 4))
+        result[f"u{u}"] = {
+            "num_vec": [rng.choice([180.0, 210.0]), rng.choice([2.3, 4.6])] if liked else [0.0, 0.0],
+            "artists": rng.sample(song_features["artist_names"], 2) if liked else [],
+            "types": rng.sample(song_features["type_names"], 1) if liked else [],
+            "liked_ids": liked
+        }
+    return result
+
+
+@pytest.mark.parametrize("prune", [False, True])
+def test_workers_match_serial(song_features, profiles, prune):
+    serial = recommend_top_k(profiles, song_features=song_features, block_size=8, prune=prune)
+    parallel = recommend_top_k(profiles, song_features=song_features, block_size=8, prune=prune, workers=2)
+    assert parallel == serial
+
+
+def test_pool_reused_across_calls(song_features, profiles):
+    # 同一个进程池服务多批用户（recommend_users_streaming 的用法），结果与串行一致
+    user_ids = list(profiles)
+    blocks = [{uid: profiles[uid] for uid in user_ids[:20]}, {uid: profiles[uid] for uid in user_ids[20:]}]
+    with ScoringPool(song_features, 2) as pool:
+        results = [recommend_top_k(block, song_features=song_features, block_size=8, pool=pool) for block in blocks]
+    serial = recommend_top_k(profiles, song_features=song_features, block_size=8)
+    assert results[0] + results[1] == serial
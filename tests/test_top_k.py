@@ -0,0 +1,119 @@
+# tests/test_top_k.py
+import random
+
+import numpy as np
+import pytest
+
+from src.scorer import (
+    DEFAULT_WEIGHTS,
+    build_pruning_index,
+    build_song_features,
+    build_user_features,
+    select_block_top_k,
+    select_block_top_k_pruned,
+    select_top_k,
+)
+
+
+def _random_catalog(rng: random.Random, n_songs: int, n_artists: int, n_types: int):
+    # 数值特征、排名都只取少数几个值，制造大量同分
+    song_metadata = {}
+    for i in range(n_songs):
+        song_metadata[f"s{i}"] = {
+            "artist": f"artist_{rng.randrange(n_artists)}",
+            "type": f"type_{rng.randrange(n_types)}",
+            "duration": rng.choice([0, 180, 200, 240]),
+            "comment_count": rng.choice([0, 10, 100]),
+            "current_rank": rng.randint(1, 20),
+            "last_rank": rng.choice([0, 1, 5, 10, 20, "等于当前排名"]),
+            "N": 20
+        }
+    return build_song_features(song_metadata)
+
+
+def _random_users(rng: random.Random, song_features, n_users: int):
+    song_ids = song_features["song_ids"]
+    artists = song_features["artist_names"]
+    types = song_features["type_names"]
+    profiles = {}
+    for u in range(n_users):
+        if u % 7 == 0:
+            # 没有可用喜欢歌曲的用户：零向量、没有偏好
+            profiles[f"u{u}"] = {"num_vec": [0.0, 0.0], "artists": [], "types": [], "liked_ids": []}
+            continue
+        profiles[f"u{u}"] = {
+            "num_vec": [rng.choice([0.0, 180.0, 210.0]), rng.choice([0.0, 2.3, 4.6])],
+            "artists": rng.sample(artists, rng.randint(0, min(3, len(artists)))),
+            "types": rng.sample(types, rng.randint(0, min(2, len(types)))),
+            "liked_ids": rng.sample(song_ids, rng.randint(0, min(5, len(song_ids))))
+        }
+    return build_user_features(list(profiles), profiles, song_features)
+
+
+WEIGHT_CASES = [
+    DEFAULT_WEIGHTS,
+    {"num": 1.0, "artist": 1.0, "type": 1.0, "trend": 0.0},
+    {"num": 0.0, "artist": 2.0, "type": 0.5, "trend": 1.0},
+    {"num": 0.0, "artist": 0.0, "type": 0.0, "trend": 0.0},
+]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("weights", WEIGHT_CASES)
+@pytest.mark.parametrize("k", [1, 10, 500])
+def test_pruned_matches_exhaustive(seed, weights, k):
+    rng = random.Random(seed)
+    song_features = _random_catalog(rng, n_songs=300, n_artists=12, n_types=4)
+    user_features = _random_users(rng, song_features, n_users=40)
+
+    expected_rows, expected_scores = select_block_top_k(user_features, song_features, weights, k)
+    rows, scores, n_scored = select_block_top_k_pruned(user_features, song_features, weights, k)
+
+    for u in range(len(user_features["user_ids"])):
+        np.testing.assert_array_equal(rows[u], expected_rows[u])
+        np.testing.assert_array_equal(scores[u], expected_scores[u])
+    assert n_scored <= len(user_features["user_ids"]) * len(song_features["song_ids"])
+
+
+def test_pruned_falls_back_without_pruning_index():
+    rng = random.Random(0)
+    song_features = _random_catalog(rng, n_songs=100, n_artists=5, n_types=3)
+    song_features["num"] = song_features["num"] - 1.0  # 出现负值时无法建立夹角排序表
+    assert build_pruning_index(song_features) is None
+
+    user_features = _random_users(rng, song_features, n_users=10)
+    expected_rows, expected_scores = select_block_top_k(user_features, song_features, DEFAULT_WEIGHTS, 10)
+    rows, scores, n_scored = select_block_top_k_pruned(user_features, song_features, DEFAULT_WEIGHTS, 10)
+
+    for u in range(10):
+        np.testing.assert_array_equal(rows[u], expected_rows[u])
+        np.testing.assert_array_equal(scores[u], expected_scores[u])
+    assert n_scored == 10 * 100
+
+
+def test_pruning_index_groups_cover_catalog():
+    rng = random.Random(1)
+    song_features = _random_catalog(rng, n_songs=200, n_artists=8, n_types=5)
+    index = build_pruning_index(song_features)
+    assert index is not None
+
+    by_trend = np.concatenate([group["by_trend"] for group in index["groups"]])
+    np.testing.assert_array_equal(np.sort(by_trend), np.arange(200))
+    for c, group in enumerate(index["groups"]):
+        assert (song_features["type_codes"][group["by_trend"]] == c).all()
+        assert (np.diff(song_features["trend"][group["by_trend"]]) <= 0).all()
+        assert (np.diff(group["angles"]) >= 0).all()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_select_top_k_matches_stable_sort(seed):
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 4, size=(20, 50)).astype(np.float64)
+    scores[rng.random(scores.shape) < 0.2] = -np.inf
+
+    for k in (1, 5, 50, 80):
+        selected = select_top_k(scores, k)
+        for u, row in enumerate(scores):
+            # 得分降序、同分按列号升序，-inf 不入选
+            expected = [i for i in sorted(range(len(row)), key=lambda i: -row[i]) if row[i] > -np.inf][:k]
+            assert selected[u].tolist() == expected
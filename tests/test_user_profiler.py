@@ -0,0 +1,88 @@
+# tests/test_user_profiler.py
+import json
+
+import pytest
+
+from src.user_profiler import iter_blocks, iter_users
+
+USERS = [
+    {"user_id": f"user_{i:04d}", "liked_song_ids": [str(100 + i), str(200 + i), f"invalid_{i}"]}
+    for i in range(3000)  # 文件远大于一次读取的 64KB，覆盖跨缓冲区的解析
+]
+
+
+def _write(tmp_path, name: str, text: str) -> str:
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_wrapped_document(tmp_path):
+    # generate_mock_users.py 的输出格式
+    path = _write(tmp_path, "users.json", json.dumps({"users": USERS}, ensure_ascii=False, indent=2))
+    assert list(iter_users(path)) == USERS
+
+
+def test_wrapped_document_users_not_first_key(tmp_path):
+    path = _write(tmp_path, "users.json", json.dumps({"meta": {"n": len(USERS)}, "users": USERS}, indent=2))
+    assert list(iter_users(path)) == USERS
+
+
+def test_plain_list(tmp_path):
+    path = _write(tmp_path, "users.json", json.dumps(USERS, indent=2))
+    assert list(iter_users(path)) == USERS
+
+
+@pytest.mark.parametrize("name", ["users.ndjson", "users.jsonl", "users.json"])
+def test_ndjson(tmp_path, name):
+    # .json 扩展名但内容按行排列时按内容识别为 NDJSON；空行被忽略
+    lines = [json.dumps(user) for user in USERS]
+    lines.insert(10, "")
+    path = _write(tmp_path, name, "\n".join(lines) + "\n")
+    assert list(iter_users(path)) == USERS
+
+
+@pytest.mark.parametrize("document", [
+    {"users": USERS[:5]},
+    {"meta": 1, "users": USERS[:5]},
+    USERS[:5],
+])
+def test_single_line_document(tmp_path, document):
+    path = _write(tmp_path, "users.json", json.dumps(document))
+    assert list(iter_users(path)) == USERS[:5]
+
+
+@pytest.mark.parametrize("text", ["", "  \n", "[]", "[\n]", '{"users": []}', '{"users": [\n]}'])
+def test_empty_file(tmp_path, text):
+    assert list(iter_users(_write(tmp_path, "users.json", text))) == []
+
+
+def test_empty_ndjson(tmp_path):
+    assert list(iter_users(_write(tmp_path, "users.ndjson", ""))) == []
+
+
+def test_in_memory_inputs():
+    assert list(iter_users(USERS[:3])) == USERS[:3]
+    assert list(iter_users({"users": USERS[:3]})) == USERS[:3]
+    assert list(iter_users(iter(USERS[:3]))) == USERS[:3]
+    assert list(iter_users([])) == []
+    assert list(iter_users({})) == []
+
+
+def test_truncated_array_raises(tmp_path):
+    text = json.dumps(USERS[:5], indent=2)
+    path = _write(tmp_path, "users.json", text[:-10])
+    with pytest.raises(ValueError):
+        list(iter_users(path))
+
+
+def test_unknown_format_raises(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_users(_write(tmp_path, "users.json", "user_0001,user_0002")))
+
+
+def test_iter_blocks():
+    blocks = list(iter_blocks(iter_users(USERS[:25]), 10))
+    assert [len(block) for block in blocks] == [10, 10, 5]
+    assert [user for block in blocks for user in block] == USERS[:25]
+    assert list(iter_blocks([], 10)) == []